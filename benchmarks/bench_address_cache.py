@@ -0,0 +1,69 @@
+"""
+Address cache benchmark: server-side address validations and label latency for repeat destinations
+
+Sends the same label stream to the stub server twice: without an AddressCache (every label asks
+for needValidateAddress) and with one (addresses verified earlier skip validation).
+
+Usage:
+    python benchmarks/bench_address_cache.py [--labels 2000] [--addresses 100] [--verify-latency 0.005]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.stub_server import start_stub_server
+from modules.bulk_labels import merge_order
+from yidida_cache import AddressCache
+from yidida_client import YiDiDaClient, bounded_map, iter_chunks
+from yidida_templates import CompiledTemplate
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STREETS = ("Main St", "Oak Ave", "Inip Dr", "Harbor Blvd", "Commerce Way", "Elm St")
+
+
+def run(client: YiDiDaClient, state, labels, batch_size: int, workers: int):
+    before = state.verifications
+    started = time.perf_counter()
+    list(bounded_map(client.create_labels, iter_chunks(labels, batch_size), workers))
+    return state.verifications - before, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Address verification cache benchmark")
+    parser.add_argument("--labels", type=int, default=2000)
+    parser.add_argument("--addresses", type=int, default=100, help="Distinct recipient addresses")
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--verify-latency", type=float, default=0.005, help="Stub delay per validated label")
+    args = parser.parse_args()
+
+    random.seed(7)
+    server, base_url = start_stub_server(verify_latency=args.verify_latency)
+    state = server.RequestHandlerClass.state
+    client = YiDiDaClient(base_url, "bench", "bench", pool_maxsize=args.workers)
+    client.login()
+
+    base_label = CompiledTemplate.from_file(os.path.join(ROOT, "templates", "label_template.json")).render(
+        {"defaults": {"keHuDanHao": "BENCH", "shouHuoQuDao": "BENCH"}})[0]
+    addresses = [{"shouJianRenDiZhi1": f"{100 + i} {random.choice(STREETS)}", "shouJianRenYouBian": "11096"}
+                 for i in range(args.addresses)]
+    labels = [merge_order(base_label, dict(random.choice(addresses), keHuDanHao=f"BENCH{i:07d}"))
+              for i in range(args.labels)]
+
+    print(f"{args.labels:,} labels to {args.addresses} addresses, {args.verify_latency * 1000:.0f} ms per validation")
+    print(f"  {'mode':<10} {'validations':>11} {'wall s':>8}")
+    validations, wall = run(client, state, labels, args.batch_size, args.workers)
+    print(f"  {'no cache':<10} {validations:11,d} {wall:8.2f}")
+    client.address_cache = AddressCache()
+    validations, wall = run(client, state, labels, args.batch_size, args.workers)
+    print(f"  {'cache':<10} {validations:11,d} {wall:8.2f}")
+    print(f"  {client.address_cache.stats()}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Coalescing benchmark: upstream requests for concurrent single-order tracking and duplicate price lookups
+
+Runs the same workload against the stub server twice and counts the requests it receives:
+
+    direct     every caller sends its own request (client.query_shipment / an uncoalesced /price call)
+    coalesced  tracking through TrackingBatcher, prices through query_price (single-flight)
+
+Usage:
+    python benchmarks/bench_coalesce.py [--lookups 1000] [--callers 50] [--latency 0.05]
+    python benchmarks/bench_coalesce.py --window-ms 10 --distinct-quotes 20
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.stub_server import start_stub_server
+from yidida_client import YiDiDaClient
+from yidida_coalesce import TrackingBatcher
+
+
+def run(state, callers: int, calls: List, fn: Callable) -> Dict:
+    """Run fn over calls from `callers` threads; report upstream requests and caller latency"""
+    latencies = []
+
+    def timed(item):
+        started = time.perf_counter()
+        fn(item)
+        latencies.append(time.perf_counter() - started)
+
+    before = state.requests
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=callers) as executor:
+        list(executor.map(timed, calls))
+    wall = time.perf_counter() - started
+    latencies.sort()
+    return {"requests": state.requests - before, "wall_s": wall, "p50_ms": statistics.median(latencies) * 1000,
+            "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000}
+
+
+def report(name: str, direct: Dict, coalesced: Dict):
+    print(f"\n{name}")
+    print(f"  {'mode':<10} {'requests':>9} {'wall s':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    for mode, row in (("direct", direct), ("coalesced", coalesced)):
+        print(f"  {mode:<10} {row['requests']:9d} {row['wall_s']:8.2f} {row['p50_ms']:8.1f} {row['p95_ms']:8.1f}")
+    print(f"  upstream requests cut {direct['requests'] / max(1, coalesced['requests']):.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Request coalescing benchmark")
+    parser.add_argument("--lookups", type=int, default=1000, help="Calls per scenario")
+    parser.add_argument("--callers", type=int, default=50, help="Concurrent calling threads")
+    parser.add_argument("--latency", type=float, default=0.05, help="Stub server delay per request (seconds)")
+    parser.add_argument("--window-ms", type=float, default=20, help="Tracking batch window")
+    parser.add_argument("--distinct-quotes", type=int, default=10, help="Distinct price queries among the calls")
+    args = parser.parse_args()
+
+    random.seed(7)
+    server, base_url = start_stub_server(latency=args.latency)
+    state = server.RequestHandlerClass.state
+    client = YiDiDaClient(base_url, "bench", "bench", pool_maxsize=args.callers)
+    client.login()
+
+    orders = [f"BENCH{i:06d}" for i in range(args.lookups)]
+    for order_no in orders:
+        state.create_waybill({"keHuDanHao": order_no})
+    direct = run(state, args.callers, orders, client.query_shipment)
+    batcher = TrackingBatcher(client, window=args.window_ms / 1000, workers=args.callers)
+    coalesced = run(state, args.callers, orders, batcher.lookup)
+    batcher.close()
+    report(f"Tracking: {args.lookups} single-order lookups, {args.callers} callers", direct, coalesced)
+    print(f"  {batcher.stats()['orders_per_request']:.1f} orders per request")
+
+    quotes = [{"searchType": 3, "wayTypeList": [0], "weight": 1 + i % args.distinct_quotes}
+              for i in range(args.lookups)]
+    random.shuffle(quotes)
+    direct = run(state, args.callers, quotes, client._fetch_price)
+    coalesced = run(state, args.callers, quotes, client.query_price)
+    report(f"Price: {args.lookups} queries over {args.distinct_quotes} distinct parameter sets "
+           f"(no quote cache)", direct, coalesced)
+    print(f"  single-flight: {client.price_flight.stats()}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Memory and parse-time benchmark: response dicts vs the compact result models (yidida_models.py)
+
+Builds realistic /yundans/, /price and /queryYunDanDetail bodies with the stub server's
+generators, then keeps N results alive three ways and reports the retained memory:
+
+    dict       json.loads(body) kept per response (what callers of create_labels hold today)
+    model      parse_*(body): __slots__ models only
+    model+raw  parse_*(body, keep_raw=True): models plus the response bytes for lazy `raw`
+
+Usage:
+    python benchmarks/bench_models.py [--results 100000] [--per-response 10]
+    python benchmarks/bench_models.py --kinds tracking --json output/bench_models.json
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from yidida_models import parse_label_results, parse_price_quotes, parse_tracking_records
+from benchmarks.stub_server import StubState, price_quotes
+
+KINDS = ("labels", "price", "tracking")
+PARSERS = {"labels": parse_label_results, "price": parse_price_quotes, "tracking": parse_tracking_records}
+CITIES = ("Los Angeles", "New York", "Chicago", "Houston", "Miami", "Seattle")
+POSTCODES = ("90001", "10001", "60601", "77001", "33101", "98101")
+
+
+def build_bodies(kind: str, results: int, per_response: int) -> List[bytes]:
+    """Response bodies holding `results` entries in total"""
+    state = StubState(status_step=3600)
+    bodies = []
+    for start in range(0, results, per_response):
+        count = min(per_response, results - start)
+        if kind == "labels":
+            data = [state.create_waybill({"keHuDanHao": f"BENCH{start + i:08d}",
+                                          "shouJianRenChengShi": random.choice(CITIES)}, "127.0.0.1:8089")
+                    for i in range(count)]
+        elif kind == "price":
+            data = price_quotes({"weight": random.uniform(0.5, 30), "wayTypeList": list(range(count)),
+                                 "toCustomer": {"postcode": random.choice(POSTCODES)}})
+        else:
+            data = []
+            for i in range(count):
+                order_no = f"BENCH{start + i:08d}"
+                state.create_waybill({"keHuDanHao": order_no, "shouJianRenChengShi": random.choice(CITIES)})
+                # Spread shipments over every tracking state
+                state.shipments[order_no]["created"] -= random.randint(0, 5) * state.status_step
+                data.append(state.tracking_record(order_no))
+        bodies.append(json.dumps({"data": data, "domain": "", "statusCode": 200, "success": True},
+                                 ensure_ascii=False).encode('utf-8'))
+    return bodies
+
+
+def measure(bodies: List[bytes], keep: Callable[[bytes], object], results: int) -> Dict:
+    """Retained memory and parse time for keeping every response through `keep`"""
+    # Timed without tracemalloc, which slows every allocation down
+    gc.collect()
+    started = time.perf_counter()
+    kept = [keep(body) for body in bodies]
+    elapsed = time.perf_counter() - started
+    del kept
+
+    gc.collect()
+    tracemalloc.start()
+    # Copying inside the traced region stands in for the bytes read from the socket
+    kept = [keep(bytes(bytearray(body))) for body in bodies]
+    gc.collect()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+    return {"mb": retained / (1024 * 1024), "bytes_per_result": retained / results,
+            "us_per_result": elapsed / results * 1e6}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Response dict vs compact model memory benchmark")
+    parser.add_argument("--results", type=int, default=100_000, help="Results kept alive per kind")
+    parser.add_argument("--per-response", type=int, default=10, help="Entries per response body")
+    parser.add_argument("--kinds", nargs="+", choices=KINDS, default=list(KINDS))
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    random.seed(7)
+    rows = []
+    print(f"{args.results:,} results per kind, {args.per_response} per response")
+    print(f"  {'kind':<9} {'mode':<10} {'MB':>8} {'B/result':>9} {'µs/result':>10} {'vs dict':>8}")
+    for kind in args.kinds:
+        bodies = build_bodies(kind, args.results, args.per_response)
+        parse = PARSERS[kind]
+        modes = (("dict", json.loads), ("model", parse), ("model+raw", lambda body: parse(body, keep_raw=True)))
+        baseline = None
+        for mode, keep in modes:
+            row = dict(kind=kind, mode=mode, **measure(bodies, keep, args.results))
+            baseline = baseline or row["mb"]
+            row["reduction"] = 1 - row["mb"] / baseline
+            rows.append(row)
+            print(f"  {kind:<9} {mode:<10} {row['mb']:8.1f} {row['bytes_per_result']:9.0f} "
+                  f"{row['us_per_result']:10.1f} {row['reduction']:7.0%}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, indent=2)
+        print(f"\nResults saved to: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Pre-flight validation benchmark: screen N rendered label requests with modules/label_validator.py
+
+Rows are merged onto templates/label_template.json like bulk mode does, with a share of
+them broken (missing/invalid ZIP, state mismatch, zero weight, bad dimensions).
+
+Usage:
+    python benchmarks/bench_preflight.py [--rows 50000] [--invalid-share 0.1]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.bulk_labels import merge_order
+from modules.label_validator import validate_labels
+from yidida_templates import CompiledTemplate
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+VALID = ({"shouJianRenYouBian": "11096", "zhouMing": "NY"}, {"shouJianRenYouBian": "90001", "zhouMing": "CA"},
+         {"shouJianRenYouBian": "60601-1234", "zhouMing": "IL"}, {"shouJianRenYouBian": "77001", "zhouMing": "TX"})
+BROKEN = ({"shouJianRenYouBian": ""}, {"shouJianRenYouBian": "1109"}, {"zhouMing": "CA"},
+          {"danJianList.0.shiZhong": 0}, {"danJianList.1.kuan": 0}, {"danJianList.0.chang": 400})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Label pre-flight validation benchmark")
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--invalid-share", type=float, default=0.1, help="Share of rows with an error")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    random.seed(7)
+    base_label = CompiledTemplate.from_file(os.path.join(ROOT, "templates", "label_template.json")).render(
+        {"defaults": {"keHuDanHao": "BENCH", "shouHuoQuDao": "BENCH"}})[0]
+    labels = [
+        merge_order(base_label, dict(random.choice(BROKEN if random.random() < args.invalid_share else VALID),
+                                     keHuDanHao=f"BENCH{i:08d}"))
+        for i in range(args.rows)
+    ]
+
+    timings = []
+    for _ in range(args.runs):
+        started = time.perf_counter()
+        report = validate_labels(labels)
+        timings.append(time.perf_counter() - started)
+
+    best = min(timings)
+    print(f"{args.rows:,} labels, {report['invalid']:,} invalid: best {best * 1000:.0f} ms of {args.runs} "
+          f"({args.rows / best:,.0f} labels/s), total charge weight {report['charge_weight'].sum():,.0f} kg")
+
+
+if __name__ == "__main__":
+    main()
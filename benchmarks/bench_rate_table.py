@@ -0,0 +1,66 @@
+"""
+Rate table benchmark: local lookups from a memory-mapped table of every US ZIP3 zone
+
+Writes a synthetic table (no /price calls) with modules/rate_table.write_rate_table, then
+times opening it and answering quotes in "ceil" and "linear" mode.
+
+Usage:
+    python benchmarks/bench_rate_table.py [--lookups 200000] [--channels 4] [--max-weight 70]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from array import array
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.rate_matrix import weight_steps
+from modules.rate_table import RateTable, write_rate_table
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rate table lookup benchmark")
+    parser.add_argument("--lookups", type=int, default=200_000)
+    parser.add_argument("--channels", type=int, default=4)
+    parser.add_argument("--package-types", type=int, default=2)
+    parser.add_argument("--max-weight", type=float, default=70)
+    args = parser.parse_args()
+
+    random.seed(7)
+    zip3s = [f"{i:03d}" for i in range(5, 1000)]
+    zones = [{"key": f'["US","{zip3}"]', "destination": {"countryCode": "US", "postcode": f"{zip3}01"}}
+             for zip3 in zip3s]
+    weights = weight_steps(0.5, args.max_weight, 0.5)
+    channels = list(range(args.channels))
+    package_types = list(range(1, args.package_types + 1))
+    prices = array('f', (5 + z % 8 + w * (1.1 + z % 8 * 0.15) + c
+                         for _ in package_types for z in range(len(zones)) for c in channels for w in weights))
+
+    path = os.path.join(tempfile.mkdtemp(), "bench.ydrt")
+    size = write_rate_table(path, prices, zones, channels, package_types, weights,
+                            {"built_at": time.time(), "max_age": 86400, "zone_key": "us_zip3",
+                             "base_params": {"toCustomer": {"countryCode": "US"}}})
+    started = time.perf_counter()
+    table = RateTable.open(path)
+    opened = time.perf_counter() - started
+    print(f"{len(prices):,} cells ({len(zones)} zones x {len(channels)} channels x {len(weights)} weights x "
+          f"{len(package_types)} package types), {size / 1e6:.1f} MB, opened in {opened * 1000:.1f} ms")
+
+    queries = [(f"{random.choice(zip3s)}{random.randrange(100):02d}", random.choice(channels),
+                round(random.uniform(0.1, args.max_weight), 2)) for _ in range(10_000)]
+    queries = (queries * (args.lookups // len(queries) + 1))[:args.lookups]
+    for mode in ("ceil", "linear"):
+        started = time.perf_counter()
+        for postcode, channel, weight in queries:
+            table.price(postcode, channel, weight, mode=mode)
+        elapsed = time.perf_counter() - started
+        print(f"  {mode:<7} {args.lookups:,} lookups in {elapsed:.2f}s: {elapsed / args.lookups * 1e6:.2f} µs each")
+    table.close()
+    os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
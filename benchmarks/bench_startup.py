@@ -0,0 +1,126 @@
+"""
+Startup benchmark and regression guard for the CLI entry points
+
+Runs each command under `python -X importtime`, reports wall time and the slowest
+imports, and fails (exit code 1) when a fast path pulls in a heavy module again or
+exceeds its import budget. The heavy modules must stay deferred until an endpoint is used.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 5] [--top 10]
+    python benchmarks/bench_startup.py --max-import-ms 80 --json output/startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Set, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Imports that only an endpoint call may trigger
+HEAVY_MODULES = ("requests", "urllib3", "aiohttp", "sqlite3", "yidida_client", "yidida_pool", "yidida_store",
+                 "yidida_journal", "yidida_queue", "modules.label_creator", "modules.bulk_labels",
+                 "modules.batch_executor", "modules.price_query", "modules.shipment_tracker",
+                 "modules.tracking_poller", "modules.batch_cli", "modules.queue_worker", "modules.gateway")
+
+# (name, arguments after `python -X importtime`, guarded)
+SCENARIOS = (
+    ("main --help", ["main.py", "--help"], True),
+    ("main track --help", ["main.py", "track", "--help"], True),
+    ("all modules loaded", ["-c", "import modules; [getattr(modules, name) for name in modules.__all__]"], False),
+)
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int, int]]:
+    """
+    Parse `-X importtime` output
+
+    Returns:
+        (module, self µs, cumulative µs, nesting depth) per imported module
+    """
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        imports.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return imports
+
+
+def interpreter_imports() -> Set[str]:
+    """Modules a bare interpreter already imports at startup (site, encodings, ...), excluded from budgets"""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "pass"], cwd=ROOT, capture_output=True, text=True)
+    return {name for name, _, _, _ in parse_importtime(proc.stderr)}
+
+
+def measure(args: List[str], runs: int, baseline: Set[str]) -> Dict:
+    """Run one command `runs` times; keep the median wall time and the import profile of the fastest run"""
+    walls = []
+    best = None
+    for _ in range(runs):
+        started = time.perf_counter()
+        proc = subprocess.run([sys.executable, "-X", "importtime"] + args, cwd=ROOT, capture_output=True, text=True)
+        wall = time.perf_counter() - started
+        walls.append(wall)
+        if best is None or wall < best[0]:
+            best = (wall, parse_importtime(proc.stderr), proc.returncode)
+
+    # Top-level imports made by the command itself
+    own = [(name, cumulative) for name, _, cumulative, depth in best[1] if depth == 0 and name not in baseline]
+    return {
+        "wall_ms": statistics.median(walls) * 1000,
+        "import_ms": sum(cumulative for _, cumulative in own) / 1000,
+        "returncode": best[2],
+        "modules": {name: cumulative / 1000 for name, _, cumulative, _ in best[1]},
+        "top_level": sorted(((name, cumulative / 1000) for name, cumulative in own), key=lambda item: -item[1]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CLI startup benchmark (python -X importtime)")
+    parser.add_argument("--runs", type=int, default=5, help="Runs per command (median wall time is reported)")
+    parser.add_argument("--top", type=int, default=8, help="Slowest top-level imports to list per command")
+    parser.add_argument("--max-import-ms", type=float, default=50.0,
+                        help="Budget for the imports a guarded command triggers itself (default: 50)")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    baseline = interpreter_imports()
+    failures = []
+    results = {}
+    for name, command, guarded in SCENARIOS:
+        row = measure(command, args.runs, baseline)
+        results[name] = row
+        print(f"\n{name}: wall {row['wall_ms']:.0f} ms (median of {args.runs}), app imports {row['import_ms']:.0f} ms")
+        for module, cumulative_ms in row["top_level"][:args.top]:
+            print(f"  {cumulative_ms:8.1f} ms  {module}")
+
+        if row["returncode"] != 0:
+            failures.append(f"{name}: exited with {row['returncode']}")
+        if not guarded:
+            continue
+        heavy = [module for module in HEAVY_MODULES if module in row["modules"]]
+        if heavy:
+            failures.append(f"{name}: imports {', '.join(heavy)} at startup")
+        if row["import_ms"] > args.max_import_ms:
+            failures.append(f"{name}: imports took {row['import_ms']:.0f} ms (budget {args.max_import_ms:.0f} ms)")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"\nResults saved to: {args.json}")
+
+    if failures:
+        print("\n✗ Startup regression:")
+        for failure in failures:
+            print(f"  - {failure}")
+        sys.exit(1)
+    print("\n✓ Startup within budget")
+
+
+if __name__ == "__main__":
+    main()
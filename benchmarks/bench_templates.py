@@ -0,0 +1,88 @@
+"""
+Benchmark: compiled template rendering vs. regex substitution over the raw JSON text
+
+Usage:
+    python benchmarks/bench_templates.py [--renders 20000]
+"""
+import argparse
+import copy
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from yidida_templates import CompiledTemplate
+from modules.bulk_labels import merge_order
+
+TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "templates", "label_template.json")
+
+
+def regex_render(template_str: str, config: dict):
+    """The previous approach: build a regex, substitute over the whole text, then parse it"""
+    pattern = r'"{{([^}]+)}}"'
+
+    def replace_var(match):
+        value = config
+        try:
+            for key in match.group(1).strip().split('.'):
+                value = value[key]
+            return json.dumps(value, ensure_ascii=False)
+        except (KeyError, TypeError):
+            return match.group(0)
+
+    return json.loads(re.sub(pattern, replace_var, template_str))
+
+
+def measure(label: str, fn, renders: int) -> float:
+    start = time.perf_counter()
+    for i in range(renders):
+        fn(i)
+    elapsed = time.perf_counter() - start
+    rate = renders / elapsed
+    print(f"  {label:<44} {rate:>12,.0f} renders/s  ({elapsed * 1e6 / renders:7.1f} µs each)")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Template rendering benchmark")
+    parser.add_argument("--renders", type=int, default=20000, help="Renders per measurement")
+    args = parser.parse_args()
+
+    with open(TEMPLATE_PATH, 'r', encoding='utf-8') as f:
+        template_str = f.read()
+    compiled = CompiledTemplate.from_string(template_str)
+
+    def context(i):
+        return {"defaults": {"keHuDanHao": f"ORDER{i:08d}", "shouHuoQuDao": "FedEx Ground"}}
+
+    print(f"Template: {TEMPLATE_PATH} ({len(template_str.splitlines())} lines, "
+          f"{len(compiled.placeholders)} placeholder(s))")
+    print(f"Renders per measurement: {args.renders:,}\n")
+
+    print("Per-order render of the label template:")
+    baseline = measure("regex substitution + json.loads", lambda i: regex_render(template_str, context(i)), args.renders)
+    fast = measure("CompiledTemplate.render", lambda i: compiled.render(context(i)), args.renders)
+    print(f"  speed-up: {fast / baseline:.1f}x\n")
+
+    base_label = compiled.render(context(0))[0]
+
+    def row(i):
+        return {"keHuDanHao": f"ORDER{i:08d}", "shouJianRenYouBian": "11096", "danJianList.0.shiZhong": "12.5"}
+
+    def deepcopy_merge(i):
+        label = copy.deepcopy(base_label)
+        label.update(keHuDanHao=f"ORDER{i:08d}", shouJianRenYouBian="11096")
+        label["danJianList"][0]["shiZhong"] = 12.5
+        return label
+
+    print("Per-order merge of a bulk row onto the rendered label:")
+    baseline = measure("copy.deepcopy + assign", deepcopy_merge, args.renders)
+    fast = measure("merge_order (copy-on-write)", lambda i: merge_order(base_label, row(i)), args.renders)
+    print(f"  speed-up: {fast / baseline:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
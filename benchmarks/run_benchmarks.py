@@ -0,0 +1,213 @@
+"""
+Load benchmark for the label, price and tracking paths against the offline stub server
+
+Starts benchmarks/stub_server.py in-process (or targets --base-url) and, for every
+concurrency level, reports requests/s, client-side latency percentiles and memory.
+
+Usage:
+    python benchmarks/run_benchmarks.py [--requests 500] [--concurrency 1 4 16 64] [--latency 0.02]
+    python benchmarks/run_benchmarks.py --client async --concurrency 16 64 256
+    python benchmarks/run_benchmarks.py --scenarios price --throttle-rps 100 --json output/bench.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from yidida_client import YiDiDaClient, bounded_map
+from yidida_metrics import ClientMetrics
+from yidida_templates import CompiledTemplate
+from benchmarks.stub_server import start_stub_server
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = ("labels", "price", "track")
+ENDPOINTS = {"labels": YiDiDaClient.LABELS_ENDPOINT, "price": YiDiDaClient.PRICE_ENDPOINT,
+             "track": YiDiDaClient.SHIPMENT_ENDPOINT}
+POSTCODES = ("90001", "10001", "60601", "77001", "33101", "98101", "11096", "02108")
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_mb() -> float:
+    """Process high-water RSS in MB (0 where unavailable)"""
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class Workload:
+    """Payload factories for each scenario"""
+
+    def __init__(self, label_batch: int):
+        self.label_batch = label_batch
+        self.label = CompiledTemplate.from_file(os.path.join(ROOT, "templates", "label_template.json"))
+        self.price = CompiledTemplate.from_file(os.path.join(ROOT, "templates", "price_template.json"))
+        self.order_numbers: List[str] = []
+
+    def labels(self, i: int) -> List[Dict]:
+        return [
+            self.label.render({"defaults": {"keHuDanHao": f"BENCH{i:07d}{j:03d}", "shouHuoQuDao": "FedEx Ground"}})[0]
+            for j in range(self.label_batch)
+        ]
+
+    def price_params(self, i: int) -> Dict:
+        return self.price.render({"defaults": {
+            "weight": 0.5 + (i % 140) * 0.5, "countryCode": "US", "postcode": POSTCODES[i % len(POSTCODES)],
+            "city": "", "stateCode": "",
+        }})
+
+    def tracking_batch(self, i: int) -> str:
+        start = (i * 10) % max(1, len(self.order_numbers) - 9)
+        return ",".join(self.order_numbers[start:start + 10])
+
+
+def make_call(client, scenario: str, workload: Workload) -> Callable:
+    if scenario == "labels":
+        return lambda i: client.create_labels(workload.labels(i))
+    if scenario == "price":
+        return lambda i: client.query_price(workload.price_params(i))
+    return lambda i: client.query_shipment(workload.tracking_batch(i))
+
+
+def seed_orders(base_url: str, workload: Workload, count: int = 200):
+    """Create stub shipments for the tracking scenario"""
+    client = YiDiDaClient(base_url, "bench", "bench")
+    if not client.login():
+        raise RuntimeError("Login against the benchmark server failed")
+    batches = (count + 9) // 10
+    for i in range(batches):
+        labels = [
+            workload.label.render({"defaults": {"keHuDanHao": f"TRACK{i:05d}{j:02d}", "shouHuoQuDao": "FedEx Ground"}})[0]
+            for j in range(10)
+        ]
+        result = client.create_labels(labels)
+        workload.order_numbers += [item["keHuDanHao"] for item in (result or {}).get("data", [])]
+
+
+def run_sync(base_url: str, scenario: str, workload: Workload, requests: int, concurrency: int) -> ClientMetrics:
+    metrics = ClientMetrics()
+    client = YiDiDaClient(base_url, "bench", "bench", pool_maxsize=concurrency, metrics=metrics)
+    if not client.login():
+        raise RuntimeError("Login against the benchmark server failed")
+    call = make_call(client, scenario, workload)
+    for _ in bounded_map(call, range(requests), concurrency):
+        pass
+    return metrics
+
+
+def run_async(base_url: str, scenario: str, workload: Workload, requests: int, concurrency: int) -> ClientMetrics:
+    from yidida_async_client import AsyncYiDiDaClient
+
+    metrics = ClientMetrics()
+
+    async def main():
+        async with AsyncYiDiDaClient(base_url, "bench", "bench", max_concurrency=concurrency, metrics=metrics) as client:
+            if not await client.ensure_login():
+                raise RuntimeError("Login against the benchmark server failed")
+            call = make_call(client, scenario, workload)
+            await asyncio.gather(*[call(i) for i in range(requests)])
+
+    asyncio.run(main())
+    return metrics
+
+
+def measure(runner: Callable, base_url: str, scenario: str, workload: Workload, requests: int,
+            concurrency: int, trace_memory: bool) -> Dict:
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    metrics = runner(base_url, scenario, workload, requests, concurrency)
+    elapsed = time.perf_counter() - started
+    traced_peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+    if trace_memory:
+        tracemalloc.stop()
+
+    stats = metrics.snapshot()["endpoints"].get(ENDPOINTS[scenario], {})
+    latency = stats.get("latency", {})
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": requests,
+        "http_requests": stats.get("requests", 0),
+        "seconds": elapsed,
+        "rps": requests / elapsed if elapsed > 0 else 0.0,
+        "p50_ms": (latency.get("p50") or 0) * 1000,
+        "p95_ms": (latency.get("p95") or 0) * 1000,
+        "p99_ms": (latency.get("p99") or 0) * 1000,
+        "statuses": stats.get("statuses", {}),
+        "errors": stats.get("errors", {}),
+        "traced_peak_mb": traced_peak / (1024 * 1024) if traced_peak is not None else None,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def print_row(row: Dict):
+    traced = f"{row['traced_peak_mb']:8.1f}" if row["traced_peak_mb"] is not None else f"{'-':>8}"
+    non_200 = sum(count for status, count in row["statuses"].items() if status != "200") + sum(row["errors"].values())
+    print(f"  {row['scenario']:<7} {row['concurrency']:>5} {row['rps']:>10,.0f} {row['p50_ms']:>9.1f} "
+          f"{row['p95_ms']:>9.1f} {row['p99_ms']:>9.1f} {non_200:>8} {traced} {row['peak_rss_mb']:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load benchmark against the YiDiDa stub server")
+    parser.add_argument("--base-url", help="Target an already running server instead of starting the stub")
+    parser.add_argument("--client", choices=("sync", "async"), default="sync")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4, 16, 64])
+    parser.add_argument("--requests", type=int, default=500, help="API calls per scenario and concurrency level")
+    parser.add_argument("--label-batch", type=int, default=10, help="Labels per /yundans/ call")
+    parser.add_argument("--latency", type=float, default=0.02, help="Stub base latency (seconds)")
+    parser.add_argument("--jitter", type=float, default=0.01, help="Stub random extra latency (seconds)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Stub HTTP 500 rate")
+    parser.add_argument("--throttle-rps", type=float, help="Stub 429 threshold")
+    parser.add_argument("--trace-memory", action="store_true", help="Report tracemalloc peak (slows the client)")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    server = None
+    base_url = args.base_url
+    if base_url is None:
+        server, base_url = start_stub_server(
+            latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, throttle_rps=args.throttle_rps
+        )
+
+    workload = Workload(args.label_batch)
+    runner = run_async if args.client == "async" else run_sync
+    results = []
+    try:
+        if "track" in args.scenarios:
+            seed_orders(base_url, workload)
+
+        print(f"Target: {base_url}  client: {args.client}  calls per run: {args.requests:,}")
+        print(f"  {'path':<7} {'conc':>5} {'req/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+              f"{'non-200':>8} {'heap MB':>8} {'rss MB':>9}")
+        for scenario in args.scenarios:
+            for concurrency in args.concurrency:
+                row = measure(runner, base_url, scenario, workload, args.requests, concurrency, args.trace_memory)
+                print_row(row)
+                results.append(row)
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,369 @@
+"""
+Offline stand-in for the YiDiDa API (/login, /yundans/, /price, /queryYunDanDetail)
+
+Responses follow the shape of the real ones (see output/label_response_*.json) so the
+client, modules and benchmarks can run without touching twc.itdida.com.
+
+Usage:
+    python benchmarks/stub_server.py --port 8089 --latency 0.05 --error-rate 0.01 --throttle-rps 200
+    # then point api_base_url at http://127.0.0.1:8089/itdida-api
+"""
+import argparse
+import base64
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+API_PREFIX = "/itdida-api"
+
+# Tracking states a stub shipment moves through, one step per `status_step` seconds
+TRACKING_STATES = ("已下单", "已收货", "运输中", "派送中", "已签收")
+
+
+class StubState:
+    """Shared, thread-safe state of one stub server"""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 throttle_rps: Optional[float] = None, status_step: float = 30.0, label_mode: str = "url",
+                 label_size: int = 40 * 1024, reject_rate: float = 0.0, busy_rate: float = 0.0,
+                 per_label_latency: float = 0.0, max_batch: Optional[int] = None, verify_latency: float = 0.0):
+        """
+        Args:
+            latency: Base response delay in seconds
+            jitter: Extra uniformly random delay in seconds
+            error_rate: Fraction of requests answered with HTTP 500
+            throttle_rps: Requests per second per account above which HTTP 429 + Retry-After is returned
+            status_step: Seconds for a tracked shipment to advance one state
+            label_mode: "url" (labelUrl served by the stub), "inline" (base64 `label`) or "none"
+            label_size: Size of the fake PDF document in bytes
+            reject_rate: Fraction of orders refused with a permanent per-order code (303)
+            busy_rate: Fraction of orders refused with a transient per-order code (500, system busy)
+            per_label_latency: Extra /yundans/ delay per label in the batch (seconds)
+            max_batch: Larger /yundans/ batches are refused as a whole (system busy, nothing created)
+            verify_latency: Extra /yundans/ delay per label sent with needValidateAddress (seconds)
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rps = throttle_rps
+        self.status_step = status_step
+        self.label_mode = label_mode
+        self.reject_rate = reject_rate
+        self.busy_rate = busy_rate
+        self.per_label_latency = per_label_latency
+        self.max_batch = max_batch
+        self.verify_latency = verify_latency
+        self.document = b"%PDF-1.4\n" + b"0" * max(0, label_size - 15) + b"\n%%EOF"
+        self._inline_label = base64.b64encode(self.document).decode('ascii')
+        # token -> username; shipments and throttling are scoped to the account
+        self.tokens: Dict[str, str] = {}
+        self.shipments: Dict[str, Dict] = {}
+        self.requests = 0
+        self.verifications = 0
+        self._windows: Dict[str, Tuple[int, int]] = {}
+        self._lock = threading.Lock()
+
+    def throttled(self, account: str = "") -> bool:
+        """Fixed one-second window counter per account"""
+        if not self.throttle_rps:
+            return False
+        second = int(time.time())
+        with self._lock:
+            window_second, count = self._windows.get(account, (0, 0))
+            count = count + 1 if window_second == second else 1
+            self._windows[account] = (second, count)
+            return count > self.throttle_rps
+
+    def delay(self):
+        if self.latency or self.jitter:
+            time.sleep(self.latency + random.uniform(0, self.jitter))
+
+    def issue_token(self, username: str = "") -> str:
+        token = uuid.uuid4().hex
+        with self._lock:
+            self.tokens[token] = username
+        return token
+
+    def verify_address(self, label: Dict) -> str:
+        """addressVerifyResult: empty unless validation was asked for, then stable per street address"""
+        if not label.get("needValidateAddress"):
+            return ""
+        with self._lock:
+            self.verifications += 1
+        street = " ".join(str(label.get("shouJianRenDiZhi1") or "").upper().split())
+        return "RESIDENTIAL" if sum(street.encode('utf-8')) % 2 else "BUSINESS"
+
+    def create_waybill(self, label: Dict, host: str = "", owner: Optional[str] = None) -> Dict:
+        """Register a shipment (visible to `owner` only, when given) and build its /yundans/ data entry"""
+        order_no = label.get("keHuDanHao") or uuid.uuid4().hex[:12]
+        tracking_no = str(random.randint(10 ** 11, 10 ** 12 - 1))
+        system_no = str(random.randint(10 ** 18, 10 ** 19 - 1))
+        with self._lock:
+            self.shipments[order_no] = {
+                "created": time.time(),
+                "zhuanDanHao": tracking_no,
+                "xiTongDanHao": system_no,
+                "waybillId": f"A{system_no}",
+                "label": label,
+                "owner": owner,
+            }
+        return {
+            "addressVerifyResult": self.verify_address(label),
+            "childNos": [tracking_no],
+            "code": 200,
+            "faPiao": "",
+            "format": "pdf",
+            "huanDanHao": "",
+            "keHuDanHao": order_no,
+            "label": self._inline_label if self.label_mode == "inline" else "",
+            "labelUrl": f"http://{host}{API_PREFIX}/labels/{tracking_no}.pdf" if self.label_mode == "url" and host else "",
+            "message": "",
+            "otherNumber1": "",
+            "otherNumber2": "",
+            "seventeenNo": "",
+            "waybillId": f"A{system_no}",
+            "xiTongDanHao": system_no,
+            "zhuanDanHao": tracking_no,
+        }
+
+    def label_entry(self, label: Dict, host: str = "", owner: Optional[str] = None) -> Dict:
+        """/yundans/ data entry for one order: created, or refused per reject_rate / busy_rate"""
+        draw = random.random()
+        if draw < self.reject_rate:
+            code, message = 303, "Label权限不足"
+        elif draw < self.reject_rate + self.busy_rate:
+            code, message = 500, "系统繁忙,请稍后重试"
+        else:
+            return self.create_waybill(label, host, owner)
+        return {"keHuDanHao": label.get("keHuDanHao"), "code": code, "message": message, "zhuanDanHao": "",
+                "childNos": [], "waybillId": ""}
+
+    def tracking_record(self, order_no: str, owner: Optional[str] = None) -> Optional[Dict]:
+        """Tracking record whose state advances with the shipment's age (None for another account's order)"""
+        with self._lock:
+            shipment = self.shipments.get(order_no)
+        if shipment is None or owner is not None and shipment.get("owner") not in (None, owner):
+            return None
+
+        age = time.time() - shipment["created"]
+        step = min(len(TRACKING_STATES) - 1, int(age / self.status_step))
+        events = [
+            {
+                "time": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(shipment["created"] + i * self.status_step)),
+                "location": shipment["label"].get("shouJianRenChengShi", "") if i == step else "",
+                "content": TRACKING_STATES[i],
+            }
+            for i in range(step + 1)
+        ]
+        return {
+            "keHuDanHao": order_no,
+            "zhuanDanHao": shipment["zhuanDanHao"],
+            "xiTongDanHao": shipment["xiTongDanHao"],
+            "waybillId": shipment["waybillId"],
+            "status": step,
+            "statusText": TRACKING_STATES[step],
+            "lastUpdateTime": events[-1]["time"],
+            "trackList": list(reversed(events)),
+        }
+
+
+def price_quotes(params: Dict) -> list:
+    """Deterministic quotes: price grows with weight and ZIP3 distance, one entry per channel"""
+    weight = float(params.get("weight") or 0)
+    postcode = str((params.get("toCustomer") or {}).get("postcode") or "000")
+    zone = 2 + int(postcode[:3]) // 125 if postcode[:3].isdigit() else 5
+    quotes = []
+    for way_type in params.get("wayTypeList") or [0]:
+        base = 8.5 + 1.5 * int(way_type)
+        quotes.append({
+            "wayType": way_type,
+            "channelName": f"STUB-{way_type}",
+            "zone": zone,
+            "chargeWeight": max(weight, 0.5),
+            "totalPrice": round(base + zone * 0.9 + max(weight, 0.5) * (1.1 + zone * 0.15), 2),
+            "currency": "USD",
+        })
+    return quotes
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Routes requests to the stub endpoints"""
+
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; without TCP_NODELAY keep-alive clients stall on delayed ACKs
+    disable_nagle_algorithm = True
+    state: StubState = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, body: Dict, headers: Optional[Dict] = None):
+        payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json;charset=UTF-8")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _pre_checks(self) -> Tuple[bool, str]:
+        """Latency, throttling and injected errors common to every endpoint"""
+        state = self.state
+        with state._lock:
+            state.requests += 1
+        state.delay()
+        if state.throttled(self.account or ""):
+            self._reply(429, {"success": False, "statusCode": 429, "message": "Too many requests"}, {"Retry-After": "1"})
+            return False, ""
+        if state.error_rate and random.random() < state.error_rate:
+            self._reply(500, {"success": False, "statusCode": 500, "message": "Injected error"})
+            return False, ""
+        return True, urlparse(self.path).path[len(API_PREFIX):]
+
+    @property
+    def account(self) -> Optional[str]:
+        """Username behind the request's token"""
+        return self.state.tokens.get(self.headers.get("Authorization"))
+
+    def _authorized(self) -> bool:
+        if self.headers.get("Authorization") in self.state.tokens:
+            return True
+        self._reply(200, {"success": False, "statusCode": 401, "message": "token失效,请重新登录"})
+        return False
+
+    def do_POST(self):
+        body = self._read_body()
+        ok, path = self._pre_checks()
+        if not ok:
+            return
+
+        if path == "/login":
+            form = parse_qs(body.decode('utf-8'))
+            if form.get("username") and form.get("password"):
+                self._reply(200, {"success": True, "statusCode": 200, "data": self.state.issue_token(form["username"][0])})
+            else:
+                self._reply(200, {"success": False, "statusCode": 400, "data": "用户名或密码错误"})
+            return
+
+        if not self._authorized():
+            return
+
+        try:
+            params = json.loads(body or b"null")
+        except ValueError:
+            self._reply(400, {"success": False, "statusCode": 400, "message": "Invalid JSON"})
+            return
+
+        if path in ("/yundans", "/yundans/"):
+            host = self.headers.get("Host", "")
+            labels = params or []
+            state = self.state
+            if state.per_label_latency:
+                time.sleep(state.per_label_latency * len(labels))
+            if state.verify_latency:
+                time.sleep(state.verify_latency * sum(1 for label in labels if label.get("needValidateAddress")))
+            if state.max_batch and len(labels) > state.max_batch:
+                self._reply(200, {"data": [], "success": False, "statusCode": 500, "message": "系统繁忙,请稍后重试"})
+                return
+            data = [self.state.label_entry(label, host, self.account) for label in labels]
+            self._reply(200, {"data": data, "domain": "", "statusCode": 200, "success": True})
+        elif path == "/price":
+            self._reply(200, {"data": price_quotes(params or {}), "statusCode": 200, "success": True})
+        else:
+            self._reply(404, {"success": False, "statusCode": 404, "message": "Not found"})
+
+    def do_GET(self):
+        ok, path = self._pre_checks()
+        if not ok:
+            return
+
+        # Label documents are public URLs, like a CDN
+        if path.startswith("/labels/"):
+            document = self.state.document
+            self.send_response(200)
+            self.send_header("Content-Type", "application/pdf")
+            self.send_header("Content-Length", str(len(document)))
+            self.end_headers()
+            self.wfile.write(document)
+            return
+
+        if not self._authorized():
+            return
+
+        if path == "/queryYunDanDetail":
+            query = parse_qs(urlparse(self.path).query)
+            order_numbers = [n for n in ",".join(query.get("danHaos", [])).split(",") if n][:10]
+            account = self.account
+            data = [record for record in (self.state.tracking_record(num, account) for num in order_numbers) if record]
+            self._reply(200, {"data": data, "statusCode": 200, "success": True})
+        else:
+            self._reply(404, {"success": False, "statusCode": 404, "message": "Not found"})
+
+
+def start_stub_server(host: str = "127.0.0.1", port: int = 0, **state_options) -> Tuple[ThreadingHTTPServer, str]:
+    """
+    Start the stub server on a background thread
+
+    Args:
+        host: Interface to bind
+        port: Port (0 picks a free one)
+        **state_options: StubState options (latency, jitter, error_rate, throttle_rps, status_step,
+                         label_mode, label_size, reject_rate, busy_rate, per_label_latency, max_batch,
+                         verify_latency)
+
+    Returns:
+        (server, base_url) - call server.shutdown() when done
+    """
+    handler = type("BoundStubHandler", (StubHandler,), {"state": StubState(**state_options)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}{API_PREFIX}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline YiDiDa API stub server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.0, help="Base delay per request (seconds)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random delay per request (seconds)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 500")
+    parser.add_argument("--throttle-rps", type=float, help="Answer HTTP 429 above this many requests per second")
+    parser.add_argument("--status-step", type=float, default=30.0, help="Seconds per tracking state change")
+    parser.add_argument("--label-mode", choices=("url", "inline", "none"), default="url",
+                        help="Return label documents as labelUrl, inline base64 or not at all")
+    parser.add_argument("--label-size", type=int, default=40 * 1024, help="Fake label document size (bytes)")
+    parser.add_argument("--reject-rate", type=float, default=0.0, help="Fraction of orders refused permanently (303)")
+    parser.add_argument("--busy-rate", type=float, default=0.0, help="Fraction of orders refused as system busy")
+    parser.add_argument("--per-label-latency", type=float, default=0.0, help="Extra /yundans/ delay per label")
+    parser.add_argument("--max-batch", type=int, help="Refuse larger /yundans/ batches as system busy")
+    parser.add_argument("--verify-latency", type=float, default=0.0,
+                        help="Extra /yundans/ delay per label asking for address validation")
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(
+        args.host, args.port, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+        throttle_rps=args.throttle_rps, status_step=args.status_step, label_mode=args.label_mode,
+        label_size=args.label_size, reject_rate=args.reject_rate, busy_rate=args.busy_rate,
+        per_label_latency=args.per_label_latency, max_batch=args.max_batch, verify_latency=args.verify_latency
+    )
+    print(f"YiDiDa stub listening on {base_url} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,17 @@
 """
 YiDiDa API Testing Tool - Multi-function client for label creation, rate inquiry, and shipment tracking
 """
-from yidida_client import YiDiDaClient
-from modules import create_labels_module, query_price_module, query_shipment_module
+from yidida_context import AppContext
+import modules
 import argparse
+import json
 import logging
 import sys
+from datetime import datetime
 
 
-def setup_logging(config):
-    """Configure logging based on config.json settings"""
+def setup_logging(config, stream=sys.stdout):
+    """Configure logging based on config.json settings (batch commands log to stderr)"""
     log_config = config.get("logging", {})
     log_level = log_config.get("log_level", "INFO")
     log_to_file = log_config.get("log_to_file", False)
@@ -21,9 +23,10 @@ def setup_logging(config):
         format='[%(levelname)s] %(asctime)s - %(message)s',
         datefmt='%Y-%m-%d %H:%M:%S',
         handlers=[
-            logging.StreamHandler(sys.stdout),
+            logging.StreamHandler(stream),
             logging.FileHandler(log_file_path, encoding='utf-8') if log_to_file else logging.NullHandler()
-        ]
+        ],
+        force=True
     )
     
     logger = logging.getLogger(__name__)
@@ -32,11 +35,24 @@ def setup_logging(config):
     return logger
 
 
-def main_menu():
-    """Display interactive menu and route to appropriate module"""
-    # Load config and setup logging first
-    config = YiDiDaClient.load_config("config.json")
-    logger = setup_logging(config)
+def lookup_responses(context, order_number):
+    """Print every stored response entry for an order number"""
+    store = context.store()
+    records = store.lookup(order_number)
+    if not records:
+        print(f"\n✗ No stored responses for {order_number}")
+        return False
+    
+    for record in records:
+        stored_at = datetime.fromtimestamp(record["created_at"]).strftime("%Y-%m-%d %H:%M:%S")
+        print(f"\n[{record['kind']}] {stored_at} (response id {record['response_id']})")
+        print(json.dumps(record["item"], indent=2, ensure_ascii=False))
+    return True
+
+
+def main_menu(context):
+    """Display interactive menu and route to appropriate module (all of them share one login)"""
+    logger = logging.getLogger(__name__)
     
     while True:
         print("\n" + "=" * 60)
@@ -52,11 +68,11 @@ def main_menu():
         choice = input("Select a module (1-4): ").strip()
         
         if choice == '1':
-            create_labels_module()
+            modules.create_labels_module(context)
         elif choice == '2':
-            query_price_module()
+            modules.query_price_module(context)
         elif choice == '3':
-            query_shipment_module()
+            modules.query_shipment_module(context)
         elif choice == '4':
             logger.info("Exiting YiDiDa API Testing Tool")
             print("\nGoodbye!")
@@ -73,37 +89,142 @@ def main():
         epilog='''
 Examples:
   python main.py                      # Interactive menu mode
+  python main.py price --input quotes.ndjson --output - --concurrency 8
+                                      # Batch mode: NDJSON requests in, NDJSON results out
+  cat orders.ndjson | python main.py track > tracking.ndjson
+  python main.py enqueue labels --input orders.ndjson
+  python main.py worker --processes 4 # Drain the shared job queue (config job_queue) on 4 cores
+  python main.py serve --port 8808    # Local HTTP gateway sharing one logged-in client
   python main.py --create-labels      # Create shipping labels
+  python main.py --bulk-labels orders.csv --batch-size 50 --workers 4
+                                      # Create labels for every order in a CSV/JSONL file
+  python main.py --bulk-labels orders.csv --download-labels
+                                      # ...and save/bundle the label documents of the wave
+  python main.py --validate-labels orders.csv
+                                      # Pre-flight check of an order file without calling the API
   python main.py --query-price        # Query shipping rates
+  python main.py --build-rate-table   # Precompute the local rate table (config rate_table)
   python main.py --query-shipment     # Query shipment status
+  python main.py --track-poll open_orders.txt
+                                      # Keep polling open shipments, logging only changes
+  python main.py --lookup 1Z999AA10123456784
+                                      # Show stored responses for an order/tracking number
         '''
     )
     
     parser.add_argument('--create-labels', action='store_true',
                        help='Run label creation module')
+    parser.add_argument('--bulk-labels', metavar='ORDERS_FILE',
+                       help='Create labels for every order in a CSV/JSONL file')
+    parser.add_argument('--batch-size', type=int,
+                       help='Labels per request in bulk mode (default: config bulk.batch_size or 50)')
+    parser.add_argument('--workers', type=int,
+                       help='Concurrent requests in bulk mode (default: config bulk.workers or 4)')
+    parser.add_argument('--download-labels', action='store_true',
+                       help='In bulk mode, also save the label documents of the wave (see config label_documents)')
+    parser.add_argument('--preflight', action='store_true',
+                       help='In bulk mode, validate labels locally and skip invalid orders (needs numpy)')
+    parser.add_argument('--validate-labels', metavar='ORDERS_FILE',
+                       help='Validate every order of a CSV/JSONL file locally, without calling the API (needs numpy)')
     parser.add_argument('--query-price', action='store_true',
                        help='Run rate inquiry module')
+    parser.add_argument('--build-rate-table', action='store_true',
+                       help='Sweep /price into the local rate table described by config rate_table')
     parser.add_argument('--query-shipment', action='store_true',
                        help='Run shipment tracking module')
+    parser.add_argument('--track-poll', nargs='?', const='', metavar='ORDERS_FILE',
+                       help='Run the tracking poller until Ctrl+C (optionally adding order numbers from a file)')
+    parser.add_argument('--lookup', metavar='ORDER_NUMBER',
+                       help='Show stored responses for a keHuDanHao/waybillId/xiTongDanHao/zhuanDanHao')
     parser.add_argument('--menu', action='store_true',
                        help='Show interactive menu (default)')
     
+    # Non-interactive batch subcommands (no prompts, logs on stderr, exit code reflects failures)
+    subparsers = parser.add_subparsers(dest='command', metavar='{labels,price,track,enqueue,worker,queue-stats,serve}')
+    for name, help_text in (('labels', 'Create one label per NDJSON order row'),
+                            ('price', 'Query rates for each NDJSON line of price parameters'),
+                            ('track', 'Track the order numbers on each NDJSON line')):
+        subparser = subparsers.add_parser(name, help=help_text)
+        subparser.add_argument('--input', default='-', help='NDJSON input file, - for stdin (default)')
+        subparser.add_argument('--output', default='-', help='NDJSON output file, - for stdout (default)')
+        subparser.add_argument('--concurrency', type=int, default=4, help='Requests in flight (default: 4)')
+        if name == 'labels':
+            subparser.add_argument('--batch-size', type=int, default=10, help='Labels per request (default: 10)')
+            subparser.add_argument('--preflight', action='store_true',
+                                   help='Validate labels locally first; invalid ones are not sent (needs numpy)')
+    
+    # Shared job queue (config job_queue): enqueue work, then drain it from any number of workers
+    enqueue_parser = subparsers.add_parser('enqueue', help='Queue NDJSON labels/price/track requests as jobs')
+    enqueue_parser.add_argument('kind', choices=('labels', 'price', 'track'))
+    enqueue_parser.add_argument('--input', default='-', help='NDJSON input file, - for stdin (default)')
+    enqueue_parser.add_argument('--batch-size', type=int,
+                                help='Orders per job (default: 50 labels, 100 tracking numbers, 1 price query)')
+    worker_parser = subparsers.add_parser('worker', help='Lease and run queued jobs until Ctrl+C')
+    worker_parser.add_argument('--queues', default='labels,price,track', help='Comma-separated queues to drain')
+    worker_parser.add_argument('--concurrency', type=int, default=4, help='Jobs run at once per process (default: 4)')
+    worker_parser.add_argument('--processes', type=int, default=1, help='Worker processes to start (default: 1)')
+    worker_parser.add_argument('--once', action='store_true', help='Exit when no job is left to lease')
+    stats_parser = subparsers.add_parser('queue-stats', help='Show backlog and throughput per queue')
+    stats_parser.add_argument('--window', type=float, default=300, help='Seconds of throughput to report')
+    stats_parser.add_argument('--json', action='store_true', help='Print JSON')
+    
+    # Local HTTP gateway (config gateway): one logged-in client shared by every internal app
+    serve_parser = subparsers.add_parser('serve', help='Serve label/price/track endpoints over local HTTP')
+    serve_parser.add_argument('--host', help='Address to bind (default: config gateway.host or 127.0.0.1)')
+    serve_parser.add_argument('--port', type=int, help='Port (default: config gateway.port or 8808)')
+    serve_parser.add_argument('--concurrency', type=int,
+                              help='Upstream price/track calls in flight (default: config gateway.concurrency or 16)')
+    
     args = parser.parse_args()
     
-    # Setup logging
-    config = YiDiDaClient.load_config("config.json")
-    setup_logging(config)
+    # One context per process: config is read once and every module shares the same logged-in client
+    context = AppContext("config.json")
+    
+    if args.command in ('enqueue', 'worker', 'queue-stats'):
+        from modules import queue_worker
+        setup_logging(context.config, stream=sys.stderr)
+        if args.command == 'enqueue':
+            sys.exit(queue_worker.enqueue_command(args.kind, args.input, args.batch_size, context=context))
+        if args.command == 'worker':
+            queues = [name.strip() for name in args.queues.split(',') if name.strip()]
+            sys.exit(queue_worker.worker_command(queues, args.concurrency, args.processes, args.once, context=context))
+        sys.exit(queue_worker.queue_stats_command(args.json, args.window, context=context))
+    
+    if args.command == 'serve':
+        from modules.gateway import serve_command
+        setup_logging(context.config)
+        sys.exit(serve_command(args.host, args.port, args.concurrency, context=context))
+    
+    if args.command:
+        from modules.batch_cli import batch_command
+        setup_logging(context.config, stream=sys.stderr)
+        sys.exit(batch_command(args.command, args.input, args.output, args.concurrency,
+                               getattr(args, 'batch_size', None) or 10, context=context,
+                               preflight=getattr(args, 'preflight', False)))
+    
+    setup_logging(context.config)
     
     # Route to appropriate module based on CLI args
     if args.create_labels:
-        create_labels_module()
+        modules.create_labels_module(context)
+    elif args.bulk_labels:
+        modules.bulk_create_labels_module(args.bulk_labels, args.batch_size, args.workers, args.download_labels,
+                                          context=context, preflight=args.preflight)
+    elif args.validate_labels:
+        modules.validate_labels_module(args.validate_labels, context=context)
     elif args.query_price:
-        query_price_module()
+        modules.query_price_module(context)
+    elif args.build_rate_table:
+        modules.rate_table_module(context)
     elif args.query_shipment:
-        query_shipment_module()
+        modules.query_shipment_module(context)
+    elif args.track_poll is not None:
+        modules.tracking_poller_module(args.track_poll or None, context=context)
+    elif args.lookup:
+        lookup_responses(context, args.lookup)
     else:
         # Default to interactive menu if no args or --menu specified
-        main_menu()
+        main_menu(context)
 
 
 if __name__ == "__main__":
@@ -1,8 +1,33 @@
 """
 YiDiDa API Testing Tool - Module Package
+
+Modules are imported on first attribute access, so `import modules` costs nothing
+until a module is actually run (keeps `main.py --help` and batch startup fast).
 """
-from .label_creator import create_labels_module
-from .price_query import query_price_module
-from .shipment_tracker import query_shipment_module
+import importlib
+
+# Public name -> submodule defining it
+_MODULES = {
+    'create_labels_module': 'label_creator',
+    'bulk_create_labels_module': 'bulk_labels',
+    'query_price_module': 'price_query',
+    'query_shipment_module': 'shipment_tracker',
+    'tracking_poller_module': 'tracking_poller',
+    'validate_labels_module': 'label_validator',
+    'rate_table_module': 'rate_table',
+}
+
+__all__ = ['create_labels_module', 'bulk_create_labels_module', 'query_price_module', 'query_shipment_module',
+           'tracking_poller_module', 'validate_labels_module', 'rate_table_module']
+
+
+def __getattr__(name):
+    if name in _MODULES:
+        value = getattr(importlib.import_module(f'.{_MODULES[name]}', __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
-__all__ = ['create_labels_module', 'query_price_module', 'query_shipment_module']
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,225 @@
+"""Non-interactive batch commands: NDJSON requests in, one compact NDJSON result per request out"""
+from yidida_client import YiDiDaClient, bounded_map, iter_chunks
+from yidida_context import AppContext
+from yidida_journal import CONFIRMED, SUBMIT_GRACE, LabelJournal
+from yidida_pool import ClientPool
+from modules.batch_executor import LabelBatchExecutor, is_accepted
+from modules.bulk_labels import bulk_create_labels, merge_order
+import json
+import logging
+import sys
+from typing import Any, Dict, Iterator, List, Optional, TextIO, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Exit codes (2 is argparse's usage error)
+EXIT_OK = 0            # every request succeeded
+EXIT_FAILED = 1        # nothing succeeded, or the run could not start (config, login)
+EXIT_PARTIAL = 3       # some requests failed
+
+
+class ResultWriter:
+    """Writes one compact JSON line per result and flushes it, so pipelines see it immediately"""
+
+    def __init__(self, output: TextIO):
+        self.output = output
+        self.ok = 0
+        self.failed = 0
+
+    def write(self, result: Dict, ok: bool):
+        self.output.write(json.dumps(result, ensure_ascii=False, separators=(',', ':')) + "\n")
+        self.output.flush()
+        if ok:
+            self.ok += 1
+        else:
+            self.failed += 1
+
+    def exit_code(self) -> int:
+        if not self.failed:
+            return EXIT_OK
+        return EXIT_PARTIAL if self.ok else EXIT_FAILED
+
+
+def iter_ndjson(stream: TextIO, writer: ResultWriter) -> Iterator[Tuple[int, Any]]:
+    """
+    Yield (line number, parsed value) for each non-empty line
+
+    Lines that are not valid JSON produce an error result instead of stopping the run.
+    """
+    for line_no, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield line_no, json.loads(line)
+        except json.JSONDecodeError as e:
+            writer.write({"line": line_no, "ok": False, "error": f"Invalid JSON: {e}"}, ok=False)
+
+
+def run_labels(client: YiDiDaClient, context: AppContext, stream: TextIO, writer: ResultWriter,
+               concurrency: int = 4, batch_size: int = 10, preflight: bool = False) -> int:
+    """
+    Create one label per input line (an order row merged onto the label template, as in bulk mode)
+
+    Orders go through the label journal, so rerunning the same input never creates a waybill twice.
+    With preflight, orders failing local validation are answered with code "PREFLIGHT" and not sent.
+    Each output line is the bulk-mode result row plus "ok".
+    """
+    base_label = YiDiDaClient.load_label_template("templates/label_template.json", context.config)[0]
+    journal = LabelJournal.from_config(context.config)
+    # Other batch runs may share the job name and still be sending: only settle marks too old to be live
+    journal.recover(client, concurrency, job="batch-cli", min_age=SUBMIT_GRACE)
+
+    def rows():
+        for line_no, row in iter_ndjson(stream, writer):
+            if isinstance(row, dict):
+                yield row
+            else:
+                writer.write({"line": line_no, "ok": False, "error": "Expected a JSON object"}, ok=False)
+
+    def on_row(row: Dict):
+        # An order confirmed by an earlier run counts as done
+        row["ok"] = is_accepted(row) or row.get("journal") == CONFIRMED
+        writer.write(row, ok=row["ok"])
+
+    limits = None
+    if preflight or context.config.get("preflight", {}).get("enabled", False):
+        from modules.label_validator import preflight_limits
+        limits = preflight_limits(context.config)
+
+    executor = LabelBatchExecutor.from_config(client, context.config, concurrency, batch_size)
+    bulk_create_labels(client, rows(), base_label, None, batch_size, concurrency,
+                       context.store(), journal, job="batch-cli", on_row=on_row, preflight=limits, executor=executor)
+    return writer.exit_code()
+
+
+def run_price(client: YiDiDaClient, config: Dict, stream: TextIO, writer: ResultWriter, concurrency: int = 4) -> int:
+    """
+    Query rates for each input line (price parameters merged onto the price template)
+
+    Output: {"line", "ok", "data"} or {"line", "ok": false, "error"}
+    """
+    base_params = YiDiDaClient.load_price_template("templates/price_template.json", config)
+
+    def price_requests():
+        for line_no, params in iter_ndjson(stream, writer):
+            if isinstance(params, dict):
+                yield line_no, merge_order(base_params, params)
+            else:
+                writer.write({"line": line_no, "ok": False, "error": "Expected a JSON object"}, ok=False)
+
+    for (line_no, _), result in bounded_map(lambda item: client.query_price(item[1]), price_requests(), concurrency):
+        if result is not None:
+            writer.write({"line": line_no, "ok": True, "data": result.get("data")}, ok=True)
+        else:
+            writer.write({"line": line_no, "ok": False, "error": "Price query failed"}, ok=False)
+    return writer.exit_code()
+
+
+def _order_numbers(value: Any) -> List[str]:
+    """Order numbers from a track input line: "A", "A,B", ["A", "B"], {"orders": ...} or {"keHuDanHao": "A"}"""
+    if isinstance(value, dict):
+        for field in ("orders",) + YiDiDaClient.ORDER_NUMBER_FIELDS:
+            if value.get(field):
+                return _order_numbers(value[field])
+        return []
+    if isinstance(value, list):
+        return [str(num).strip() for num in value if str(num).strip()]
+    if isinstance(value, (str, int)):
+        return [num.strip() for num in str(value).split(',') if num.strip()]
+    return []
+
+
+def run_track(client: YiDiDaClient, stream: TextIO, writer: ResultWriter, concurrency: int = 4) -> int:
+    """
+    Track the order numbers of each input line, packing them into 10-order requests
+
+    Output, one line per order number: {"line", "order", "ok", "record"} (ok is false when
+    the order was not found or its request failed)
+    """
+    def orders():
+        for line_no, value in iter_ndjson(stream, writer):
+            numbers = _order_numbers(value)
+            if not numbers:
+                writer.write({"line": line_no, "ok": False, "error": "No order numbers"}, ok=False)
+            for num in numbers:
+                yield line_no, num
+
+    def query(chunk: List[Tuple[int, str]]) -> Optional[Dict]:
+        return client.query_shipment(",".join(dict.fromkeys(num for _, num in chunk)))
+
+    for chunk, result in bounded_map(query, iter_chunks(orders(), YiDiDaClient.MAX_ORDERS_PER_QUERY), concurrency):
+        merged = {"data": {}, "failed_chunks": [], "not_found": []}
+        client._merge_shipment_chunk(merged, list(dict.fromkeys(num for _, num in chunk)), result)
+        for line_no, num in chunk:
+            if merged["failed_chunks"]:
+                writer.write({"line": line_no, "order": num, "ok": False,
+                              "error": merged["failed_chunks"][0]["message"]}, ok=False)
+            else:
+                record = merged["data"].get(num)
+                writer.write({"line": line_no, "order": num, "ok": record is not None, "record": record},
+                             ok=record is not None)
+    return writer.exit_code()
+
+
+def batch_command(command: str, input_path: str = "-", output_path: str = "-", concurrency: int = 4,
+                  batch_size: int = 10, context: Optional[AppContext] = None, preflight: bool = False) -> int:
+    """
+    Run one batch subcommand (labels, price or track) without any prompt
+
+    Args:
+        command: "labels", "price" or "track"
+        input_path: NDJSON input file, or "-" for stdin
+        output_path: NDJSON output file, or "-" for stdout
+        concurrency: Requests in flight at once
+        batch_size: Labels per /yundans/ request (labels only)
+        context: Shared AppContext (one is created if omitted)
+        preflight: Validate labels locally before sending them (labels only)
+
+    Returns:
+        Process exit code (EXIT_OK, EXIT_PARTIAL or EXIT_FAILED)
+    """
+    context = context or AppContext()
+    try:
+        config = context.config
+    except (OSError, ValueError) as e:
+        logger.error(f"✗ Cannot load {context.config_path}: {e}")
+        return EXIT_FAILED
+
+    # Open both ends before logging in, so a bad path fails fast with an exit code
+    try:
+        stream = sys.stdin if input_path == "-" else open(input_path, 'r', encoding='utf-8-sig')
+    except OSError as e:
+        logger.error(f"✗ Cannot read {input_path}: {e}")
+        return EXIT_FAILED
+    try:
+        output = sys.stdout if output_path == "-" else open(output_path, 'w', encoding='utf-8')
+    except OSError as e:
+        logger.error(f"✗ Cannot write {output_path}: {e}")
+        if stream is not sys.stdin:
+            stream.close()
+        return EXIT_FAILED
+
+    writer = ResultWriter(output)
+    try:
+        client = context.login(pool_maxsize=concurrency)
+        if client is None:
+            logger.error("Failed to login. Please check your credentials in config.json")
+            return EXIT_FAILED
+
+        if command == "labels":
+            code = run_labels(client, context, stream, writer, concurrency, batch_size, preflight)
+        elif command == "price":
+            code = run_price(client, config, stream, writer, concurrency)
+        else:
+            code = run_track(client, stream, writer, concurrency)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+        if output is not sys.stdout:
+            output.close()
+
+    logger.info(f"{command}: {writer.ok} succeeded, {writer.failed} failed")
+    if isinstance(client, ClientPool):
+        client.log_stats()
+    return code
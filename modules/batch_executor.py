@@ -0,0 +1,341 @@
+"""
+Label batch executor: per-order outcomes, resubmission of retryable rejections, adaptive batch size
+
+A /yundans/ response carries one code/message per order, so a batch is rarely all-or-nothing.
+Every order is sorted into one of four outcomes:
+
+    accepted   code 200 with a tracking number
+    retryable  explicitly refused for now (busy, throttled); nothing was created
+    permanent  refused for a reason a resend will not fix (e.g. 303 Label权限不足, bad address)
+    unknown    no answer for this order (request failed, missing from the response, or a server
+               side timeout or error); it may have been created, so it is never resent here and
+               is left to the label journal
+    withheld   not sent: held back right before sending (another run has claimed the order)
+
+Only retryable orders are resubmitted, in later rounds after a backoff. The batch size follows
+an AIMD rule (AdaptiveBatchSize): it grows by a fixed step while batches come back fast and
+clean, and is cut in half when a batch is slow or has too many failures.
+"""
+from yidida_client import YiDiDaClient, bounded_map
+from itertools import islice
+import logging
+import threading
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+ACCEPTED = "accepted"
+RETRYABLE = "retryable"
+PERMANENT = "permanent"
+UNKNOWN = "unknown"
+WITHHELD = "withheld"
+
+# Fields written for every order in the results file
+RESULT_FIELDS = ("keHuDanHao", "zhuanDanHao", "waybillId", "code", "message")
+
+# Per-order (or whole-request) codes and message fragments that mean "refused for now, try again"
+RETRY_CODES = (429, 503)
+RETRY_KEYWORDS = ("繁忙", "稍后", "频繁", "busy", "try again", "too many")
+
+# Server errors and timeouts do not prove the waybill was not created: the order stays in doubt
+IN_DOUBT_CODES = (500, 502, 504)
+IN_DOUBT_KEYWORDS = ("超时", "timeout", "timed out")
+
+
+def batch_results(batch: List[Dict], result: Optional[Dict]) -> List[Dict]:
+    """Match one /yundans/ response back to the orders of its batch"""
+    if result is None:
+        return [
+            {"keHuDanHao": label.get("keHuDanHao"), "zhuanDanHao": None, "code": None, "message": "Request failed"}
+            for label in batch
+        ]
+
+    by_order = {}
+    for item in result.get("data") or []:
+        by_order[item.get("keHuDanHao")] = item
+
+    rows = []
+    for label in batch:
+        order_no = label.get("keHuDanHao")
+        item = by_order.get(order_no)
+        if item is None:
+            rows.append({
+                "keHuDanHao": order_no,
+                "zhuanDanHao": None,
+                "code": result.get("code") or result.get("statusCode"),
+                "message": result.get("message") or "Missing from response"
+            })
+        else:
+            rows.append({field: item.get(field) for field in RESULT_FIELDS})
+    return rows
+
+
+def is_accepted(row: Dict) -> bool:
+    """An order counts as created when it came back with a tracking number and a 200 code"""
+    return row.get("code") == 200 and bool(row.get("zhuanDanHao"))
+
+
+def _refused(result: Dict) -> bool:
+    """The whole request was refused in the body: a failure code and no per-order data"""
+    return not result.get("data") and not result.get("success") and result.get("statusCode") not in (None, 200)
+
+
+class AdaptiveBatchSize:
+    """
+    AIMD batch size controller
+
+    After each batch: grow by `step` when it was under the latency target and error rate,
+    otherwise multiply by `decrease`. Batches still in flight were sized before the last change,
+    so a slow or failing batch larger than the current size does not cut it again, and a
+    clean batch smaller than the current size does not grow it.
+    """
+
+    def __init__(self, initial: int = 50, minimum: int = 5, maximum: int = 100, step: int = 5,
+                 decrease: float = 0.5, target_latency: float = 30.0, max_error_rate: float = 0.1,
+                 adaptive: bool = True):
+        """
+        Args:
+            initial: Starting batch size
+            minimum: Smallest batch size
+            maximum: Largest batch size
+            step: Orders added after a clean batch
+            decrease: Factor applied after a slow or failing batch
+            target_latency: Batch latency (seconds) above which the size is cut
+            max_error_rate: Share of retryable/unknown orders above which the size is cut
+            adaptive: False keeps the size fixed at `initial`
+        """
+        # An explicit starting size outside the bounds widens them
+        self.minimum = max(1, min(minimum, initial))
+        self.maximum = max(self.minimum, maximum, initial)
+        self.step = max(1, step)
+        self.decrease = decrease
+        self.target_latency = target_latency
+        self.max_error_rate = max_error_rate
+        self.adaptive = adaptive
+        self._size = max(1, initial)
+        self.smallest = self.largest = self._size
+        self.increases = 0
+        self.decreases = 0
+
+    @classmethod
+    def from_config(cls, config: Dict, batch_size: Optional[int] = None) -> 'AdaptiveBatchSize':
+        """
+        Build the controller from the optional "bulk" section of config.json, e.g.
+        "bulk": {"batch_size": 50, "adaptive": true, "min_batch_size": 5, "max_batch_size": 100,
+                 "target_latency": 30, "max_error_rate": 0.1}
+
+        Args:
+            config: Configuration dictionary
+            batch_size: Starting size overriding bulk.batch_size (e.g. --batch-size)
+        """
+        bulk_config = config.get("bulk", {})
+        return cls(
+            initial=batch_size or bulk_config.get("batch_size", 50),
+            minimum=bulk_config.get("min_batch_size", 5),
+            maximum=bulk_config.get("max_batch_size", 100),
+            step=bulk_config.get("batch_size_step", 5),
+            target_latency=bulk_config.get("target_latency", 30.0),
+            max_error_rate=bulk_config.get("max_error_rate", 0.1),
+            adaptive=bulk_config.get("adaptive", True)
+        )
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def observe(self, batch_size: int, latency: float, errors: int = 0) -> int:
+        """
+        Feed back one finished batch
+
+        Args:
+            batch_size: Orders in the batch
+            latency: Seconds the request took
+            errors: Orders that came back retryable or unknown
+
+        Returns:
+            The new batch size
+        """
+        if not self.adaptive or batch_size <= 0:
+            return self._size
+
+        if latency > self.target_latency or errors / batch_size > self.max_error_rate:
+            if batch_size <= self._size:
+                self._size = max(self.minimum, int(self._size * self.decrease))
+                self.decreases += 1
+        elif batch_size >= self._size and self._size < self.maximum:
+            self._size = min(self.maximum, self._size + self.step)
+            self.increases += 1
+
+        self.smallest = min(self.smallest, self._size)
+        self.largest = max(self.largest, self._size)
+        return self._size
+
+
+class LabelBatchExecutor:
+    """Submit labels in adaptively sized, concurrent batches and resubmit retryable rejections"""
+
+    def __init__(self, client: YiDiDaClient, workers: int = 4, sizer: Optional[AdaptiveBatchSize] = None,
+                 max_attempts: int = 3, retry_codes: Sequence[int] = RETRY_CODES,
+                 retry_keywords: Sequence[str] = RETRY_KEYWORDS, retry_delay: float = 2.0,
+                 slots: Optional[threading.Semaphore] = None):
+        """
+        Args:
+            client: Logged-in YiDiDaClient (its session is shared by all workers)
+            workers: Number of batches in flight at once
+            sizer: Batch size controller (default: AdaptiveBatchSize())
+            max_attempts: Submissions per order, counting the first one
+            retry_codes: Codes that make a rejection retryable
+            retry_keywords: Message fragments (case-insensitive) that make a rejection retryable
+            retry_delay: Seconds to wait before a resubmission round, doubled every round
+            slots: Semaphore shared by several executors, bounding their requests in flight together
+        """
+        self.client = client
+        self.workers = workers
+        self.sizer = sizer or AdaptiveBatchSize()
+        self.max_attempts = max(1, max_attempts)
+        self.retry_codes = set(retry_codes)
+        self.retry_keywords = tuple(keyword.lower() for keyword in retry_keywords)
+        self.retry_delay = retry_delay
+        self.slots = slots
+        self.stats = {"batches": 0, "resubmitted": 0, "rounds": 0}
+
+    @classmethod
+    def from_config(cls, client: YiDiDaClient, config: Dict, workers: int = 4, batch_size: Optional[int] = None,
+                    slots: Optional[threading.Semaphore] = None) -> 'LabelBatchExecutor':
+        """
+        Build the executor from the optional "bulk" section of config.json, e.g.
+        "bulk": {"max_attempts": 3, "retry_delay": 2, "retry_codes": [429, 503]}
+        (see AdaptiveBatchSize.from_config for the batch size keys)
+        """
+        bulk_config = config.get("bulk", {})
+        return cls(
+            client,
+            workers=workers,
+            sizer=AdaptiveBatchSize.from_config(config, batch_size),
+            max_attempts=bulk_config.get("max_attempts", 3),
+            retry_codes=bulk_config.get("retry_codes", RETRY_CODES),
+            retry_keywords=bulk_config.get("retry_keywords", RETRY_KEYWORDS),
+            retry_delay=bulk_config.get("retry_delay", 2.0),
+            slots=slots
+        )
+
+    def classify(self, row: Dict, result: Optional[Dict], listed: Optional[Set] = None) -> str:
+        """
+        Outcome of one order
+
+        Args:
+            row: Per-order row from batch_results()
+            result: The batch's response body (None when the request failed)
+            listed: Order numbers present in the response data (computed when not given)
+
+        Returns:
+            ACCEPTED, RETRYABLE, PERMANENT or UNKNOWN
+        """
+        if is_accepted(row):
+            return ACCEPTED
+        # No response, or a response that skipped this order: it may exist upstream
+        if result is None or (row.get("zhuanDanHao") is None and row.get("code") is None):
+            return UNKNOWN
+        if listed is None:
+            listed = {item.get("keHuDanHao") for item in result.get("data") or []}
+        if row.get("keHuDanHao") not in listed and not _refused(result):
+            return UNKNOWN
+
+        message = str(row.get("message") or "").lower()
+        if row.get("code") in IN_DOUBT_CODES or any(keyword in message for keyword in IN_DOUBT_KEYWORDS):
+            return UNKNOWN
+        if row.get("code") in self.retry_codes or any(keyword in message for keyword in self.retry_keywords):
+            return RETRYABLE
+        return PERMANENT
+
+    def _batches(self, labels: Iterator[Dict], on_batch: Optional[Callable[[List[Dict]], None]]) -> Iterator[List[Dict]]:
+        """Cut batches at the controller's current size as they are pulled"""
+        while True:
+            batch = list(islice(labels, self.sizer.size))
+            if not batch:
+                return
+            self.stats["batches"] += 1
+            if on_batch is not None:
+                on_batch(batch)
+            yield batch
+
+    def run(self, labels: Iterable[Dict], on_batch: Optional[Callable[[List[Dict]], None]] = None,
+            before_submit: Optional[Callable[[List[Dict]], Optional[List[Dict]]]] = None,
+            on_response: Optional[Callable[[List[Dict], Optional[Dict], List[Dict], List[str]], None]] = None
+            ) -> Iterator[Tuple[Dict, str]]:
+        """
+        Submit every label and yield each order's final outcome
+
+        Orders rejected as retryable are held back and resubmitted in the next round (up to
+        max_attempts submissions); all other outcomes are final and yielded as their batch returns.
+
+        Args:
+            labels: Label requests (read lazily)
+            on_batch: Called from this thread with each batch as it is cut, before it is submitted
+            before_submit: Called from the worker thread right before the request leaves; may return
+                           the labels of the batch to send, the others are yielded as WITHHELD
+            on_response: Called from this thread with (sent labels, response or None, rows, outcomes)
+                         for every request, including rounds whose retryable orders are resent
+
+        Yields:
+            (result row, outcome) per order
+        """
+        def submit(batch):
+            if self.slots is None:
+                return send(batch)
+            # Claim and send while holding the slot, so a claimed order never waits for one
+            with self.slots:
+                return send(batch)
+
+        def send(batch):
+            if before_submit is not None:
+                sent = before_submit(batch)
+                if sent is not None:
+                    batch = sent
+            if not batch:
+                return batch, None, 0.0
+            started = time.perf_counter()
+            result = self.client.create_labels(batch)
+            return batch, result, time.perf_counter() - started
+
+        pending = iter(labels)
+        attempt = 1
+        while True:
+            self.stats["rounds"] += 1
+            retry = []
+            for cut, (batch, result, latency) in bounded_map(submit, self._batches(pending, on_batch), self.workers):
+                if len(batch) < len(cut):
+                    sent = {id(label) for label in batch}
+                    for label in cut:
+                        if id(label) not in sent:
+                            yield {"keHuDanHao": label.get("keHuDanHao"), "zhuanDanHao": None, "code": None,
+                                   "message": "In flight elsewhere, not sent"}, WITHHELD
+                if not batch:
+                    continue
+                rows = batch_results(batch, result)
+                listed = {item.get("keHuDanHao") for item in result.get("data") or []} if result else set()
+                outcomes = [self.classify(row, result, listed) for row in rows]
+                errors = sum(1 for outcome in outcomes if outcome in (RETRYABLE, UNKNOWN))
+                previous = self.sizer.size
+                if self.sizer.observe(len(batch), latency, errors) != previous:
+                    logger.info(f"Batch size {previous} -> {self.sizer.size} "
+                                f"({len(batch)} orders in {latency:.1f}s, {errors} failed)")
+                if on_response is not None:
+                    on_response(batch, result, rows, outcomes)
+
+                for label, row, outcome in zip(batch, rows, outcomes):
+                    if outcome == RETRYABLE and attempt < self.max_attempts:
+                        retry.append(label)
+                    else:
+                        yield row, outcome
+
+            if not retry:
+                return
+            delay = self.retry_delay * 2 ** (attempt - 1)
+            logger.warning(f"⚠ Resubmitting {len(retry)} order(s) rejected as retryable in {delay:.0f}s "
+                           f"(attempt {attempt + 1}/{self.max_attempts})")
+            time.sleep(delay)
+            self.stats["resubmitted"] += len(retry)
+            pending = iter(retry)
+            attempt += 1
@@ -0,0 +1,476 @@
+"""Bulk label creation: stream orders from CSV/JSONL and submit them in concurrent batches"""
+from yidida_client import YiDiDaClient, iter_chunks
+from yidida_context import AppContext
+from yidida_store import ResponseStore
+from yidida_journal import CONFIRMED, REJECTED, SUBMIT_GRACE, SUBMITTED, LabelJournal
+from yidida_pool import ClientPool
+from modules.batch_executor import ACCEPTED, UNKNOWN, WITHHELD, AdaptiveBatchSize, LabelBatchExecutor
+from modules.label_documents import download_label_documents, iter_stored_label_items
+import csv
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, TextIO, Union
+
+logger = logging.getLogger(__name__)
+
+
+def iter_order_rows(orders_path: str) -> Iterator[Dict]:
+    """
+    Stream order rows from a CSV or JSONL file, one row at a time
+
+    CSV columns may use dotted paths for nested fields (e.g. danJianList.0.shiZhong).
+    Empty CSV cells are skipped so the template value is kept.
+
+    Args:
+        orders_path: Path to a .csv, .jsonl or .ndjson file
+
+    Yields:
+        Order dictionaries (flat for CSV, nested for JSONL)
+    """
+    is_csv = orders_path.lower().endswith(".csv")
+
+    with open(orders_path, 'r', encoding='utf-8-sig', newline='') as f:
+        if is_csv:
+            for row in csv.DictReader(f):
+                yield {key: value for key, value in row.items() if key and value not in (None, "")}
+        else:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError as e:
+                    logger.error(f"✗ Skipping invalid JSON on line {line_no}: {e}")
+
+
+def _coerce_value(value: Any, template_value: Any) -> Any:
+    """Convert a CSV string to the type of the template field it replaces"""
+    if not isinstance(value, str):
+        return value
+
+    try:
+        if isinstance(template_value, bool):
+            return value.strip().lower() in ("1", "true", "yes", "y")
+        if isinstance(template_value, int):
+            number = float(value)
+            return int(number) if number.is_integer() else number
+        if isinstance(template_value, float):
+            return float(value)
+    except ValueError:
+        pass
+    return value
+
+
+def _writable_child(parent, key, copied: Set[int]):
+    """Return parent[key], replacing it with a shallow copy the first time it is written to"""
+    child = parent[key]
+    if id(child) not in copied:
+        child = dict(child) if isinstance(child, dict) else list(child)
+        parent[key] = child
+        copied.add(id(child))
+    return child
+
+
+def _set_path(target: Dict, path: str, value: Any, copied: Set[int]):
+    """Set a dotted path (list indexes allowed) on a nested structure, coercing to the existing type"""
+    keys = path.split('.')
+    node = target
+    for key in keys[:-1]:
+        if isinstance(node, list):
+            node = _writable_child(node, int(key), copied)
+        else:
+            if not isinstance(node.get(key), (dict, list)):
+                node[key] = {}
+                copied.add(id(node[key]))
+            node = _writable_child(node, key, copied)
+
+    last = keys[-1]
+    if isinstance(node, list):
+        index = int(last)
+        node[index] = _coerce_value(value, node[index])
+    else:
+        node[last] = _coerce_value(value, node.get(last))
+
+
+def _deep_merge(target: Dict, overrides: Dict, copied: Set[int]):
+    """Merge nested overrides into target (dicts merge, everything else replaces)"""
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            _deep_merge(_writable_child(target, key, copied), value, copied)
+        else:
+            target[key] = value
+
+
+def merge_order(base_label: Dict, row: Dict) -> Dict:
+    """
+    Build one label request by applying an order row on top of the base label
+
+    Only the containers an order actually changes are copied; everything else is
+    shared with base_label, so neither the base nor the result should be mutated in place.
+
+    Args:
+        base_label: Rendered label template (left untouched)
+        row: Order row from iter_order_rows()
+
+    Returns:
+        New label request dictionary
+    """
+    label = dict(base_label)
+    copied = {id(label)}
+    for key, value in row.items():
+        if '.' in key:
+            _set_path(label, key, value, copied)
+        elif isinstance(value, dict) and isinstance(label.get(key), dict):
+            _deep_merge(_writable_child(label, key, copied), value, copied)
+        else:
+            label[key] = _coerce_value(value, label.get(key))
+    return label
+
+
+def row_writer(results_file: Optional[TextIO], on_row: Optional[Callable[[Dict], None]] = None
+               ) -> Callable[[Dict], None]:
+    """
+    Build the function that reports one per-order result row
+
+    Args:
+        results_file: Open text file receiving one JSON line per order (None when on_row is given)
+        on_row: Called with each row instead of writing it to results_file
+
+    Returns:
+        write_row(row)
+    """
+    if on_row is not None:
+        return on_row
+
+    def write_row(row: Dict):
+        results_file.write(json.dumps(row, ensure_ascii=False) + "\n")
+        results_file.flush()
+    return write_row
+
+
+def iter_labels(orders: Union[str, Iterable[Dict]], base_label: Dict, write_row: Callable[[Dict], None],
+                summary: Dict[str, int], preflight: Optional[Dict] = None) -> Iterator[Dict]:
+    """
+    Read order rows lazily into the label requests worth sending
+
+    A repeated keHuDanHao is reported as a duplicate (counted in summary["duplicates"]) and, with
+    preflight limits, a label that fails local validation is reported and counted in summary["invalid"].
+
+    Args:
+        orders: Path to the CSV/JSONL order file, or an iterable of order rows
+        base_label: Rendered label template each order row is merged onto
+        write_row: Receives the result row of every order that is not yielded
+        summary: Counters updated in place
+        preflight: Limit overrides for modules/label_validator.py, or None to skip validation
+
+    Returns:
+        Iterator of label request dictionaries
+    """
+    rows = iter_order_rows(orders) if isinstance(orders, str) else orders
+    labels = _unique((merge_order(base_label, row) for row in rows), write_row, summary)
+    if preflight is not None:
+        labels = _screened(labels, write_row, summary, preflight)
+    return labels
+
+
+def _unique(labels: Iterable[Dict], write_row: Callable[[Dict], None], summary: Dict[str, int]) -> Iterator[Dict]:
+    """Yield each keHuDanHao once, reporting the repeats"""
+    seen = set()
+    for label in labels:
+        order_no = label.get("keHuDanHao")
+        if order_no in seen:
+            summary["duplicates"] += 1
+            write_row({"keHuDanHao": order_no, "code": None, "message": "Duplicate keHuDanHao in this run, not sent"})
+            continue
+        if order_no:
+            seen.add(order_no)
+        yield label
+
+
+def _screened(labels: Iterable[Dict], write_row: Callable[[Dict], None], summary: Dict[str, int],
+              preflight: Dict) -> Iterator[Dict]:
+    """Yield the labels that pass pre-flight validation, reporting the others"""
+    from modules.label_validator import preflight_row, screen_labels
+    for label, errors in screen_labels(labels, **preflight):
+        if errors:
+            summary["invalid"] += 1
+            write_row(preflight_row(label, errors))
+        else:
+            yield label
+
+
+def _order_numbers(labels: Iterable[Dict]) -> List[str]:
+    return [label["keHuDanHao"] for label in labels if label.get("keHuDanHao")]
+
+
+class JournalBookkeeping:
+    """
+    The label journal steps of one bulk run: skip, mark pending, claim, record outcomes
+
+    Without a journal every step lets all labels through and records nothing.
+    """
+
+    def __init__(self, journal: Optional[LabelJournal], job: Optional[str], write_row: Callable[[Dict], None],
+                 summary: Dict[str, int]):
+        """
+        Args:
+            journal: Label journal, or None to send every order
+            job: Job name recorded in the journal
+            write_row: Receives the result row of every order the journal skips
+            summary: Counters updated in place (skipped, in_doubt)
+        """
+        self.journal = journal
+        self.job = job
+        self.write_row = write_row
+        self.summary = summary
+
+    def unsent(self, labels: Iterable[Dict]) -> Iterator[Dict]:
+        """Yield only orders never sent or rejected before; one indexed lookup per 500 orders"""
+        if self.journal is None:
+            yield from labels
+            return
+
+        for chunk in iter_chunks(labels, 500):
+            states = self.journal.states(_order_numbers(chunk))
+            for label in chunk:
+                state = states.get(label.get("keHuDanHao"))
+                if state == CONFIRMED:
+                    self.summary["skipped"] += 1
+                    self.write_row({"keHuDanHao": label["keHuDanHao"], "code": None,
+                                    "message": "Already confirmed, skipped", "journal": CONFIRMED})
+                elif state == SUBMITTED:
+                    self.summary["in_doubt"] += 1
+                    self.write_row({"keHuDanHao": label["keHuDanHao"], "code": None,
+                                    "message": "Sent by an earlier run with unknown outcome, not resent",
+                                    "journal": SUBMITTED})
+                else:
+                    yield label
+
+    def mark_pending(self, batch: List[Dict]):
+        """Record the orders of a batch as it is cut"""
+        if self.journal is not None:
+            self.journal.mark_pending(_order_numbers(batch), self.job)
+
+    def claim(self, batch: List[Dict]) -> List[Dict]:
+        """The labels of a batch to send: the state read in unsent() may be stale, so only those claimed now"""
+        if self.journal is None:
+            return batch
+        claimed = self.journal.mark_submitted(_order_numbers(batch), self.job)
+        return [label for label in batch if not label.get("keHuDanHao") or label["keHuDanHao"] in claimed]
+
+    def record(self, rows: List[Dict], outcomes: List[str]):
+        """Store final outcomes; orders without an answer stay submitted (in doubt)"""
+        if self.journal is not None:
+            self.journal.record_outcomes([dict(row, state=CONFIRMED if outcome == ACCEPTED else REJECTED)
+                                          for row, outcome in zip(rows, outcomes) if outcome != UNKNOWN])
+
+
+def bulk_create_labels(client: YiDiDaClient, orders: Union[str, Iterable[Dict]], base_label: Dict,
+                       results_file: Optional[TextIO], batch_size: int = 50, workers: int = 4,
+                       store: Optional[ResponseStore] = None, journal: Optional[LabelJournal] = None,
+                       job: Optional[str] = None, on_row: Optional[Callable[[Dict], None]] = None,
+                       preflight: Optional[Dict] = None,
+                       executor: Optional[LabelBatchExecutor] = None,
+                       response_ids: Optional[List[int]] = None) -> Dict[str, int]:
+    """
+    Create labels for every order in a CSV/JSONL file (or row iterable) using concurrent batched requests
+
+    Orders are read lazily and at most `workers * 2` batches are held in memory at once.
+    Each order's outcome is written to `results_file` as one JSON line as soon as its batch returns
+    (or, for orders skipped by the journal, as soon as they are read).
+
+    With a journal, orders already confirmed or still in doubt are skipped, and every order is
+    claimed (marked submitted) before its request leaves, so the same file can be rerun after a
+    crash and runs sharing the journal never send the same order twice: an order another run
+    claimed first is reported as withheld. Call journal.recover() first to resolve orders left
+    in doubt by the previous run. An order number repeated within the run is only sent once.
+
+    Each order's own code decides its outcome (modules/batch_executor.py): orders refused for a
+    transient reason are resubmitted by the executor, permanent rejections are final, and orders
+    without an answer stay in doubt. The batch size adapts to the observed latency and error rate.
+
+    Args:
+        client: Logged-in YiDiDaClient (its session is shared by all workers)
+        orders: Path to the CSV/JSONL order file, or an iterable of order rows
+        base_label: Rendered label template each order row is merged onto
+        results_file: Open text file receiving one JSON line per order (None when on_row is given)
+        batch_size: Labels per /yundans/ request to start with (adapted while running)
+        workers: Number of batches in flight at once
+        store: Response store receiving every batch response (optional)
+        journal: Label journal for exactly-once submission across restarts (optional)
+        job: Job name recorded in the journal (e.g. the orders file)
+        on_row: Called with each per-order result row instead of writing it to results_file.
+                Rows for orders skipped or withheld by the journal carry "journal": CONFIRMED or SUBMITTED
+        preflight: Validate labels locally before sending them (modules/label_validator.py, needs
+                   numpy): limit overrides, or {} for the defaults. Orders that fail get a result
+                   row with code "PREFLIGHT" and are never sent
+        executor: Batch executor (default: LabelBatchExecutor with an adaptive size starting at batch_size)
+        response_ids: Receives the store id of every batch response saved by this run
+
+    Returns:
+        Summary counters: orders, batches, accepted, rejected, skipped (already confirmed),
+        in_doubt (sent by an earlier run with unknown outcome, not resent), withheld (claimed by another
+        run while this one was about to send it), duplicates (order number repeated in this run, not sent),
+        invalid (failed pre-flight), resubmitted (retryable rejections sent again),
+        min_batch_size / max_batch_size (range used)
+    """
+    summary = {"orders": 0, "batches": 0, "accepted": 0, "rejected": 0, "skipped": 0, "in_doubt": 0, "withheld": 0,
+               "duplicates": 0, "invalid": 0, "resubmitted": 0}
+    executor = executor or LabelBatchExecutor(client, workers, AdaptiveBatchSize(batch_size))
+    # Rows are only written from this thread: the labels are read inside the executor loop below
+    write_row = row_writer(results_file, on_row)
+    bookkeeping = JournalBookkeeping(journal, job, write_row, summary)
+
+    def counted(labels: Iterable[Dict]) -> Iterator[Dict]:
+        for label in labels:
+            summary["orders"] += 1
+            yield label
+
+    def on_batch(batch):
+        summary["batches"] += 1
+        bookkeeping.mark_pending(batch)
+        logger.info(f"Submitting batch {summary['batches']} ({len(batch)} orders)")
+
+    def on_response(batch, result, rows, outcomes):
+        if store is not None and result is not None:
+            response_id = store.save("label", result, request=batch)
+            if response_ids is not None:
+                response_ids.append(response_id)
+        bookkeeping.record(rows, outcomes)
+
+    labels = counted(bookkeeping.unsent(iter_labels(orders, base_label, write_row, summary, preflight)))
+    # Results are written as each order's outcome becomes final
+    for row, outcome in executor.run(labels, on_batch, bookkeeping.claim, on_response):
+        if outcome == WITHHELD:
+            row["journal"] = SUBMITTED
+            summary["withheld"] += 1
+        else:
+            summary["accepted" if outcome == ACCEPTED else "rejected"] += 1
+        write_row(row)
+
+    summary["resubmitted"] = executor.stats["resubmitted"]
+    summary["min_batch_size"] = executor.sizer.smallest
+    summary["max_batch_size"] = executor.sizer.largest
+    return summary
+
+
+def bulk_create_labels_module(orders_path: str, batch_size: Optional[int] = None, workers: Optional[int] = None,
+                              download_labels: bool = False, context: Optional[AppContext] = None,
+                              preflight: bool = False):
+    """Bulk mode of Module 1: create labels for every order in a CSV/JSONL file"""
+    print("\n" + "=" * 60)
+    print("MODULE 1: Bulk Shipping Label Creator")
+    print("=" * 60)
+    print()
+
+    # Load configuration
+    logger.info("Loading configuration...")
+    context = context or AppContext()
+    config = context.config
+    bulk_config = config.get("bulk", {})
+    workers = workers or bulk_config.get("workers", 4)
+
+    # Login, with enough pooled connections for every worker
+    logger.info("Attempting to login...")
+    client = context.login(pool_maxsize=workers)
+    if client is None:
+        logger.error("Failed to login. Please check your credentials in config.json")
+        return False
+
+    logger.info("Login successful")
+    executor = LabelBatchExecutor.from_config(client, config, workers, batch_size)
+    sizer = executor.sizer
+
+    # The first label of the template is the base every order row is merged onto
+    template = YiDiDaClient.load_label_template("templates/label_template.json", config)
+    base_label = template[0]
+
+    # Resolve orders a previous, interrupted run of this file sent without recording the outcome;
+    # another run of the same file may still be sending, so only marks older than SUBMIT_GRACE
+    journal = LabelJournal.from_config(config)
+    job = os.path.abspath(orders_path)
+    recovered = journal.recover(client, workers, job=job, min_age=SUBMIT_GRACE)
+    if recovered["checked"]:
+        logger.info(
+            f"In-doubt orders: {recovered['confirmed']} confirmed, {recovered['pending']} to resubmit, "
+            f"{recovered['unresolved']} unresolved"
+        )
+    job_counts = journal.counts(job)
+
+    # Local validation before upload: --preflight or "preflight": {"enabled": true}
+    preflight_limits = None
+    if preflight or config.get("preflight", {}).get("enabled", False):
+        from modules.label_validator import preflight_limits as configured_limits
+        preflight_limits = configured_limits(config)
+
+    print("\nBulk Label Job:")
+    print(f"  - Orders file: {orders_path}")
+    print(f"  - Batch size: {sizer.size}" + (f" (adapts between {sizer.minimum} and {sizer.maximum})"
+                                             if sizer.adaptive else ""))
+    print(f"  - Retryable rejections: resubmitted up to {executor.max_attempts - 1} time(s)")
+    print(f"  - Concurrent batches: {workers}")
+    print(f"  - Pre-flight validation: {'on' if preflight_limits is not None else 'off'}")
+    if job_counts:
+        print(f"  - Journal: {', '.join(f'{count} {state}' for state, count in sorted(job_counts.items()))} "
+              f"(confirmed orders are skipped)")
+    print()
+    confirm = input("Do you want to create labels for all orders in this file? (yes/no): ").strip().lower()
+
+    if confirm not in ['yes', 'y']:
+        logger.info("Bulk label creation cancelled by user")
+        return False
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = f"output/bulk_labels_{timestamp}.jsonl"
+    store = context.store()
+    # Only this run's responses: other processes may be saving label responses to the same store
+    response_ids = []
+    with open(filename, "w", encoding="utf-8") as results_file:
+        summary = bulk_create_labels(client, orders_path, base_label, results_file, sizer.size, workers, store,
+                                     journal, job, preflight=preflight_limits, executor=executor,
+                                     response_ids=response_ids)
+
+    logger.info(
+        f"Bulk run finished: {summary['orders']} order(s) in {summary['batches']} batch(es), "
+        f"{summary['accepted']} accepted, {summary['rejected']} rejected, "
+        f"{summary['skipped']} already confirmed, {summary['in_doubt']} in doubt, "
+        f"{summary['withheld']} in flight elsewhere, {summary['duplicates']} duplicate(s)"
+        + (f", {summary['invalid']} failed pre-flight (not sent)" if preflight_limits is not None else "")
+    )
+    logger.info(
+        f"Batch size ranged {summary['min_batch_size']}-{summary['max_batch_size']} "
+        f"({sizer.increases} increase(s), {sizer.decreases} decrease(s)), "
+        f"{summary['resubmitted']} retryable rejection(s) resubmitted"
+    )
+
+    # Requests that failed without a response leave their orders in doubt. The server may still be
+    # creating them, so they are only reported here; a rerun looks them up once they are old enough
+    in_doubt = journal.in_doubt(job)
+    if in_doubt:
+        logger.warning(
+            f"⚠ {len(in_doubt)} order(s) of this file sent without a response are in doubt; "
+            f"rerun the file after {SUBMIT_GRACE // 60} minutes to look them up"
+        )
+    logger.info(f"Per-order results saved to {filename}, full responses to {store.path}")
+
+    # Fetch or decode this wave's label documents, streamed back from the response store
+    documents_config = config.get("label_documents", {})
+    if download_labels or documents_config.get("enabled", False):
+        output_dir = documents_config.get("output_dir", "output/labels")
+        bundle_path = os.path.join(output_dir, f"wave_{timestamp}.zip") if documents_config.get("bundle", True) else None
+        download_label_documents(
+            iter_stored_label_items(store, response_ids=response_ids),
+            os.path.join(output_dir, f"wave_{timestamp}"),
+            workers=documents_config.get("workers", 8),
+            bundle_path=bundle_path
+        )
+
+    latency = client.metrics.snapshot()["endpoints"].get(YiDiDaClient.LABELS_ENDPOINT, {}).get("latency", {})
+    if latency.get("p50") is not None:
+        logger.info(f"/yundans/ latency: p50 {latency['p50']:.2f}s, p95 {latency['p95']:.2f}s, p99 {latency['p99']:.2f}s")
+    if isinstance(client, ClientPool):
+        client.log_stats()
+    return summary["rejected"] == 0 and summary["invalid"] == 0
@@ -0,0 +1,376 @@
+"""
+Local HTTP gateway: one long-running process holds the logged-in client for every internal app
+
+    python main.py serve [--host 127.0.0.1] [--port 8808] [--concurrency 16]
+
+Every caller shares one token, one connection pool, the quote and address caches, the rate
+limiter, price single-flight and tracking micro-batching, instead of each app logging in and
+holding its own session. JSON in, JSON out; bulk requests (a JSON array, or an NDJSON body)
+stream back NDJSON, one line per item as soon as it completes:
+
+    GET  /health              token age, uptime, requests in flight
+    GET  /stats               gateway, upstream endpoint, cache and coalescing counters
+    GET  /metrics             upstream endpoint metrics in Prometheus text format
+    POST /labels              order row -> result row;  rows -> streamed result rows
+    POST /price               price parameters -> {"ok", "data"};  list -> streamed {"index", "ok", "data"}
+    GET  /track/{order_no}    tracking record (batched with concurrent lookups)
+    POST /track               order numbers -> streamed {"order", "ok", "record"}
+"""
+from yidida_client import YiDiDaClient
+from yidida_coalesce import TrackingBatcher, TrackingLookupError
+from yidida_context import AppContext
+from yidida_journal import CONFIRMED, SUBMIT_GRACE, LabelJournal
+from modules.batch_cli import EXIT_FAILED, EXIT_OK, _order_numbers
+from modules.batch_executor import LabelBatchExecutor, is_accepted
+from modules.bulk_labels import bulk_create_labels, merge_order
+from aiohttp import web
+import asyncio
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+NDJSON = "application/x-ndjson"
+_END = object()
+
+
+class Gateway:
+    """
+    aiohttp application around one shared client
+
+    Price and tracking calls run on a thread pool of `concurrency` threads, which bounds the
+    upstream requests in flight for all callers together; label requests run through the bulk
+    label path (label journal, adaptive batches), and all of them together keep at most
+    `label_workers` /yundans/ batches in flight.
+    """
+
+    def __init__(self, client: YiDiDaClient, context: AppContext, concurrency: int = 16, label_workers: int = 4,
+                 label_batch_size: int = 10, api_key: Optional[str] = None, max_body_mb: float = 64):
+        """
+        Args:
+            client: Logged-in YiDiDaClient or ClientPool shared by every request
+            context: AppContext (config, response store)
+            concurrency: Price/tracking calls in flight upstream at once
+            label_workers: /yundans/ batches in flight at once, across all label requests
+            label_batch_size: Labels per /yundans/ request to start with for bulk label requests
+            api_key: When set, callers must send it in the X-API-Key header (/health excepted)
+            max_body_mb: Largest request body accepted
+        """
+        self.client = client
+        self.context = context
+        self.concurrency = concurrency
+        self.label_workers = label_workers
+        self.label_batch_size = label_batch_size
+        self.api_key = api_key
+        self.max_body_mb = max_body_mb
+        config = context.config
+        self.base_label = YiDiDaClient.load_label_template("templates/label_template.json", config)[0]
+        self.base_price = YiDiDaClient.load_price_template("templates/price_template.json", config)
+        self.journal = LabelJournal.from_config(config)
+        self.store = context.store()
+        self.batcher = TrackingBatcher.from_config(client, config)
+        self.preflight = None
+        if config.get("preflight", {}).get("enabled", False):
+            from modules.label_validator import preflight_limits
+            self.preflight = preflight_limits(config)
+        self._upstream = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="gateway-upstream")
+        # Label requests run side by side; the shared slots bound their /yundans/ calls together
+        self._labels = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="gateway-labels")
+        self._label_slots = threading.BoundedSemaphore(label_workers)
+        self._sweeper: Optional[asyncio.Task] = None
+        self.started_at = time.time()
+        self.counts = {"requests": 0, "in_flight": 0, "errors": 0, "items": 0}
+
+    @classmethod
+    def from_config(cls, client: YiDiDaClient, context: AppContext, concurrency: Optional[int] = None) -> "Gateway":
+        """
+        Build the gateway from the optional "gateway" section of config.json
+
+        Example:
+            "gateway": {"host": "127.0.0.1", "port": 8808, "concurrency": 16, "label_workers": 4,
+                        "label_batch_size": 10, "api_key": null, "max_body_mb": 64}
+        """
+        gateway_config = context.config.get("gateway", {})
+        return cls(
+            client,
+            context,
+            concurrency=concurrency or gateway_config.get("concurrency", 16),
+            label_workers=gateway_config.get("label_workers", 4),
+            label_batch_size=gateway_config.get("label_batch_size", 10),
+            api_key=gateway_config.get("api_key"),
+            max_body_mb=gateway_config.get("max_body_mb", 64)
+        )
+
+    def app(self) -> web.Application:
+        app = web.Application(middlewares=[self._middleware], client_max_size=int(self.max_body_mb * 1024 * 1024))
+        app.add_routes([
+            web.get("/health", self.health),
+            web.get("/stats", self.stats),
+            web.get("/metrics", self.metrics),
+            web.post("/labels", self.labels),
+            web.post("/price", self.price),
+            web.get("/track/{order_no}", self.track_one),
+            web.post("/track", self.track),
+        ])
+        app.on_startup.append(self._start)
+        app.on_cleanup.append(self._close)
+        return app
+
+    async def _start(self, app: web.Application):
+        self._sweeper = asyncio.ensure_future(self._sweep())
+
+    async def _sweep(self):
+        """Settle gateway orders left in doubt once their mark is too old to belong to a live request"""
+        while True:
+            await asyncio.sleep(SUBMIT_GRACE / 2)
+            try:
+                await self._call(self.recover)
+            except Exception as e:
+                logger.warning(f"⚠ In-doubt sweep failed: {e}")
+
+    async def _close(self, app: web.Application):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+        self.batcher.close()
+        self._upstream.shutdown(wait=True)
+        self._labels.shutdown(wait=True)
+        if hasattr(self.client, "log_stats"):
+            self.client.log_stats()
+
+    @web.middleware
+    async def _middleware(self, request: web.Request, handler):
+        if self.api_key and request.path != "/health" and request.headers.get("X-API-Key") != self.api_key:
+            return web.json_response({"ok": False, "error": "Missing or wrong X-API-Key"}, status=401)
+        self.counts["requests"] += 1
+        self.counts["in_flight"] += 1
+        try:
+            return await handler(request)
+        except web.HTTPException:
+            raise
+        except Exception as e:
+            self.counts["errors"] += 1
+            logger.exception(f"✗ {request.method} {request.path} failed")
+            return web.json_response({"ok": False, "error": str(e)}, status=500)
+        finally:
+            self.counts["in_flight"] -= 1
+
+    async def _call(self, fn: Callable, *args) -> Any:
+        """Run a blocking client call on the upstream pool"""
+        return await asyncio.get_running_loop().run_in_executor(self._upstream, fn, *args)
+
+    @staticmethod
+    def _bad_request(message: str) -> web.HTTPBadRequest:
+        return web.HTTPBadRequest(text=json.dumps({"ok": False, "error": message}), content_type="application/json")
+
+    async def _items(self, request: web.Request) -> Tuple[bool, List[Any]]:
+        """
+        Parse a request body
+
+        Returns:
+            (bulk, items): a JSON array or NDJSON body is bulk; any other JSON value is one item
+        """
+        body = await request.read()
+        try:
+            if request.content_type == NDJSON:
+                return True, [json.loads(line) for line in body.splitlines() if line.strip()]
+            value = json.loads(body or b"null")
+        except ValueError as e:
+            raise self._bad_request(f"Invalid JSON: {e}")
+        if value is None:
+            raise self._bad_request("Empty body")
+        return (True, value) if isinstance(value, list) else (False, [value])
+
+    async def _stream(self, request: web.Request, rows: AsyncIterator[Dict]) -> web.StreamResponse:
+        """
+        Write each row as one NDJSON line as soon as it is produced
+
+        The status line is already sent, so a failure part-way ends the stream with an
+        {"ok": false, "error"} line instead.
+        """
+        def line(row: Dict) -> bytes:
+            return (json.dumps(row, ensure_ascii=False, separators=(',', ':')) + "\n").encode('utf-8')
+
+        response = web.StreamResponse(headers={"Content-Type": NDJSON})
+        await response.prepare(request)
+        try:
+            async for row in rows:
+                self.counts["items"] += 1
+                await response.write(line(row))
+        except (ConnectionResetError, asyncio.CancelledError):
+            raise
+        except Exception as e:
+            self.counts["errors"] += 1
+            logger.exception(f"✗ {request.method} {request.path} failed while streaming")
+            await response.write(line({"ok": False, "error": str(e)}))
+        await response.write_eof()
+        return response
+
+    async def _bounded(self, fn: Callable[[Any], Awaitable[Dict]], items: Iterable, limit: int) -> AsyncIterator[Dict]:
+        """Await fn(item) with at most `limit` pending per request, yielding results as they complete"""
+        items = iter(items)
+        pending = set()
+        try:
+            while True:
+                for item in items:
+                    pending.add(asyncio.ensure_future(fn(item)))
+                    if len(pending) >= limit:
+                        break
+                if not pending:
+                    return
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        finally:
+            # The caller went away: drop what has not started yet
+            for task in pending:
+                task.cancel()
+
+    async def health(self, request: web.Request) -> web.Response:
+        token_age = getattr(self.client, "token_age", None)
+        return web.json_response({"ok": bool(self.client.token), "token_age": token_age,
+                                  "uptime": time.time() - self.started_at, "in_flight": self.counts["in_flight"]})
+
+    async def stats(self, request: web.Request) -> web.Response:
+        stats = {
+            "gateway": dict(self.counts, uptime=time.time() - self.started_at, concurrency=self.concurrency,
+                            label_workers=self.label_workers),
+            "upstream": self.client.metrics.snapshot(),
+            "tracking_batcher": self.batcher.stats(),
+        }
+        for name in ("quote_cache", "address_cache", "price_flight"):
+            component = getattr(self.client, name, None)
+            if component is not None:
+                stats[name] = component.stats()
+        if hasattr(self.client, "accounts"):
+            stats["accounts"] = self.client.stats()
+        return web.json_response(stats)
+
+    async def metrics(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.client.metrics.to_prometheus(), content_type="text/plain")
+
+    async def price(self, request: web.Request) -> web.StreamResponse:
+        bulk, items = await self._items(request)
+
+        async def quote(indexed: Tuple[int, Any]) -> Dict:
+            index, params = indexed
+            if not isinstance(params, dict):
+                return {"index": index, "ok": False, "error": "Expected a JSON object"}
+            result = await self._call(self.client.query_price, merge_order(self.base_price, params))
+            if result is None:
+                return {"index": index, "ok": False, "error": "Price query failed"}
+            return {"index": index, "ok": True, "data": result.get("data")}
+
+        if not bulk:
+            row = await quote((0, items[0]))
+            row.pop("index")
+            return web.json_response(row, status=200 if row["ok"] else 502)
+        return await self._stream(request, self._bounded(quote, enumerate(items), self.concurrency))
+
+    async def _lookup(self, order_no: str) -> Dict:
+        try:
+            record = await asyncio.wrap_future(self.batcher.submit(order_no))
+        except TrackingLookupError as e:
+            return {"order": order_no, "ok": False, "error": str(e)}
+        if record is None:
+            return {"order": order_no, "ok": False, "error": "Not found"}
+        return {"order": order_no, "ok": True, "record": record}
+
+    async def track_one(self, request: web.Request) -> web.Response:
+        row = await self._lookup(request.match_info["order_no"])
+        status = 200 if row["ok"] else 404 if row["error"] == "Not found" else 502
+        return web.json_response(row, status=status)
+
+    async def track(self, request: web.Request) -> web.StreamResponse:
+        _, items = await self._items(request)
+        orders = list(dict.fromkeys(num for item in items for num in _order_numbers(item)))
+        if not orders:
+            raise self._bad_request("No order numbers")
+        # The batcher packs the lookups into 10-order requests (joined with other callers' lookups)
+        limit = self.concurrency * YiDiDaClient.MAX_ORDERS_PER_QUERY
+        return await self._stream(request, self._bounded(self._lookup, orders, limit))
+
+    async def labels(self, request: web.Request) -> web.StreamResponse:
+        bulk, items = await self._items(request)
+        rows = [item for item in items if isinstance(item, dict)]
+        if len(rows) != len(items):
+            raise self._bad_request("Expected order rows (JSON objects)")
+
+        loop = asyncio.get_running_loop()
+        results: asyncio.Queue = asyncio.Queue()
+
+        def on_row(row: Dict):
+            # An order confirmed by an earlier request counts as done
+            row["ok"] = is_accepted(row) or row.get("journal") == CONFIRMED
+            loop.call_soon_threadsafe(results.put_nowait, row)
+
+        def run():
+            try:
+                executor = LabelBatchExecutor.from_config(self.client, self.context.config, self.label_workers,
+                                                          self.label_batch_size, slots=self._label_slots)
+                bulk_create_labels(self.client, rows, self.base_label, None, self.label_batch_size,
+                                   self.label_workers, self.store, self.journal, job="gateway",
+                                   on_row=on_row, preflight=self.preflight, executor=executor)
+            finally:
+                loop.call_soon_threadsafe(results.put_nowait, _END)
+
+        done = loop.run_in_executor(self._labels, run)
+
+        async def produced() -> AsyncIterator[Dict]:
+            while True:
+                row = await results.get()
+                if row is _END:
+                    await done
+                    return
+                yield row
+
+        if not bulk:
+            rows_out = [row async for row in produced()]
+            return web.json_response(rows_out[0] if rows_out else {"ok": False, "error": "No result"})
+        return await self._stream(request, produced())
+
+    def recover(self):
+        """
+        Resolve label orders the gateway sent without an answer
+
+        Only orders gateway requests claimed, and only marks older than SUBMIT_GRACE: queue
+        workers and batch runs share the journal, and a younger mark may be a request in flight.
+        """
+        recovered = self.journal.recover(self.client, self.label_workers, job="gateway", min_age=SUBMIT_GRACE)
+        if recovered["checked"]:
+            logger.info(
+                f"In-doubt orders: {recovered['confirmed']} confirmed, {recovered['pending']} to resubmit, "
+                f"{recovered['unresolved']} unresolved"
+            )
+
+
+def serve_command(host: Optional[str] = None, port: Optional[int] = None, concurrency: Optional[int] = None,
+                  context: Optional[AppContext] = None) -> int:
+    """
+    Log in once and serve the gateway until Ctrl+C
+
+    Returns:
+        Process exit code
+    """
+    context = context or AppContext()
+    gateway_config = context.config.get("gateway", {})
+    concurrency = concurrency or gateway_config.get("concurrency", 16)
+
+    # One warm pool for every caller: upstream threads plus label batches
+    client = context.login(pool_maxsize=concurrency + gateway_config.get("label_workers", 4))
+    if client is None:
+        logger.error("Failed to login. Please check your credentials in config.json")
+        return EXIT_FAILED
+
+    gateway = Gateway.from_config(client, context, concurrency)
+    gateway.recover()
+    host = host or gateway_config.get("host", "127.0.0.1")
+    port = port or gateway_config.get("port", 8808)
+    logger.info(f"✓ Gateway listening on http://{host}:{port} ({concurrency} upstream calls in flight at most)")
+    web.run_app(gateway.app(), host=host, port=port, print=None,
+                access_log=logger if gateway_config.get("access_log", False) else None)
+    logger.info("Gateway stopped")
+    return EXIT_OK
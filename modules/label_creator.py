@@ -1,11 +1,12 @@
 """Module 1: Create shipping labels from template"""
 from yidida_client import YiDiDaClient
+from yidida_context import AppContext
 import json
 import logging
-from datetime import datetime
+from typing import Optional
 
 
-def create_labels_module():
+def create_labels_module(context: Optional[AppContext] = None):
     """Module 1: Create shipping labels from template"""
     logger = logging.getLogger(__name__)
     
@@ -16,18 +17,13 @@ def create_labels_module():
     
     # Load configuration
     print("Loading configuration...")
-    config = YiDiDaClient.load_config("config.json")
+    context = context or AppContext()
+    config = context.config
     
-    # Initialize client
-    client = YiDiDaClient(
-        base_url=config["api_base_url"],
-        username=config["credentials"]["username"],
-        password=config["credentials"]["password"]
-    )
-    
-    # Login
+    # Login (reuses the client of a module run earlier in this process)
     logger.info("Attempting to login...")
-    if not client.login():
+    client = context.login()
+    if client is None:
         logger.error("Failed to login. Please check your credentials in config.json")
         return False
     
@@ -42,7 +38,7 @@ def create_labels_module():
     print("\nLabel Request Summary:")
     for i, label in enumerate(label_requests, 1):
         print(f"  Label {i}:")
-        print(f"    - Customer: {config['credentials']['username']}")
+        print(f"    - Customer: {config.get('credentials', {}).get('username', 'account pool')}")
         print(f"    - Customer Order #: {label.get('keHuDanHao', 'N/A')}")
         print(f"    - Recipient: {label.get('shouJianRenXingMing', 'N/A')}")
         print(f"    - Address: {label.get('shouJianRenDiZhi1', 'N/A')}")
@@ -68,12 +64,10 @@ def create_labels_module():
         print("=" * 60)
         print(json.dumps(result, indent=2, ensure_ascii=False))
         
-        # Save response to file with timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"output/label_response_{timestamp}.json"
-        with open(filename, "w", encoding="utf-8") as f:
-            json.dump(result, f, indent=2, ensure_ascii=False)
-        logger.info(f"Response saved to {filename}")
+        # Append response to the indexed response store
+        store = context.store()
+        response_id = store.save("label", result, request=label_requests)
+        logger.info(f"Response saved to {store.path} (id {response_id})")
         return True
     else:
         logger.error("Failed to create labels")
@@ -0,0 +1,215 @@
+"""Label documents: download labelUrl files and decode inline base64 labels to disk, concurrently"""
+from yidida_client import bounded_map
+from yidida_policy import EndpointPolicy
+from yidida_store import ResponseStore
+import base64
+import binascii
+import logging
+import os
+import re
+import time
+import zipfile
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Statuses worth another download attempt
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_UNSAFE_FILENAME = re.compile(r'[^A-Za-z0-9._-]+')
+
+
+def iter_label_items(items: Iterable[Dict]) -> Iterator[Dict]:
+    """Keep /yundans/ data entries that carry a document (inline `label` or `labelUrl`)"""
+    for item in items:
+        if isinstance(item, dict) and (item.get("label") or item.get("labelUrl")):
+            yield item
+
+
+def iter_stored_label_items(store: ResponseStore, since: Optional[float] = None,
+                            response_ids: Optional[Iterable[int]] = None) -> Iterator[Dict]:
+    """
+    Stream label entries from the response store, one at a time
+
+    Args:
+        store: Response store
+        since: Only responses saved from this Unix time on (every process's)
+        response_ids: Only these responses (e.g. the ones a bulk run saved); overrides since
+    """
+    if response_ids is not None:
+        records = store.iter_response_records(response_ids)
+    else:
+        records = store.iter_records(kind="label", since=since)
+    return iter_label_items(record["item"] for record in records if record["kind"] == "label")
+
+
+def document_filename(item: Dict) -> str:
+    """<tracking number or order number>.<format>, safe for any file system"""
+    name = item.get("zhuanDanHao") or item.get("keHuDanHao") or item.get("waybillId") or "label"
+    extension = (item.get("format") or "pdf").lower()
+    return f"{_UNSAFE_FILENAME.sub('_', str(name))}.{_UNSAFE_FILENAME.sub('', extension) or 'pdf'}"
+
+
+def decode_base64_to_file(data: str, path: str, chunk_size: int = 64 * 1024) -> int:
+    """
+    Decode a base64 string to a file piece by piece
+
+    Whitespace and a data: URI prefix are allowed. Only one chunk of decoded bytes is
+    held at a time, so large documents do not need a second full-size copy in memory.
+
+    Returns:
+        Number of bytes written
+    """
+    if data.startswith("data:"):
+        data = data[data.find(",") + 1:]
+
+    step = max(4, chunk_size - chunk_size % 4)
+    written = 0
+    carry = ""
+    with open(path, 'wb') as f:
+        for start in range(0, len(data), step):
+            piece = carry + "".join(data[start:start + step].split())
+            usable = len(piece) - len(piece) % 4
+            carry = piece[usable:]
+            if usable:
+                written += f.write(base64.b64decode(piece[:usable], validate=True))
+        if carry:
+            # Unpadded tail
+            written += f.write(base64.b64decode(carry + "=" * (-len(carry) % 4), validate=True))
+    return written
+
+
+def download_to_file(session: requests.Session, url: str, path: str, policy: EndpointPolicy,
+                     chunk_size: int = 64 * 1024) -> int:
+    """
+    Stream a URL to a file, retrying transient failures with the policy's backoff
+
+    Returns:
+        Number of bytes written
+
+    Raises:
+        requests.RequestException: When every attempt failed
+    """
+    attempt = 1
+    while True:
+        try:
+            with session.get(url, stream=True, timeout=policy.timeout) as response:
+                if response.status_code in RETRY_STATUSES and attempt < policy.max_attempts:
+                    delay = policy.backoff(attempt, None)
+                    logger.warning(f"⚠ {url} returned HTTP {response.status_code}, retrying in {delay:.2f}s")
+                    time.sleep(delay)
+                    attempt += 1
+                    continue
+                response.raise_for_status()
+
+                written = 0
+                with open(path, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size):
+                        written += f.write(chunk)
+                return written
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt >= policy.max_attempts:
+                raise
+            delay = policy.backoff(attempt, None)
+            logger.warning(f"⚠ {url} failed ({type(e).__name__}), retrying in {delay:.2f}s")
+            time.sleep(delay)
+            attempt += 1
+
+
+def bundle_documents(paths: Iterable[str], zip_path: str) -> int:
+    """
+    Pack documents into one zip for the print station (stored, PDFs are already compressed)
+
+    Returns:
+        Number of files bundled
+    """
+    count = 0
+    with zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_STORED, allowZip64=True) as bundle:
+        for path in paths:
+            bundle.write(path, os.path.basename(path))
+            count += 1
+    return count
+
+
+def download_label_documents(items: Iterable[Dict], output_dir: str, workers: int = 8,
+                             session: Optional[requests.Session] = None, bundle_path: Optional[str] = None,
+                             chunk_size: int = 64 * 1024, policy: Optional[EndpointPolicy] = None) -> Dict:
+    """
+    Save the document of every label entry: decode inline `label` data, otherwise download `labelUrl`
+
+    Entries are consumed lazily and at most `workers * 2` are in flight, so a whole wave can
+    be streamed from the response store. Files are written to a temporary name and renamed
+    when complete, so an interrupted run never leaves a truncated document behind.
+
+    Args:
+        items: /yundans/ data entries (e.g. iter_stored_label_items(store, since))
+        output_dir: Directory receiving the documents
+        workers: Concurrent downloads (also the connection pool size)
+        session: Session for labelUrl downloads (a pooled one is created by default; it is
+                 separate from the API client's so the API token is never sent to other hosts)
+        bundle_path: Also pack every saved document into this zip file (optional)
+        chunk_size: Bytes per streamed read/write
+        policy: Timeout and retry rules for downloads (default 60s, 3 attempts)
+
+    Returns:
+        Stats: documents, downloaded, decoded, failed, bytes, seconds, documents_per_second,
+        megabytes_per_second, failures [{keHuDanHao, zhuanDanHao, error}], bundle
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    policy = policy or EndpointPolicy(timeout=60, max_attempts=3)
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+
+    def save(item: Dict) -> Dict:
+        path = os.path.join(output_dir, document_filename(item))
+        tmp_path = f"{path}.part"
+        try:
+            if item.get("label"):
+                size, source = decode_base64_to_file(item["label"], tmp_path, chunk_size), "decoded"
+            else:
+                size, source = download_to_file(session, item["labelUrl"], tmp_path, policy, chunk_size), "downloaded"
+            os.replace(tmp_path, path)
+            return {"path": path, "bytes": size, "source": source}
+        except (requests.RequestException, binascii.Error, ValueError, OSError) as e:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return {"error": f"{type(e).__name__}: {e}"}
+
+    stats = {"documents": 0, "downloaded": 0, "decoded": 0, "failed": 0, "bytes": 0, "failures": []}
+    saved_paths: List[str] = []
+    started = time.perf_counter()
+
+    for item, outcome in bounded_map(save, iter_label_items(items), workers):
+        stats["documents"] += 1
+        if "error" in outcome:
+            stats["failed"] += 1
+            stats["failures"].append({"keHuDanHao": item.get("keHuDanHao"), "zhuanDanHao": item.get("zhuanDanHao"),
+                                      "error": outcome["error"]})
+            logger.error(f"✗ Label document for {item.get('keHuDanHao')} failed: {outcome['error']}")
+            continue
+        stats[outcome["source"]] += 1
+        stats["bytes"] += outcome["bytes"]
+        saved_paths.append(outcome["path"])
+
+    elapsed = time.perf_counter() - started
+    stats["seconds"] = elapsed
+    stats["documents_per_second"] = stats["documents"] / elapsed if elapsed > 0 else 0.0
+    stats["megabytes_per_second"] = stats["bytes"] / (1024 * 1024) / elapsed if elapsed > 0 else 0.0
+
+    stats["bundle"] = None
+    if bundle_path and saved_paths:
+        bundle_documents(saved_paths, bundle_path)
+        stats["bundle"] = bundle_path
+        logger.info(f"✓ Bundled {len(saved_paths)} document(s) into {bundle_path}")
+
+    logger.info(
+        f"Label documents: {stats['downloaded']} downloaded, {stats['decoded']} decoded, {stats['failed']} failed, "
+        f"{stats['bytes'] / (1024 * 1024):.1f} MB in {elapsed:.1f}s ({stats['documents_per_second']:.1f} docs/s)"
+    )
+    return stats
@@ -0,0 +1,280 @@
+"""Pre-flight validation: screen rendered label requests column by column before they reach /yundans/"""
+from modules.bulk_labels import iter_order_rows, merge_order
+from yidida_client import YiDiDaClient, iter_chunks
+from yidida_context import AppContext
+import json
+import logging
+import time
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency, see requirements.txt
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# Message code written for orders rejected locally (never sent)
+PREFLIGHT_CODE = "PREFLIGHT"
+
+# Default carrier limits (UPS/FedEx ground parcels), in kg and cm
+DEFAULT_LIMITS = {
+    "volumetric_divisor": 5000,     # cm³ per kg
+    "max_piece_weight": 68.0,
+    "max_length": 274.0,
+    "max_length_girth": 419.0,      # longest side + 2 × (the other two)
+}
+
+# ZIP3 prefixes per state. A prefix listed under two states accepts both (first one is reported)
+ZIP3_RANGES = {
+    "AK": "995-999", "AL": "350-369", "AR": "716-729", "AZ": "850-865", "CA": "900-961", "CO": "800-816",
+    "CT": "060-069", "DC": "200,202-205,569", "DE": "197-199", "FL": "320-339,341-349", "GA": "300-319,398-399",
+    "HI": "967-968", "IA": "500-528", "ID": "832-838", "IL": "600-629", "IN": "460-479", "KS": "660-679",
+    "KY": "400-427", "LA": "700-714", "MA": "010-027,055", "MD": "206-219", "ME": "039-049", "MI": "480-499",
+    "MN": "550-567", "MO": "630-658", "MS": "386-397", "MT": "590-599", "NC": "270-289", "ND": "580-588",
+    "NE": "680-693", "NH": "030-038", "NJ": "070-089", "NM": "870-884", "NV": "889-898", "NY": "005,063,100-149",
+    "OH": "430-459", "OK": "730-749", "OR": "970-979", "PA": "150-196", "RI": "028-029", "SC": "290-299",
+    "SD": "570-577", "TN": "370-385", "TX": "750-799,885", "UT": "840-847", "VA": "201,220-246",
+    "VT": "050-054,056-059", "WA": "980-994", "WI": "530-549", "WV": "247-268", "WY": "820-831",
+    # Territories and military
+    "PR": "006-007,009", "VI": "008", "GU": "969", "MP": "969", "AS": "967", "AE": "090-098", "AA": "340",
+    "AP": "962-966",
+}
+
+
+def _require_numpy():
+    if np is None:
+        raise RuntimeError("Label pre-flight validation needs numpy: pip install numpy")
+
+
+@lru_cache(maxsize=1)
+def zip3_tables() -> Tuple["np.ndarray", "np.ndarray"]:
+    """(primary state, alternative state) per ZIP3 prefix 000-999; "" where unassigned"""
+    _require_numpy()
+    primary = np.full(1000, "", dtype="U2")
+    alternative = np.full(1000, "", dtype="U2")
+    for state, ranges in ZIP3_RANGES.items():
+        for part in ranges.split(","):
+            start, _, end = part.partition("-")
+            for prefix in range(int(start), int(end or start) + 1):
+                if primary[prefix]:
+                    alternative[prefix] = state
+                else:
+                    primary[prefix] = state
+    return primary, alternative
+
+
+def _to_float(value) -> float:
+    """Numeric field as float; missing or non-numeric values become NaN"""
+    if isinstance(value, bool) or value is None or value == "":
+        return float("nan")
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+def _floats(values: List) -> "np.ndarray":
+    try:
+        return np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        return np.array([_to_float(value) for value in values], dtype=np.float64)
+
+
+def label_columns(labels: Sequence[Dict]) -> Dict[str, "np.ndarray"]:
+    """
+    Columnar view of label requests: one array per field, pieces flattened with their row index
+
+    Returns:
+        postcode, state, country (one entry per label) and piece_row, chang, kuan, gao, shiZhong
+        (one entry per danJianList piece)
+    """
+    _require_numpy()
+
+    def text_column(field: str, width: int) -> "np.ndarray":
+        column = np.array([label.get(field) or "" for label in labels], dtype=f"U{width}")
+        return np.char.upper(np.char.strip(column))
+
+    piece_lists = [label.get("danJianList") or () for label in labels]
+    piece_counts = [len(label_pieces) for label_pieces in piece_lists]
+    pieces = [piece if isinstance(piece, dict) else {} for label_pieces in piece_lists for piece in label_pieces]
+    # One flat list per field: numbers are not tracked by the garbage collector, tuples would be
+    return {
+        "postcode": text_column("shouJianRenYouBian", 16),
+        "state": text_column("zhouMing", 8),
+        "country": text_column("guoJia", 4),
+        "piece_count": np.array(piece_counts, dtype=np.int32),
+        "piece_row": np.repeat(np.arange(len(piece_lists)), piece_counts),
+        **{field: _floats([piece.get(field) for piece in pieces]) for field in ("chang", "kuan", "gao", "shiZhong")}
+    }
+
+
+def validate_labels(labels: Sequence[Dict], **limits) -> Dict:
+    """
+    Check a batch of rendered label requests and compute their weights locally
+
+    Checks run over whole columns: recipient ZIP present and well formed (US: 12345 or
+    12345-6789), zhouMing matching the ZIP prefix, at least one piece, shiZhong > 0,
+    chang/kuan/gao > 0, and piece weight, length and length + girth within the limits.
+
+    Args:
+        labels: Rendered label requests (e.g. merge_order() results)
+        **limits: Overrides for DEFAULT_LIMITS (volumetric_divisor, max_piece_weight,
+                  max_length, max_length_girth)
+
+    Returns:
+        rows, invalid (count), errors (messages per label; an empty tuple when valid),
+        actual_weight, volumetric_weight, charge_weight (numpy arrays, kg per label;
+        charge weight is the sum over pieces of max(actual, volumetric)), seconds
+    """
+    started = time.perf_counter()
+    if len(labels) == 0:
+        # numpy's string functions cannot reduce over zero-size arrays
+        empty = np.zeros(0)
+        return {"rows": 0, "invalid": 0, "errors": [], "actual_weight": empty, "volumetric_weight": empty,
+                "charge_weight": empty, "seconds": time.perf_counter() - started}
+    settings = dict(DEFAULT_LIMITS, **limits)
+    columns = label_columns(labels)
+    rows = len(columns["postcode"])
+    # Only failing rows get a list
+    failures: Dict[int, List[str]] = {}
+
+    def report(mask, message):
+        for index in np.flatnonzero(mask).tolist():
+            failures.setdefault(index, []).append(message(index))
+
+    # Recipient ZIP and state (format and state checks only for US addresses)
+    postcode, state = columns["postcode"], columns["state"]
+    us = columns["country"] == "US"
+    missing_zip = np.char.str_len(postcode) == 0
+    report(missing_zip, lambda i: "missing shouJianRenYouBian")
+
+    zip5 = postcode.astype("U5")
+    digits = np.char.replace(postcode, "-", "")
+    hyphen = np.char.find(postcode, "-")
+    zip_ok = (np.char.isdigit(zip5) & np.char.isdigit(digits) & np.isin(np.char.str_len(digits), (5, 9))
+              & ((hyphen == -1) | ((hyphen == 5) & (np.char.str_len(postcode) == 10))))
+    report(us & ~missing_zip & ~zip_ok, lambda i: f"invalid ZIP code {str(postcode[i])!r}")
+
+    missing_state = np.char.str_len(state) == 0
+    report(us & missing_state, lambda i: "missing zhouMing")
+
+    primary, alternative = zip3_tables()
+    prefix = np.where(us & zip_ok, zip5.astype("U3"), "0").astype(np.int16)
+    expected, accepted = primary[prefix], alternative[prefix]
+    mismatch = us & zip_ok & ~missing_state & (expected != "") & (state != expected) & (state != accepted)
+    report(mismatch, lambda i: f"zhouMing {str(state[i])!r} does not match ZIP {zip5[i]} ({expected[i]})")
+
+    # Pieces, vectorized over every piece of the batch
+    report(columns["piece_count"] == 0, lambda i: "no danJianList pieces")
+    piece_row = columns["piece_row"]
+    first_piece = np.searchsorted(piece_row, piece_row)
+    number = np.arange(len(piece_row)) - first_piece + 1
+    weight = columns["shiZhong"]
+    sides = np.stack((columns["chang"], columns["kuan"], columns["gao"]), axis=1)
+
+    def report_pieces(mask, message):
+        for index in np.flatnonzero(mask).tolist():
+            failures.setdefault(int(piece_row[index]), []).append(f"piece {number[index]}: {message(index)}")
+
+    bad_weight = ~(weight > 0)
+    report_pieces(bad_weight, lambda i: "shiZhong must be > 0")
+    bad_dims = ~np.all(sides > 0, axis=1)
+    report_pieces(bad_dims, lambda i: "chang/kuan/gao must be > 0")
+
+    length = sides.max(axis=1)
+    length_girth = length + 2 * (sides.sum(axis=1) - length)
+    report_pieces(~bad_weight & (weight > settings["max_piece_weight"]),
+                  lambda i: f"shiZhong {weight[i]:g} kg exceeds {settings['max_piece_weight']:g} kg")
+    report_pieces(~bad_dims & (length > settings["max_length"]),
+                  lambda i: f"length {length[i]:g} cm exceeds {settings['max_length']:g} cm")
+    report_pieces(~bad_dims & (length <= settings["max_length"]) & (length_girth > settings["max_length_girth"]),
+                  lambda i: f"length + girth {length_girth[i]:g} cm exceeds {settings['max_length_girth']:g} cm")
+
+    # Weights per label: sums over pieces (invalid values count as 0)
+    actual = np.where(bad_weight, 0.0, weight)
+    volumetric = np.where(bad_dims, 0.0, np.prod(np.nan_to_num(sides), axis=1) / settings["volumetric_divisor"])
+    charge = np.maximum(actual, volumetric)
+    return {
+        "rows": rows,
+        "invalid": len(failures),
+        "errors": [failures.get(index, ()) for index in range(rows)],
+        "actual_weight": np.bincount(piece_row, weights=actual, minlength=rows),
+        "volumetric_weight": np.bincount(piece_row, weights=volumetric, minlength=rows),
+        "charge_weight": np.bincount(piece_row, weights=charge, minlength=rows),
+        "seconds": time.perf_counter() - started,
+    }
+
+
+def screen_labels(labels: Iterable[Dict], chunk_size: int = 5000, **limits) -> Iterator[Tuple[Dict, Sequence[str]]]:
+    """
+    Validate a stream of label requests in columnar chunks
+
+    Yields:
+        (label, error messages) in input order; an empty list means the label passed
+    """
+    for chunk in iter_chunks(labels, chunk_size):
+        report = validate_labels(chunk, **limits)
+        yield from zip(chunk, report["errors"])
+
+
+def preflight_limits(config: Dict) -> Dict:
+    """
+    Limit overrides from the optional "preflight" section of config.json
+
+    Example:
+        "preflight": {"enabled": true, "volumetric_divisor": 6000, "max_piece_weight": 31.5}
+    """
+    return {key: value for key, value in config.get("preflight", {}).items() if key in DEFAULT_LIMITS}
+
+
+def preflight_row(label: Dict, errors: Sequence[str]) -> Dict:
+    """Result row for an order rejected locally, shaped like bulk-mode result rows"""
+    return {"keHuDanHao": label.get("keHuDanHao"), "zhuanDanHao": None, "code": PREFLIGHT_CODE,
+            "message": "; ".join(errors)}
+
+
+def validate_labels_module(orders_path: str, chunk_size: int = 5000, context: Optional[AppContext] = None) -> bool:
+    """Pre-flight check of an order file (no API calls): merged onto the label template and validated"""
+    print("\n" + "=" * 60)
+    print("MODULE 1: Label Pre-flight Validation")
+    print("=" * 60)
+    print()
+
+    _require_numpy()
+    config = (context or AppContext()).config
+    limits = preflight_limits(config)
+    base_label = YiDiDaClient.load_label_template("templates/label_template.json", config)[0]
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = f"output/preflight_{timestamp}.jsonl"
+    totals = {"rows": 0, "invalid": 0, "seconds": 0.0, "charge_weight": 0.0}
+    started = time.perf_counter()
+    with open(filename, "w", encoding="utf-8") as report_file:
+        labels = (merge_order(base_label, row) for row in iter_order_rows(orders_path))
+        for chunk in iter_chunks(labels, chunk_size):
+            report = validate_labels(chunk, **limits)
+            for index in (i for i, row_errors in enumerate(report["errors"]) if row_errors):
+                report_file.write(json.dumps({
+                    "row": totals["rows"] + index + 1,
+                    "keHuDanHao": chunk[index].get("keHuDanHao"),
+                    "errors": report["errors"][index],
+                    "charge_weight": round(float(report["charge_weight"][index]), 3),
+                }, ensure_ascii=False) + "\n")
+            totals["rows"] += report["rows"]
+            totals["invalid"] += report["invalid"]
+            totals["seconds"] += report["seconds"]
+            totals["charge_weight"] += float(report["charge_weight"].sum())
+
+    logger.info(
+        f"Pre-flight: {totals['rows']} order(s), {totals['invalid']} invalid, total charge weight "
+        f"{totals['charge_weight']:.1f} kg (validation {totals['seconds']:.2f}s, "
+        f"total {time.perf_counter() - started:.2f}s)"
+    )
+    if totals["invalid"]:
+        logger.warning(f"⚠ Invalid orders written to {filename}")
+    else:
+        logger.info("✓ Every order passed pre-flight validation")
+    return totals["invalid"] == 0
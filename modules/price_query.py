@@ -1,11 +1,12 @@
 """Module 2: Query shipping rates/prices"""
 from yidida_client import YiDiDaClient
+from yidida_context import AppContext
 import json
 import logging
-from datetime import datetime
+from typing import Optional
 
 
-def query_price_module():
+def query_price_module(context: Optional[AppContext] = None):
     """Module 2: Query shipping rates/prices"""
     logger = logging.getLogger(__name__)
     
@@ -16,18 +17,13 @@ def query_price_module():
     
     # Load configuration
     logger.info("Loading configuration...")
-    config = YiDiDaClient.load_config("config.json")
+    context = context or AppContext()
+    config = context.config
     
-    # Initialize client
-    client = YiDiDaClient(
-        base_url=config["api_base_url"],
-        username=config["credentials"]["username"],
-        password=config["credentials"]["password"]
-    )
-    
-    # Login
+    # Login (reuses the client of a module run earlier in this process)
     logger.info("Attempting to login...")
-    if not client.login():
+    client = context.login()
+    if client is None:
         logger.error("Failed to login. Please check your credentials in config.json")
         return False
     
@@ -70,12 +66,10 @@ def query_price_module():
         print("=" * 60)
         print(json.dumps(result, indent=2, ensure_ascii=False))
         
-        # Save response to file with timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"output/price_response_{timestamp}.json"
-        with open(filename, "w", encoding="utf-8") as f:
-            json.dump(result, f, indent=2, ensure_ascii=False)
-        logger.info(f"Response saved to {filename}")
+        # Append response to the indexed response store
+        store = context.store()
+        response_id = store.save("price", result, request=price_params)
+        logger.info(f"Response saved to {store.path} (id {response_id})")
         return True
     else:
         logger.error("Failed to query rates")
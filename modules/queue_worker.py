@@ -0,0 +1,338 @@
+"""
+Queue workers: drain label, price and tracking jobs from the shared job queue (yidida_queue.py)
+
+    python main.py enqueue labels --input orders.ndjson --batch-size 50
+    python main.py worker --queues labels,track --concurrency 4 --processes 4
+    python main.py queue-stats
+
+Start workers on as many cores or hosts as needed; they coordinate through the queue file only.
+Delivery is at-least-once, so every handler is safe to repeat: label jobs go through the label
+journal, and a re-delivered label job first looks up the orders an earlier attempt left in doubt.
+"""
+from yidida_client import YiDiDaClient, iter_chunks
+from yidida_context import AppContext
+from yidida_journal import SUBMIT_GRACE, SUBMITTED, LabelJournal
+from yidida_queue import READY, Job, JobQueue, PermanentJobError
+from modules.batch_cli import EXIT_FAILED, EXIT_OK, EXIT_PARTIAL, _order_numbers
+from modules.batch_executor import LabelBatchExecutor
+from modules.bulk_labels import bulk_create_labels, merge_order
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+QUEUES = ("labels", "price", "track")
+
+# Orders per job when enqueuing, unless --batch-size says otherwise
+DEFAULT_JOB_SIZE = {"labels": 50, "price": 1, "track": 100}
+
+
+class JobHandlers:
+    """Runs one job of each queue with a shared client, templates, response store and label journal"""
+
+    def __init__(self, client: YiDiDaClient, context: AppContext):
+        self.client = client
+        self.context = context
+        self.base_label = YiDiDaClient.load_label_template("templates/label_template.json", context.config)[0]
+        self.base_price = YiDiDaClient.load_price_template("templates/price_template.json", context.config)
+        self.journal = LabelJournal.from_config(context.config)
+        self.store = context.store()
+
+    def __call__(self, job: Job) -> Any:
+        handler = getattr(self, f"run_{job.queue}", None)
+        if handler is None:
+            raise PermanentJobError(f"No handler for queue {job.queue!r}")
+        return handler(job)
+
+    def run_labels(self, job: Job) -> Dict:
+        """
+        Payload {"orders": [order rows]}, merged onto the label template as in bulk mode
+
+        Returns:
+            {"summary": bulk counters, "rows": one result row per order}
+        """
+        orders = job.payload.get("orders") if isinstance(job.payload, dict) else None
+        if not isinstance(orders, list) or not all(isinstance(row, dict) for row in orders):
+            raise PermanentJobError('Expected {"orders": [order rows]}')
+
+        order_numbers = [str(row["keHuDanHao"]) for row in orders if row.get("keHuDanHao")]
+        if job.attempts > 1:
+            # The previous attempt's worker died or timed out, possibly after sending some orders.
+            # Orders another run claimed are only settled once their mark is too old to be live
+            self.journal.recover(self.client, 1, order_numbers, job=f"queue:{job.id}")
+            self.journal.recover(self.client, 1, order_numbers, min_age=SUBMIT_GRACE)
+
+        rows = []
+        executor = LabelBatchExecutor.from_config(self.client, self.context.config, 1, len(orders))
+        summary = bulk_create_labels(self.client, orders, self.base_label, None, len(orders), 1, self.store,
+                                     self.journal, job=f"queue:{job.id}", on_row=rows.append, executor=executor)
+
+        in_doubt = [num for num, state in self.journal.states(order_numbers).items() if state == SUBMITTED]
+        if in_doubt:
+            raise RuntimeError(f"{len(in_doubt)} order(s) sent without an answer; they are looked up before "
+                               f"the next attempt")
+        return {"summary": summary, "rows": rows}
+
+    def run_price(self, job: Job) -> Dict:
+        """Payload: price parameters merged onto the price template; returns {"data": quotes}"""
+        if not isinstance(job.payload, dict):
+            raise PermanentJobError("Expected price parameters (a JSON object)")
+        result = self.client.query_price(merge_order(self.base_price, job.payload))
+        if result is None:
+            raise RuntimeError("Price query failed")
+        return {"data": result.get("data")}
+
+    def run_track(self, job: Job) -> Dict:
+        """Payload {"orders": [order numbers]}; returns {"data": record per order, "not_found": [...]}"""
+        orders = _order_numbers(job.payload)
+        if not orders:
+            raise PermanentJobError("No order numbers")
+        bulk = self.client.query_shipments_bulk(orders, workers=1)
+        if bulk["failed_chunks"]:
+            raise RuntimeError(bulk["failed_chunks"][0]["message"])
+        return {"data": bulk["data"], "not_found": bulk["not_found"]}
+
+
+class QueueWorker:
+    """
+    Lease jobs with `concurrency` threads and run them until stopped
+
+    A heartbeat thread extends the lease of every running job every third of the visibility
+    timeout, so long jobs are not handed to another worker while this one is alive.
+    """
+
+    def __init__(self, queue: JobQueue, handler: Callable[[Job], Any], queues: Sequence[str] = QUEUES,
+                 concurrency: int = 4, poll_interval: float = 1.0, stats_interval: float = 60,
+                 name: Optional[str] = None):
+        """
+        Args:
+            queue: Job queue to drain
+            handler: Runs one job and returns its JSON-serializable result; raising
+                     PermanentJobError marks the job dead, any other exception retries it
+            queues: Queue names to lease from
+            concurrency: Jobs run at once
+            poll_interval: Seconds to wait when no job is visible
+            stats_interval: Seconds between queue stats log lines (0 disables them)
+            name: Worker id prefix (default: host:pid)
+        """
+        self.queue = queue
+        self.handler = handler
+        self.queues = list(queues)
+        self.concurrency = max(1, concurrency)
+        self.poll_interval = poll_interval
+        self.stats_interval = stats_interval
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}"
+        self.counts = {"done": 0, "retried": 0, "dead": 0, "lost": 0}
+        self._active: Dict[int, Job] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def stop(self):
+        """Stop leasing; jobs already running are finished"""
+        self._stop.set()
+
+    def _count(self, key: str):
+        with self._lock:
+            self.counts[key] += 1
+
+    def _heartbeat(self):
+        last_stats = time.monotonic()
+        while not self._stop.wait(self.queue.visibility_timeout / 3):
+            with self._lock:
+                running = list(self._active.values())
+            for job in running:
+                if not self.queue.extend(job):
+                    logger.warning(f"⚠ Lost the lease of job {job.id} ({job.queue}); it may run elsewhere too")
+            if self.stats_interval and time.monotonic() - last_stats >= self.stats_interval:
+                last_stats = time.monotonic()
+                log_queue_stats(self.queue, self.queues)
+
+    def _run(self, job: Job):
+        with self._lock:
+            self._active[job.id] = job
+        started = time.perf_counter()
+        try:
+            result = self.handler(job)
+        except PermanentJobError as e:
+            self.queue.fail(job, str(e), retry=False)
+            self._count("dead")
+            logger.error(f"✗ Job {job.id} ({job.queue}) failed permanently: {e}")
+        except Exception as e:
+            state = self.queue.fail(job, str(e))
+            self._count("lost" if state is None else "retried" if state == READY else "dead")
+            logger.error(f"✗ Job {job.id} ({job.queue}) attempt {job.attempts}/{job.max_attempts} failed: {e}"
+                         + ("" if state == READY else " (dead)" if state else " (lease lost)"))
+        else:
+            if self.queue.complete(job, result):
+                self._count("done")
+                logger.info(f"✓ Job {job.id} ({job.queue}) done in {time.perf_counter() - started:.1f}s")
+            else:
+                self._count("lost")
+                logger.warning(f"⚠ Job {job.id} ({job.queue}) finished after its lease was lost; result dropped")
+        finally:
+            with self._lock:
+                del self._active[job.id]
+
+    def _loop(self, worker_id: str, once: bool):
+        while not self._stop.is_set():
+            jobs = self.queue.lease(self.queues, worker_id)
+            if not jobs:
+                if once:
+                    return
+                self._stop.wait(self.poll_interval)
+                continue
+            self._run(jobs[0])
+
+    def run(self, once: bool = False) -> Dict[str, int]:
+        """
+        Run until stop() or Ctrl+C (or, with once, until no job is visible)
+
+        Returns:
+            Counters of this worker: done, retried, dead, lost (lease lapsed while running)
+        """
+        heartbeat = threading.Thread(target=self._heartbeat, name="queue-heartbeat", daemon=True)
+        heartbeat.start()
+        threads = [threading.Thread(target=self._loop, args=(f"{self.name}:{i}", once), name=f"queue-worker-{i}")
+                   for i in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        try:
+            # Short joins keep the main thread responsive to Ctrl+C
+            while any(thread.is_alive() for thread in threads):
+                for thread in threads:
+                    thread.join(0.5)
+        except KeyboardInterrupt:
+            logger.info("Stopping: finishing running jobs...")
+            self.stop()
+            for thread in threads:
+                thread.join()
+        self.stop()
+        return dict(self.counts)
+
+
+def log_queue_stats(queue: JobQueue, queues: Optional[Sequence[str]] = None, window: float = 300):
+    """One log line per queue with its backlog and recent throughput"""
+    for name, stats in sorted(queue.stats(window).items()):
+        if queues is None or name in queues:
+            logger.info(f"Queue {name}: {stats['ready']} ready ({stats['delayed']} delayed), {stats['leased']} leased, "
+                        f"{stats['done']} done, {stats['dead']} dead; {stats['jobs_per_minute']:.1f} jobs/min, "
+                        f"avg run {stats['avg_run_s']:.1f}s, avg wait {stats['avg_wait_s']:.1f}s")
+
+
+def _read_ndjson(input_path: str) -> List[Any]:
+    stream = sys.stdin if input_path == "-" else open(input_path, 'r', encoding='utf-8-sig')
+    values = []
+    try:
+        for line_no, line in enumerate(stream, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                values.append(json.loads(line))
+            except json.JSONDecodeError as e:
+                logger.warning(f"⚠ Line {line_no} skipped, invalid JSON: {e}")
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+    return values
+
+
+def enqueue_command(kind: str, input_path: str = "-", batch_size: Optional[int] = None,
+                    context: Optional[AppContext] = None) -> int:
+    """
+    Turn NDJSON lines (the format of the labels/price/track batch commands) into queue jobs
+
+    Label order rows and tracking order numbers are grouped into jobs of `batch_size`;
+    every price line is one job. Prints {"queue", "jobs", "first_id", "last_id"} on stdout.
+
+    Returns:
+        Process exit code
+    """
+    context = context or AppContext()
+    queue = JobQueue.from_config(context.config)
+    size = batch_size or DEFAULT_JOB_SIZE[kind]
+    values = _read_ndjson(input_path)
+
+    if kind == "track":
+        per_line = [_order_numbers(value) for value in values]
+        usable = sum(1 for numbers in per_line if numbers)
+        payloads = [{"orders": chunk} for chunk in iter_chunks((num for numbers in per_line for num in numbers), size)]
+    else:
+        rows = [value for value in values if isinstance(value, dict)]
+        usable = len(rows)
+        payloads = [{"orders": chunk} for chunk in iter_chunks(rows, size)] if kind == "labels" else rows
+    skipped = len(values) - usable
+    if skipped:
+        logger.warning(f"⚠ {skipped} line(s) without a usable {kind} request skipped")
+
+    ids = queue.put_many(kind, payloads)
+    logger.info(f"✓ Queued {len(ids)} {kind} job(s) in {queue.path}")
+    print(json.dumps({"queue": kind, "jobs": len(ids), "first_id": ids[0] if ids else None,
+                      "last_id": ids[-1] if ids else None}))
+    if not ids:
+        return EXIT_FAILED
+    return EXIT_PARTIAL if skipped else EXIT_OK
+
+
+def worker_command(queues: Sequence[str] = QUEUES, concurrency: int = 4, processes: int = 1, once: bool = False,
+                   context: Optional[AppContext] = None) -> int:
+    """
+    Run queue workers until Ctrl+C (or, with once, until the queues are drained)
+
+    With processes > 1 this process starts that many single-process workers (`main.py worker`)
+    and waits for them, so jobs run on several cores.
+
+    Returns:
+        Process exit code
+    """
+    if processes > 1:
+        command = [sys.executable, os.path.abspath(sys.argv[0]), "worker", "--queues", ",".join(queues),
+                   "--concurrency", str(concurrency)] + (["--once"] if once else [])
+        children = [subprocess.Popen(command) for _ in range(processes)]
+        logger.info(f"Started {processes} worker process(es): {', '.join(str(child.pid) for child in children)}")
+        try:
+            codes = [child.wait() for child in children]
+        except KeyboardInterrupt:
+            # The children got the same Ctrl+C and finish their running jobs
+            codes = [child.wait() for child in children]
+        return EXIT_OK if not any(codes) else EXIT_FAILED
+
+    context = context or AppContext()
+    client = context.login(pool_maxsize=concurrency)
+    if client is None:
+        logger.error("Failed to login. Please check your credentials in config.json")
+        return EXIT_FAILED
+
+    queue = JobQueue.from_config(context.config)
+    worker = QueueWorker(queue, JobHandlers(client, context), queues, concurrency,
+                         poll_interval=context.config.get("job_queue", {}).get("poll_interval", 1.0))
+    logger.info(f"Worker {worker.name} leasing from {', '.join(queues)} in {queue.path} "
+                f"({concurrency} at a time)")
+    counts = worker.run(once)
+    logger.info(f"Worker {worker.name} stopped: {counts['done']} done, {counts['retried']} retried, "
+                f"{counts['dead']} dead, {counts['lost']} lease(s) lost")
+    return EXIT_OK
+
+
+def queue_stats_command(as_json: bool = False, window: float = 300, context: Optional[AppContext] = None) -> int:
+    """Print per-queue backlog and throughput over the last `window` seconds"""
+    context = context or AppContext()
+    stats = JobQueue.from_config(context.config).stats(window)
+    if as_json:
+        print(json.dumps(stats, indent=2))
+        return EXIT_OK
+
+    print(f"{'queue':<8} {'ready':>7} {'delayed':>7} {'leased':>7} {'done':>8} {'dead':>6} {'jobs/min':>9} "
+          f"{'run s':>7} {'wait s':>7} {'oldest s':>9}")
+    for name, row in sorted(stats.items()):
+        print(f"{name:<8} {row['ready']:7d} {row['delayed']:7d} {row['leased']:7d} {row['done']:8d} {row['dead']:6d} "
+              f"{row['jobs_per_minute']:9.1f} {row['avg_run_s']:7.2f} {row['avg_wait_s']:7.1f} "
+              f"{row['oldest_ready_s']:9.0f}")
+    return EXIT_OK
@@ -0,0 +1,232 @@
+"""Rate-shopping matrix: price many weights x destinations x channels in one call"""
+from yidida_client import YiDiDaClient, bounded_map
+from yidida_models import PRICE_FIELDS
+import csv
+import logging
+import math
+from array import array
+from typing import Callable, Dict, Hashable, Iterator, List, Optional, Sequence, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+
+def weight_steps(start: float, stop: float, step: float) -> List[float]:
+    """
+    Build an inclusive list of weight breakpoints, e.g. weight_steps(0.5, 70, 0.5)
+
+    Args:
+        start: First weight (kg)
+        stop: Last weight (kg), included when it falls on a step
+        step: Increment (kg)
+
+    Returns:
+        List of weights rounded to 3 decimals
+    """
+    count = int(math.floor((stop - start) / step + 1e-9)) + 1
+    return [round(start + i * step, 3) for i in range(count)]
+
+
+def us_zip3_zone(destination: Dict) -> Hashable:
+    """
+    Opt-in zone key: US destinations sharing a 3-digit ZIP prefix are priced once
+
+    Carrier zone charts (UPS/FedEx ground) are keyed on the destination ZIP3 for a given origin,
+    but postcode-based pricing (priceZoneType 1) and remote-area surcharges differ inside a ZIP3:
+    only use it for channels priced by zone. Other countries are only collapsed when the whole
+    address tuple matches.
+    """
+    country = (destination.get("countryCode") or "").upper()
+    postcode = str(destination.get("postcode") or "").strip()
+    if country == "US" and len(postcode) >= 3:
+        return ("US", postcode[:3])
+    return (country, postcode.upper(), (destination.get("stateCode") or "").upper(), destination.get("city") or "")
+
+
+def exact_destination(destination: Dict) -> Hashable:
+    """Default zone key: only collapses exact duplicate destinations"""
+    return tuple(sorted(destination.items()))
+
+
+def extract_price(result: Optional[Dict]) -> Optional[float]:
+    """
+    Default price extractor: lowest total price found in a /price response
+
+    Args:
+        result: /price response body
+
+    Returns:
+        Price, or None when the response has no usable quote
+    """
+    if not result or not (result.get("success") or result.get("statusCode") == 200):
+        return None
+
+    data = result.get("data")
+    quotes = data if isinstance(data, list) else [data] if isinstance(data, dict) else []
+
+    prices = []
+    for quote in quotes:
+        for field in PRICE_FIELDS:
+            value = quote.get(field) if isinstance(quote, dict) else None
+            if isinstance(value, (int, float)) or (isinstance(value, str) and value.replace('.', '', 1).isdigit()):
+                prices.append(float(value))
+                break
+    return min(prices) if prices else None
+
+
+class RateMatrix:
+    """
+    Dense price grid indexed by (weight, destination, channel)
+
+    Prices are stored once per (weight, zone, channel) in a float32 array, and each
+    destination only keeps the index of its zone, so thousands of postcodes that share
+    a zone cost 4 bytes each. Missing quotes are NaN.
+    """
+
+    def __init__(self, weights: Sequence[float], destinations: Sequence[Dict], channels: Sequence[int],
+                 zone_of: Sequence[int], zone_count: int):
+        self.weights = list(weights)
+        self.destinations = list(destinations)
+        self.channels = list(channels)
+        self.zone_of = array('I', zone_of)
+        self.zone_count = zone_count
+        self.prices = array('f', [math.nan]) * (len(self.weights) * zone_count * len(self.channels))
+        self._weight_index = {w: i for i, w in enumerate(self.weights)}
+        self._channel_index = {c: i for i, c in enumerate(self.channels)}
+
+    def _offset(self, weight_idx: int, zone_idx: int, channel_idx: int) -> int:
+        return (weight_idx * self.zone_count + zone_idx) * len(self.channels) + channel_idx
+
+    def set_zone_price(self, weight_idx: int, zone_idx: int, channel_idx: int, price: Optional[float]):
+        """Store the quote for one (weight, zone, channel) cell"""
+        self.prices[self._offset(weight_idx, zone_idx, channel_idx)] = math.nan if price is None else price
+
+    def price(self, weight: float, destination_idx: int, channel: int) -> Optional[float]:
+        """
+        Look up one price
+
+        Args:
+            weight: One of the matrix weights
+            destination_idx: Position of the destination in the input list
+            channel: wayType value
+
+        Returns:
+            Price, or None if no quote was returned
+        """
+        value = self.prices[self._offset(
+            self._weight_index[weight], self.zone_of[destination_idx], self._channel_index[channel]
+        )]
+        return None if math.isnan(value) else round(value, 4)
+
+    def iter_rows(self) -> Iterator[Tuple[float, Dict, int, Optional[float]]]:
+        """Yield (weight, destination, channel, price) for every cell, expanded per destination"""
+        for w_idx, weight in enumerate(self.weights):
+            for d_idx, destination in enumerate(self.destinations):
+                zone_idx = self.zone_of[d_idx]
+                for c_idx, channel in enumerate(self.channels):
+                    value = self.prices[self._offset(w_idx, zone_idx, c_idx)]
+                    yield weight, destination, channel, None if math.isnan(value) else round(value, 4)
+
+    def to_csv(self, path: str) -> int:
+        """
+        Export the expanded matrix as CSV (weight, countryCode, stateCode, city, postcode, wayType, price)
+
+        Returns:
+            Number of data rows written
+        """
+        rows = 0
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(["weight", "countryCode", "stateCode", "city", "postcode", "wayType", "price"])
+            for weight, destination, channel, price in self.iter_rows():
+                writer.writerow([
+                    weight, destination.get("countryCode", ""), destination.get("stateCode", ""),
+                    destination.get("city", ""), destination.get("postcode", ""), channel,
+                    "" if price is None else price
+                ])
+                rows += 1
+        return rows
+
+
+def _as_destination(destination: Union[str, Dict], base_to_customer: Dict) -> Dict:
+    """Accept a bare postcode or a partial toCustomer dict and fill the rest from the template"""
+    if isinstance(destination, str):
+        destination = {"postcode": destination}
+    return {**base_to_customer, **destination}
+
+
+def price_matrix(client: YiDiDaClient, base_params: Dict, weights: Sequence[float],
+                 destinations: Sequence[Union[str, Dict]], channels: Sequence[int], workers: int = 8,
+                 zone_key: Callable[[Dict], Hashable] = exact_destination,
+                 price_extractor: Callable[[Optional[Dict]], Optional[float]] = extract_price) -> RateMatrix:
+    """
+    Price every (weight, destination, channel) combination
+
+    Destinations that map to the same zone key are priced once, each channel is priced with
+    its own single-channel wayTypeList, and the remaining calls run concurrently.
+
+    Args:
+        client: Logged-in YiDiDaClient (a quote cache on it is used automatically)
+        base_params: Price query template (e.g. from load_price_template); weight,
+                     wayTypeList and toCustomer are filled in per call
+        weights: Weights in kg (see weight_steps)
+        destinations: Postcodes or toCustomer dicts (missing fields come from base_params)
+        channels: wayTypeList values to compare
+        workers: Concurrent /price requests
+        zone_key: Maps a destination to a hashable zone; us_zip3_zone prices each US ZIP3 once
+        price_extractor: Turns a /price response into one number
+
+    Returns:
+        RateMatrix with the results
+    """
+    base_to_customer = base_params.get("toCustomer", {})
+    destinations = [_as_destination(d, base_to_customer) for d in destinations]
+
+    # Collapse destinations into zones, keeping the first destination of each as representative
+    zone_ids = {}
+    representatives = []
+    zone_of = []
+    for destination in destinations:
+        key = zone_key(destination)
+        if key not in zone_ids:
+            zone_ids[key] = len(representatives)
+            representatives.append(destination)
+        zone_of.append(zone_ids[key])
+
+    if zone_key is not exact_destination:
+        merged = sum(1 for destination, zone in zip(destinations, zone_of)
+                     if exact_destination(destination) != exact_destination(representatives[zone]))
+        if merged:
+            logger.warning(f"⚠ {merged} destination(s) reuse the price of a different destination in their zone "
+                           f"({zone_key.__name__})")
+
+    matrix = RateMatrix(weights, destinations, channels, zone_of, len(representatives))
+    total = len(weights) * len(representatives) * len(channels)
+    logger.info(
+        f"Pricing {len(weights)} weight(s) x {len(destinations)} destination(s) x {len(channels)} channel(s): "
+        f"{len(representatives)} zone(s), {total} request(s)"
+    )
+
+    cells = (
+        (w_idx, z_idx, c_idx)
+        for w_idx in range(len(weights))
+        for z_idx in range(len(representatives))
+        for c_idx in range(len(channels))
+    )
+
+    def quote(cell: Tuple[int, int, int]) -> Optional[float]:
+        w_idx, z_idx, c_idx = cell
+        params = {
+            **base_params,
+            "weight": weights[w_idx],
+            "wayTypeList": [channels[c_idx]],
+            "toCustomer": representatives[z_idx],
+        }
+        return price_extractor(client.query_price(params))
+
+    missing = 0
+    for (w_idx, z_idx, c_idx), price in bounded_map(quote, cells, workers):
+        matrix.set_zone_price(w_idx, z_idx, c_idx, price)
+        missing += price is None
+
+    logger.info(f"Rate matrix complete: {total - missing} priced, {missing} without a quote")
+    return matrix
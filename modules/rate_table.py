@@ -0,0 +1,413 @@
+"""
+Precomputed rate tables: sweep /price once, answer quotes locally
+
+build_rate_table() prices every (package type, zone, channel, weight breakpoint) cell with
+price_matrix() and writes the result to a single file:
+
+    header    magic b"YDRT", format version, dimensions, metadata length (little-endian)
+    metadata  JSON: zones (key + representative destination), channels, package types, weights,
+              base price parameters, zone key name, build time and max age
+    prices    float32, laid out [package type][zone][channel][weight], NaN where no quote came back
+
+RateTable.open() maps the file read-only and reads prices straight from the mapping, so a table
+of any size opens instantly and is shared between processes through the page cache.
+"""
+from yidida_client import YiDiDaClient, bounded_map
+from modules.rate_matrix import (_as_destination, exact_destination, extract_price, price_matrix,
+                                 us_zip3_zone, weight_steps)
+import json
+import logging
+import math
+import mmap
+import os
+import random
+import struct
+import sys
+import time
+from array import array
+from bisect import bisect_left
+from typing import Callable, Dict, Hashable, List, Optional, Sequence, Union
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"YDRT"
+VERSION = 1
+# magic, version, reserved, package types, zones, channels, weights, metadata length
+HEADER = struct.Struct("<4sHHIIIII")
+
+# Zone key functions a table can name in its metadata and be reopened with
+ZONE_KEYS = {"us_zip3": us_zip3_zone, "exact": exact_destination}
+
+
+def _zone_key_name(zone_key: Callable) -> str:
+    for name, fn in ZONE_KEYS.items():
+        if fn is zone_key:
+            return name
+    return zone_key.__name__
+
+
+def _zone_id(key: Hashable) -> str:
+    """Stable string form of a zone key (tuples become JSON lists)"""
+    return json.dumps(key, ensure_ascii=False, separators=(',', ':'))
+
+
+def write_rate_table(path: str, prices: array, zones: List[Dict], channels: Sequence[int],
+                     package_types: Sequence[int], weights: Sequence[float], meta: Optional[Dict] = None) -> int:
+    """
+    Write a rate table file (atomically: a temp file is renamed over `path`)
+
+    Args:
+        path: Output file
+        prices: float32 array of len(package_types) * len(zones) * len(channels) * len(weights)
+        zones: One {"key": zone id, "destination": representative toCustomer} per zone
+        channels: wayType values
+        package_types: packageType values
+        weights: Ascending weight breakpoints (kg)
+        meta: Extra metadata (built_at, max_age, zone_key, base_params)
+
+    Returns:
+        Bytes written
+    """
+    expected = len(package_types) * len(zones) * len(channels) * len(weights)
+    if len(prices) != expected:
+        raise ValueError(f"Rate table has {len(prices)} prices, expected {expected}")
+    if list(weights) != sorted(weights):
+        raise ValueError("Rate table weights must be ascending")
+
+    metadata = json.dumps({
+        **(meta or {}),
+        "zones": zones,
+        "channels": list(channels),
+        "package_types": list(package_types),
+        "weights": list(weights),
+    }, ensure_ascii=False).encode('utf-8')
+    # Prices start on a 4-byte boundary so the mapping can be cast to float32 in place
+    metadata += b" " * (-(HEADER.size + len(metadata)) % 4)
+
+    data = array('f', prices)
+    if sys.byteorder != "little":
+        data.byteswap()
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, 0, len(package_types), len(zones), len(channels), len(weights),
+                            len(metadata)))
+        f.write(metadata)
+        data.tofile(f)
+        size = f.tell()
+    os.replace(tmp_path, path)
+    return size
+
+
+def build_rate_table(client: YiDiDaClient, base_params: Dict, path: str, weights: Sequence[float],
+                     destinations: Sequence[Union[str, Dict]], channels: Sequence[int],
+                     package_types: Sequence[int] = (1,), workers: int = 8,
+                     zone_key: Callable[[Dict], Hashable] = exact_destination,
+                     price_extractor: Callable[[Optional[Dict]], Optional[float]] = extract_price,
+                     max_age: float = 24 * 3600) -> 'RateTable':
+    """
+    Sweep /price over every cell and write the table
+
+    Args:
+        client: Logged-in YiDiDaClient or ClientPool
+        base_params: Price query template (e.g. from load_price_template)
+        path: Output file
+        weights: Weight breakpoints in kg (see weight_steps)
+        destinations: Postcodes or toCustomer dicts; one quote per zone is taken
+        channels: wayTypeList values
+        package_types: packageType values
+        workers: Concurrent /price requests
+        zone_key: Maps a destination to its zone (must be reproducible when the table is opened)
+        price_extractor: Turns a /price response into one number
+        max_age: Seconds after which the table counts as stale
+
+    Returns:
+        The new table, opened
+    """
+    weights = sorted(set(weights))
+    started = time.time()
+    zones = None
+    prices = array('f')
+    for package_type in package_types:
+        logger.info(f"Rate table: sweeping packageType {package_type}")
+        matrix = price_matrix(client, {**base_params, "packageType": package_type}, weights, destinations,
+                              channels, workers=workers, zone_key=zone_key, price_extractor=price_extractor)
+        if zones is None:
+            zones = [None] * matrix.zone_count
+            for destination, zone_idx in zip(matrix.destinations, matrix.zone_of):
+                if zones[zone_idx] is None:
+                    zones[zone_idx] = {"key": _zone_id(zone_key(destination)), "destination": destination}
+
+        for z_idx in range(matrix.zone_count):
+            for c_idx in range(len(channels)):
+                prices.extend(matrix.prices[matrix._offset(w_idx, z_idx, c_idx)] for w_idx in range(len(weights)))
+
+    base = {key: value for key, value in base_params.items() if key not in ("weight", "wayTypeList", "packageType")}
+    size = write_rate_table(path, prices, zones or [], channels, package_types, weights, {
+        "built_at": started,
+        "max_age": max_age,
+        "zone_key": _zone_key_name(zone_key),
+        "base_params": base,
+    })
+    logger.info(f"✓ Rate table written to {path} ({size:,} bytes, {len(prices):,} cells) "
+                f"in {time.time() - started:.1f}s")
+    return RateTable.open(path, zone_key=zone_key)
+
+
+class RateTable:
+    """
+    Read-only, memory-mapped rate table
+
+    Lookups resolve the destination to its zone, then read prices from the mapping:
+    mode "ceil" returns the price of the first breakpoint at or above the weight (how carriers
+    bill), "linear" interpolates between the two breakpoints around it. Weights above the
+    last breakpoint, unknown zones/channels and cells without a quote return None.
+    """
+
+    def __init__(self, path: str, meta: Dict, prices: Sequence[float], zone_key: Callable[[Dict], Hashable],
+                 max_age: Optional[float] = None, mapping: Optional[mmap.mmap] = None):
+        self.path = path
+        self.meta = meta
+        self.prices = prices
+        self.zone_key = zone_key
+        self.zones = meta["zones"]
+        self.channels = meta["channels"]
+        self.package_types = meta["package_types"]
+        self.weights = meta["weights"]
+        self.built_at = meta.get("built_at", 0.0)
+        self.max_age = meta.get("max_age") if max_age is None else max_age
+        self._mapping = mapping
+        self._zone_index = {zone["key"]: i for i, zone in enumerate(self.zones)}
+        self._channel_index = {c: i for i, c in enumerate(self.channels)}
+        self._package_index = {p: i for i, p in enumerate(self.package_types)}
+        self._base_to_customer = meta.get("base_params", {}).get("toCustomer", {})
+        self._postcode_zones: Dict[str, Optional[int]] = {}
+
+    @classmethod
+    def open(cls, path: str, zone_key: Optional[Callable[[Dict], Hashable]] = None,
+             max_age: Optional[float] = None) -> 'RateTable':
+        """
+        Map a table file
+
+        Args:
+            path: File written by build_rate_table / write_rate_table
+            zone_key: Zone function (default: the one named in the file)
+            max_age: Override the stored max age (seconds)
+        """
+        with open(path, 'rb') as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, packages, zones, channels, weights, meta_len = HEADER.unpack_from(mapping)
+        if magic != MAGIC or version != VERSION:
+            mapping.close()
+            raise ValueError(f"{path} is not a version {VERSION} rate table")
+
+        meta = json.loads(bytes(mapping[HEADER.size:HEADER.size + meta_len]))
+        start = HEADER.size + meta_len
+        end = start + 4 * packages * zones * channels * weights
+        if sys.byteorder == "little":
+            prices = memoryview(mapping)[start:end].cast('f')
+        else:
+            prices = array('f', mapping[start:end])
+            prices.byteswap()
+            mapping.close()
+            mapping = None
+
+        if zone_key is None:
+            zone_key = ZONE_KEYS.get(meta.get("zone_key"))
+            if zone_key is None:
+                raise ValueError(f"{path} was built with zone key {meta.get('zone_key')!r}; pass zone_key=")
+        table = cls(path, meta, prices, zone_key, max_age, mapping)
+        if table.is_stale:
+            logger.warning(f"⚠ Rate table {path} is {table.age / 3600:.1f}h old (max {table.max_age / 3600:.1f}h)")
+        return table
+
+    @property
+    def age(self) -> float:
+        """Seconds since the table was built"""
+        return time.time() - self.built_at
+
+    @property
+    def is_stale(self) -> bool:
+        return self.max_age is not None and self.age > self.max_age
+
+    def zone_of(self, destination: Union[str, Dict]) -> Optional[int]:
+        """Zone index of a postcode or toCustomer dict, None if the table has no such zone"""
+        if isinstance(destination, str):
+            if destination not in self._postcode_zones:
+                self._postcode_zones[destination] = self.zone_of({"postcode": destination})
+            return self._postcode_zones[destination]
+        key = self.zone_key(_as_destination(destination, self._base_to_customer))
+        return self._zone_index.get(_zone_id(key))
+
+    def price(self, destination: Union[str, Dict], channel: int, weight: float,
+              package_type: Optional[int] = None, mode: str = "ceil") -> Optional[float]:
+        """
+        Quote one shipment from the table
+
+        Args:
+            destination: Postcode or toCustomer dict
+            channel: wayType value
+            weight: Weight in kg
+            package_type: packageType value (default: the first in the table)
+            mode: "ceil" (next breakpoint up) or "linear" (interpolate between breakpoints)
+
+        Returns:
+            Price, or None when the table cannot answer
+        """
+        zone_idx = self.zone_of(destination)
+        c_idx = self._channel_index.get(channel)
+        p_idx = 0 if package_type is None else self._package_index.get(package_type)
+        if zone_idx is None or c_idx is None or p_idx is None or weight > self.weights[-1]:
+            return None
+
+        row = ((p_idx * len(self.zones) + zone_idx) * len(self.channels) + c_idx) * len(self.weights)
+        w_idx = bisect_left(self.weights, weight)
+        value = self.prices[row + w_idx]
+        if mode == "linear" and w_idx > 0 and self.weights[w_idx] != weight:
+            lower, upper = self.weights[w_idx - 1], self.weights[w_idx]
+            below = self.prices[row + w_idx - 1]
+            value = below + (value - below) * (weight - lower) / (upper - lower)
+        elif mode not in ("ceil", "linear"):
+            raise ValueError(f"Unknown rate table mode {mode!r}")
+        return None if math.isnan(value) else round(value, 4)
+
+    def quote(self, destination: Union[str, Dict], channel: int, weight: float,
+              package_type: Optional[int] = None, mode: str = "ceil") -> Dict:
+        """price() plus where the answer came from: zone, billed breakpoint, age and staleness"""
+        w_idx = bisect_left(self.weights, weight)
+        return {
+            "price": self.price(destination, channel, weight, package_type, mode),
+            "zone": self.zone_of(destination),
+            "weight_bucket": self.weights[w_idx] if w_idx < len(self.weights) else None,
+            "age": self.age,
+            "stale": self.is_stale,
+        }
+
+    def cell_params(self, zone_idx: int, channel_idx: int, weight_idx: int, package_idx: int = 0) -> Dict:
+        """The /price parameters that produced one cell"""
+        return {
+            **self.meta.get("base_params", {}),
+            "packageType": self.package_types[package_idx],
+            "weight": self.weights[weight_idx],
+            "wayTypeList": [self.channels[channel_idx]],
+            "toCustomer": self.zones[zone_idx]["destination"],
+        }
+
+    def close(self):
+        if self._mapping is not None:
+            if isinstance(self.prices, memoryview):
+                self.prices.release()
+            self._mapping.close()
+            self._mapping = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def spot_check(client: YiDiDaClient, table: RateTable, samples: int = 20, tolerance: float = 0.01,
+               workers: int = 4, price_extractor: Callable[[Optional[Dict]], Optional[float]] = extract_price,
+               seed: Optional[int] = None) -> Dict:
+    """
+    Re-price random cells live (bypassing the quote cache) and compare them with the table
+
+    Args:
+        client: Logged-in YiDiDaClient or ClientPool
+        table: Table to check
+        samples: Cells to re-price
+        tolerance: Allowed relative difference
+        workers: Concurrent /price requests
+        price_extractor: Must match the one used to build the table
+        seed: Random seed for reproducible samples
+
+    Returns:
+        checked, mismatches (list of {params, table, live}), max_deviation and ok
+    """
+    rng = random.Random(seed)
+    dims = (len(table.package_types), len(table.zones), len(table.channels), len(table.weights))
+    cells = [(rng.randrange(dims[0]), rng.randrange(dims[1]), rng.randrange(dims[2]), rng.randrange(dims[3]))
+             for _ in range(samples if all(dims) else 0)]
+
+    def live(cell):
+        return price_extractor(client.query_price(table.cell_params(cell[1], cell[2], cell[3], cell[0]), fresh=True))
+
+    mismatches = []
+    max_deviation = 0.0
+    for (p_idx, z_idx, c_idx, w_idx), live_price in bounded_map(live, cells, workers):
+        stored = table.prices[((p_idx * dims[1] + z_idx) * dims[2] + c_idx) * dims[3] + w_idx]
+        stored = None if math.isnan(stored) else round(stored, 4)
+        if stored is None or live_price is None:
+            deviation = 0.0 if stored == live_price else math.inf
+        else:
+            deviation = abs(live_price - stored) / max(abs(live_price), 1e-9)
+        max_deviation = max(max_deviation, deviation)
+        if deviation > tolerance:
+            mismatches.append({"params": table.cell_params(z_idx, c_idx, w_idx, p_idx), "table": stored,
+                               "live": live_price})
+
+    if mismatches:
+        logger.warning(f"⚠ Rate table spot check: {len(mismatches)}/{len(cells)} cell(s) differ from live prices")
+    else:
+        logger.info(f"✓ Rate table spot check: {len(cells)} cell(s) match live prices")
+    return {"checked": len(cells), "mismatches": mismatches, "max_deviation": max_deviation,
+            "ok": not mismatches}
+
+
+def rate_table_module(context=None):
+    """
+    Build the rate table described by the "rate_table" section of config.json, then spot-check it
+
+    Example:
+        "rate_table": {"path": "output/rate_table.ydrt", "weights": {"start": 0.5, "stop": 70, "step": 0.5},
+                       "destinations_file": "zip_codes.txt", "channels": [0, 1], "package_types": [1],
+                       "workers": 8, "max_age_hours": 24, "spot_check": 20}
+    """
+    from yidida_context import AppContext
+
+    print("\n" + "=" * 60)
+    print("Rate Table Builder")
+    print("=" * 60)
+    print()
+
+    context = context or AppContext()
+    config = context.config
+    table_config = config.get("rate_table", {})
+    destinations = list(table_config.get("destinations", []))
+    if table_config.get("destinations_file"):
+        with open(table_config["destinations_file"], 'r', encoding='utf-8-sig') as f:
+            destinations.extend(line.strip() for line in f if line.strip())
+    if not destinations:
+        logger.error("No destinations: set rate_table.destinations or rate_table.destinations_file in config.json")
+        return False
+
+    workers = table_config.get("workers", 8)
+    client = context.login(pool_maxsize=workers)
+    if client is None:
+        logger.error("Failed to login. Please check your credentials in config.json")
+        return False
+
+    # Either explicit breakpoints or a {"start", "stop", "step"} range
+    weights = table_config.get("weights", {"start": 0.5, "stop": 30, "step": 0.5})
+    table = build_rate_table(
+        client,
+        YiDiDaClient.load_price_template("templates/price_template.json", config),
+        table_config.get("path", "output/rate_table.ydrt"),
+        weights=weight_steps(**weights) if isinstance(weights, dict) else weights,
+        destinations=destinations,
+        channels=table_config.get("channels", [0]),
+        package_types=table_config.get("package_types", [1]),
+        workers=workers,
+        zone_key=ZONE_KEYS[table_config.get("zone_key", "exact")],
+        max_age=table_config.get("max_age_hours", 24) * 3600
+    )
+    with table:
+        print(f"Zones: {len(table.zones)}, channels: {table.channels}, package types: {table.package_types}, "
+              f"weights: {table.weights[0]}-{table.weights[-1]} kg ({len(table.weights)} breakpoints)")
+        if table_config.get("spot_check", 20):
+            report = spot_check(client, table, table_config.get("spot_check", 20),
+                                table_config.get("spot_check_tolerance", 0.01), workers=min(workers, 4))
+            print(f"Spot check: {report['checked'] - len(report['mismatches'])}/{report['checked']} cell(s) match")
+    return True
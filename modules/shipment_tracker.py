@@ -1,11 +1,12 @@
 """Module 3: Query shipment tracking information"""
 from yidida_client import YiDiDaClient
+from yidida_context import AppContext
 import json
 import logging
-from datetime import datetime
+from typing import Optional
 
 
-def query_shipment_module():
+def query_shipment_module(context: Optional[AppContext] = None):
     """Module 3: Query shipment tracking information"""
     logger = logging.getLogger(__name__)
     
@@ -16,18 +17,12 @@ def query_shipment_module():
     
     # Load configuration
     logger.info("Loading configuration...")
-    config = YiDiDaClient.load_config("config.json")
+    context = context or AppContext()
     
-    # Initialize client
-    client = YiDiDaClient(
-        base_url=config["api_base_url"],
-        username=config["credentials"]["username"],
-        password=config["credentials"]["password"]
-    )
-    
-    # Login
+    # Login (reuses the client of a module run earlier in this process)
     logger.info("Attempting to login...")
-    if not client.login():
+    client = context.login()
+    if client is None:
         logger.error("Failed to login. Please check your credentials in config.json")
         return False
     
@@ -36,7 +31,7 @@ def query_shipment_module():
     # Get order numbers from user
     print("\nEnter customer order numbers to track:")
     print("  - Separate multiple orders with commas (e.g., ORDER001,ORDER002,ORDER003)")
-    print("  - Maximum 10 order numbers per query")
+    print("  - More than 10 order numbers are split into parallel 10-order queries")
     print()
     order_numbers = input("Order numbers: ").strip()
     
@@ -45,15 +40,18 @@ def query_shipment_module():
         return False
     
     # Validate order numbers
-    is_valid, message = YiDiDaClient.validate_order_numbers(order_numbers)
+    is_valid, message = YiDiDaClient.validate_order_numbers(order_numbers, max_orders=None)
     if not is_valid:
         logger.error(f"Invalid input: {message}")
         print(f"\n✗ {message}")
         return False
     
-    # Query shipment
+    # Query shipment (fan out when the input exceeds one request)
     logger.info(f"Querying shipment information for: {order_numbers}")
-    result = client.query_shipment(order_numbers)
+    if len(order_numbers.split(',')) > YiDiDaClient.MAX_ORDERS_PER_QUERY:
+        result = client.query_shipments_bulk(order_numbers.split(','))
+    else:
+        result = client.query_shipment(order_numbers)
     
     if result:
         print("\n" + "=" * 60)
@@ -61,12 +59,10 @@ def query_shipment_module():
         print("=" * 60)
         print(json.dumps(result, indent=2, ensure_ascii=False))
         
-        # Save response to file with timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"output/shipment_response_{timestamp}.json"
-        with open(filename, "w", encoding="utf-8") as f:
-            json.dump(result, f, indent=2, ensure_ascii=False)
-        logger.info(f"Response saved to {filename}")
+        # Append response to the indexed response store
+        store = context.store()
+        response_id = store.save("shipment", result, request={"danHaos": order_numbers})
+        logger.info(f"Response saved to {store.path} (id {response_id})")
         return True
     else:
         logger.error("Failed to query shipment information")
@@ -0,0 +1,381 @@
+"""Tracking poller: keep every open shipment tracked, polling busy ones often and quiet ones rarely"""
+from yidida_client import YiDiDaClient, iter_chunks
+from yidida_context import AppContext
+from yidida_store import ResponseStore
+from yidida_models import STATUS_FIELDS, TRACK_LIST_FIELDS
+import hashlib
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DELIVERED_KEYWORDS = ("已签收", "delivered")
+NOT_DELIVERED_KEYWORDS = ("未签收", "undelivered", "not delivered")
+NEAR_DELIVERY_KEYWORDS = ("派送", "out for delivery", "out_for_delivery")
+
+
+def status_of(record: Dict) -> str:
+    """Best-effort status text: a status field, else the newest tracking event"""
+    for field in STATUS_FIELDS:
+        value = record.get(field)
+        if isinstance(value, str) and value:
+            return value
+    for field in TRACK_LIST_FIELDS:
+        events = record.get(field)
+        if isinstance(events, list) and events and isinstance(events[0], dict):
+            return str(events[0].get("content") or events[0].get("description") or "")
+    return ""
+
+
+def classify_status(status: str) -> Optional[str]:
+    """
+    Returns:
+        "delivered", "near_delivery", or None for any other status
+    """
+    lowered = status.lower()
+    if any(keyword in lowered for keyword in DELIVERED_KEYWORDS) and \
+            not any(keyword in lowered for keyword in NOT_DELIVERED_KEYWORDS):
+        return "delivered"
+    if any(keyword in lowered for keyword in NEAR_DELIVERY_KEYWORDS):
+        return "near_delivery"
+    return None
+
+
+def fingerprint(record: Dict) -> str:
+    """Hash of the whole record; any change in tracking data changes it"""
+    return hashlib.sha1(json.dumps(record, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+class TrackingPoller:
+    """
+    Persistent poll schedule for open orders (SQLite), driven by YiDiDaClient.query_shipments_bulk
+
+    Every order has its own poll interval. It resets to min_interval whenever the tracking
+    data changes, grows by `backoff` after each unchanged poll up to max_interval, and is
+    capped at near_delivery_interval while the shipment is out for delivery. Delivered
+    orders are retired, and so are orders the API keeps reporting as not found (retire_reason
+    "not_found", for attention). Due orders are polled in 10-order requests, most overdue
+    first, so upstream calls follow shipment activity rather than the number of open orders.
+    """
+
+    def __init__(self, client: YiDiDaClient, path: str = "output/tracking.db", min_interval: float = 900,
+                 max_interval: float = 6 * 3600, near_delivery_interval: float = 1800, backoff: float = 2.0,
+                 max_orders_per_cycle: int = 1000, workers: int = 4,
+                 on_change: Optional[Callable[[Dict], None]] = None, store: Optional[ResponseStore] = None,
+                 not_found_max_polls: Optional[int] = 20, not_found_max_age: Optional[float] = 7 * 86400):
+        """
+        Args:
+            client: Logged-in YiDiDaClient
+            path: SQLite database holding the schedule
+            min_interval: Seconds between polls right after a change
+            max_interval: Longest interval for a quiet order
+            near_delivery_interval: Longest interval while out for delivery
+            backoff: Interval multiplier after an unchanged poll
+            max_orders_per_cycle: Orders polled per cycle at most (extra due orders wait)
+            workers: Concurrent 10-order requests
+            on_change: Called with one event dict per changed order
+            store: Response store receiving changed tracking records (optional)
+            not_found_max_polls: Retire an order after this many not-found polls in a row (None: never)
+            not_found_max_age: Retire an order still not found this many seconds after it was added (None: never)
+        """
+        self.client = client
+        self.path = path
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.near_delivery_interval = near_delivery_interval
+        self.backoff = backoff
+        self.max_orders_per_cycle = max_orders_per_cycle
+        self.workers = workers
+        self.on_change = on_change
+        self.store = store
+        self.not_found_max_polls = not_found_max_polls
+        self.not_found_max_age = not_found_max_age
+        self._local = threading.local()
+
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tracked_orders ("
+                "order_no TEXT PRIMARY KEY, active INTEGER NOT NULL DEFAULT 1, next_poll_at REAL NOT NULL, "
+                "interval REAL NOT NULL, status TEXT, fingerprint TEXT, polls INTEGER NOT NULL DEFAULT 0, "
+                "added_at REAL NOT NULL, last_polled_at REAL, last_changed_at REAL, retired_at REAL, "
+                "not_found_polls INTEGER NOT NULL DEFAULT 0, retire_reason TEXT)"
+            )
+            # Schedules created before not-found retirement existed
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(tracked_orders)")}
+            if "not_found_polls" not in columns:
+                conn.execute("ALTER TABLE tracked_orders ADD COLUMN not_found_polls INTEGER NOT NULL DEFAULT 0")
+                conn.execute("ALTER TABLE tracked_orders ADD COLUMN retire_reason TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS tracked_orders_due ON tracked_orders (active, next_poll_at)")
+
+    @classmethod
+    def from_config(cls, client: YiDiDaClient, config: Dict, **kwargs) -> "TrackingPoller":
+        """
+        Build a poller from the optional "tracking_poller" section of config.json
+
+        Example:
+            "tracking_poller": {"path": "output/tracking.db", "min_interval_seconds": 900,
+                                "max_interval_seconds": 21600, "near_delivery_interval_seconds": 1800,
+                                "max_orders_per_cycle": 1000, "workers": 4, "not_found_max_polls": 20,
+                                "not_found_max_age_seconds": 604800}
+        """
+        poller_config = config.get("tracking_poller", {})
+        return cls(
+            client,
+            path=poller_config.get("path", "output/tracking.db"),
+            min_interval=poller_config.get("min_interval_seconds", 900),
+            max_interval=poller_config.get("max_interval_seconds", 6 * 3600),
+            near_delivery_interval=poller_config.get("near_delivery_interval_seconds", 1800),
+            max_orders_per_cycle=poller_config.get("max_orders_per_cycle", 1000),
+            workers=poller_config.get("workers", 4),
+            not_found_max_polls=poller_config.get("not_found_max_polls", 20),
+            not_found_max_age=poller_config.get("not_found_max_age_seconds", 7 * 86400),
+            **kwargs
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread; sqlite3 connections must not be shared across threads"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _jittered(self, interval: float) -> float:
+        """Spread polls by ±10% so orders added together do not stay in lockstep"""
+        return interval * random.uniform(0.9, 1.1)
+
+    def add(self, order_numbers: Iterable[str]) -> int:
+        """
+        Start tracking orders (due immediately); orders already tracked keep their schedule
+
+        Returns:
+            Number of newly added orders
+        """
+        now = time.time()
+        conn = self._connection()
+        with conn:
+            cursor = conn.executemany(
+                "INSERT OR IGNORE INTO tracked_orders (order_no, next_poll_at, interval, added_at) VALUES (?, ?, ?, ?)",
+                [(num, now, self.min_interval, now) for num in YiDiDaClient._iter_unique_order_numbers(order_numbers)]
+            )
+        return cursor.rowcount
+
+    def remove(self, order_numbers: Iterable[str]):
+        """Stop tracking orders"""
+        conn = self._connection()
+        with conn:
+            conn.executemany("DELETE FROM tracked_orders WHERE order_no = ?", [(num,) for num in order_numbers])
+
+    def due(self, now: Optional[float] = None, limit: Optional[int] = None) -> List[str]:
+        """Active orders whose next poll is due, most overdue first"""
+        now = time.time() if now is None else now
+        rows = self._connection().execute(
+            "SELECT order_no FROM tracked_orders WHERE active = 1 AND next_poll_at <= ? ORDER BY next_poll_at LIMIT ?",
+            (now, limit if limit is not None else self.max_orders_per_cycle)
+        )
+        return [row[0] for row in rows]
+
+    def next_due_at(self) -> Optional[float]:
+        """Time of the earliest scheduled poll, or None when nothing is tracked"""
+        return self._connection().execute(
+            "SELECT MIN(next_poll_at) FROM tracked_orders WHERE active = 1"
+        ).fetchone()[0]
+
+    def poll_once(self) -> Dict[str, int]:
+        """
+        Poll every due order once (up to max_orders_per_cycle)
+
+        Returns:
+            Counters: polled, changed, delivered, unchanged, not_found, abandoned (retired after
+            too many not-found polls; a subset of not_found), failed
+        """
+        now = time.time()
+        due = self.due(now)
+        summary = {"polled": len(due), "changed": 0, "delivered": 0, "unchanged": 0, "not_found": 0, "abandoned": 0,
+                   "failed": 0}
+        if not due:
+            return summary
+
+        conn = self._connection()
+        previous = {}
+        for chunk in iter_chunks(due, 500):
+            rows = conn.execute(
+                f"SELECT order_no, interval, status, fingerprint, not_found_polls, added_at FROM tracked_orders "
+                f"WHERE order_no IN ({', '.join('?' * len(chunk))})",
+                chunk
+            )
+            previous.update((row[0], row[1:]) for row in rows)
+
+        bulk = self.client.query_shipments_bulk(due, workers=self.workers)
+        now = time.time()
+        updates, changed_records = [], []
+
+        for order_no, record in bulk["data"].items():
+            interval, old_status, old_fingerprint = previous[order_no][:3]
+            new_fingerprint = fingerprint(record)
+            status = status_of(record)
+            stage = classify_status(status)
+            changed = new_fingerprint != old_fingerprint
+
+            if changed:
+                interval = self.min_interval
+                summary["changed"] += 1
+                changed_records.append(record)
+                self._emit({"order_no": order_no, "previous_status": old_status, "status": status,
+                            "delivered": stage == "delivered", "changed_at": now, "record": record})
+            else:
+                interval = min(self.max_interval, interval * self.backoff)
+                summary["unchanged"] += 1
+
+            if stage == "near_delivery":
+                interval = min(interval, self.near_delivery_interval)
+
+            active = 0 if stage == "delivered" else 1
+            summary["delivered"] += 1 - active
+            updates.append((active, now + self._jittered(interval), interval, status, new_fingerprint, now,
+                            now if changed else None, now if not active else None, 0,
+                            "delivered" if not active else None, order_no))
+
+        # Not found yet (e.g. just created): back off like an unchanged order, until the limits
+        abandoned = []
+        for order_no in bulk["not_found"]:
+            interval, status, old_fingerprint, not_found_polls, added_at = previous[order_no]
+            interval = min(self.max_interval, interval * self.backoff)
+            not_found_polls += 1
+            retire = ((self.not_found_max_polls is not None and not_found_polls >= self.not_found_max_polls)
+                      or (self.not_found_max_age is not None and now - added_at >= self.not_found_max_age))
+            if retire:
+                abandoned.append(order_no)
+            updates.append((0 if retire else 1, now + self._jittered(interval), interval, status, old_fingerprint,
+                            now, None, now if retire else None, not_found_polls, "not_found" if retire else None,
+                            order_no))
+        summary["not_found"] = len(bulk["not_found"])
+        summary["abandoned"] = len(abandoned)
+        if abandoned:
+            logger.warning(f"⚠ Stopped polling {len(abandoned)} order(s) the API keeps reporting as not found: "
+                           f"{', '.join(abandoned[:10])}" + (" ..." if len(abandoned) > 10 else ""))
+
+        with conn:
+            conn.executemany(
+                "UPDATE tracked_orders SET active = ?, next_poll_at = ?, interval = ?, status = ?, fingerprint = ?, "
+                "polls = polls + 1, last_polled_at = ?, last_changed_at = COALESCE(?, last_changed_at), "
+                "retired_at = ?, not_found_polls = ?, retire_reason = ? WHERE order_no = ?",
+                updates
+            )
+            # Failed requests: keep the interval, retry after min_interval
+            failed = [num for chunk in bulk["failed_chunks"] for num in chunk["orders"]]
+            conn.executemany(
+                "UPDATE tracked_orders SET next_poll_at = ? WHERE order_no = ?",
+                [(now + self._jittered(self.min_interval), num) for num in failed]
+            )
+        summary["failed"] = len(failed)
+
+        if self.store is not None and changed_records:
+            self.store.save("shipment", {"success": True, "data": changed_records}, request={"danHaos": due})
+        return summary
+
+    def _emit(self, event: Dict):
+        if self.on_change is not None:
+            self.on_change(event)
+
+    def run(self, stop: Optional[threading.Event] = None, max_sleep: float = 60.0):
+        """
+        Poll until stopped, sleeping until the next order is due
+
+        Args:
+            stop: Event that ends the loop when set (Ctrl+C also stops it)
+            max_sleep: Longest sleep between cycles, so newly added orders are picked up
+        """
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            summary = self.poll_once()
+            if summary["polled"]:
+                logger.info(
+                    f"Polled {summary['polled']} order(s): {summary['changed']} changed, "
+                    f"{summary['delivered']} delivered, {summary['not_found']} not found "
+                    f"({summary['abandoned']} given up), {summary['failed']} failed"
+                )
+                # A full cycle means more orders are already due
+                if summary["polled"] >= self.max_orders_per_cycle:
+                    continue
+
+            next_due = self.next_due_at()
+            delay = max_sleep if next_due is None else min(max_sleep, max(0.0, next_due - time.time()))
+            stop.wait(delay)
+
+    def stats(self) -> Dict:
+        """Active/retired counts (retired: delivered plus not_found), and the number of orders due now"""
+        conn = self._connection()
+        active, retired, not_found = conn.execute(
+            "SELECT COALESCE(SUM(active), 0), COALESCE(SUM(1 - active), 0), "
+            "COALESCE(SUM(retire_reason = 'not_found'), 0) FROM tracked_orders"
+        ).fetchone()
+        due_now = conn.execute(
+            "SELECT COUNT(*) FROM tracked_orders WHERE active = 1 AND next_poll_at <= ?", (time.time(),)
+        ).fetchone()[0]
+        return {"active": active, "retired": retired, "not_found": not_found, "due_now": due_now}
+
+    def abandoned(self) -> List[str]:
+        """Orders retired because the API kept reporting them as not found (worth a manual look)"""
+        rows = self._connection().execute(
+            "SELECT order_no FROM tracked_orders WHERE active = 0 AND retire_reason = 'not_found' ORDER BY retired_at"
+        )
+        return [row[0] for row in rows]
+
+
+def tracking_poller_module(orders_path: Optional[str] = None, context: Optional[AppContext] = None):
+    """Long-running mode of Module 3: track open shipments until interrupted"""
+    print("\n" + "=" * 60)
+    print("MODULE 3: Tracking Poller")
+    print("=" * 60)
+    print()
+
+    # Load configuration
+    logger.info("Loading configuration...")
+    context = context or AppContext()
+    config = context.config
+    poller_config = config.get("tracking_poller", {})
+
+    # Login
+    logger.info("Attempting to login...")
+    client = context.login(pool_maxsize=poller_config.get("workers", 4))
+    if client is None:
+        logger.error("Failed to login. Please check your credentials in config.json")
+        return False
+
+    logger.info("Login successful")
+
+    changes_path = poller_config.get("changes_path", "output/tracking_changes.jsonl")
+    with open(changes_path, "a", encoding="utf-8") as changes_file:
+        def on_change(event):
+            changes_file.write(json.dumps(event, ensure_ascii=False) + "\n")
+            changes_file.flush()
+            logger.info(f"{event['order_no']}: {event['previous_status'] or '-'} → {event['status'] or '-'}"
+                        + (" (delivered, retired)" if event["delivered"] else ""))
+
+        poller = TrackingPoller.from_config(client, config, on_change=on_change,
+                                            store=context.store())
+
+        # Order numbers: one per line, or comma-separated
+        if orders_path:
+            with open(orders_path, 'r', encoding='utf-8-sig') as f:
+                added = poller.add(num for line in f for num in line.split(','))
+            logger.info(f"Added {added} new order(s) from {orders_path}")
+
+        stats = poller.stats()
+        logger.info(f"Tracking {stats['active']} open order(s) ({stats['retired'] - stats['not_found']} delivered, "
+                    f"{stats['not_found']} given up as not found); changes go to {changes_path}")
+        print("Press Ctrl+C to stop.\n")
+        try:
+            poller.run()
+        except KeyboardInterrupt:
+            logger.info("Tracking poller stopped")
+    return True
@@ -0,0 +1,405 @@
+"""
+Asyncio YiDiDa API client (aiohttp) with the same surface as YiDiDaClient
+"""
+import aiohttp
+import asyncio
+import json
+import logging
+from contextlib import ExitStack
+from typing import Dict, Iterable, List, Optional
+
+from yidida_cache import canonical_price_key
+from yidida_client import BaseYiDiDaClient, YiDiDaClient, iter_chunks
+from yidida_coalesce import AsyncSingleFlight
+from yidida_policy import EndpointPolicy, parse_retry_after
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncYiDiDaClient(BaseYiDiDaClient):
+    """Asyncio client for the YiDiDa API; one instance can keep hundreds of calls in flight"""
+
+    def __init__(self, base_url: str, username: str, password: str, max_concurrency: int = 100,
+                 quote_cache=None, token_manager=None, request_policy=None, metrics=None, address_cache=None):
+        """
+        Initialize the async YiDiDa API client
+
+        Args:
+            base_url: Base URL for the API (e.g., http://twc.itdida.com/itdida-api)
+            username: Your YiDiDa username
+            password: Your YiDiDa password
+            max_concurrency: Maximum number of requests in flight at once
+            quote_cache: Optional QuoteCache (see yidida_cache.py) consulted by query_price
+            token_manager: Optional TokenManager (see yidida_auth.py) for cached tokens and re-login
+            request_policy: Timeouts, retries and rate limit (see yidida_policy.py)
+            metrics: Per-endpoint metrics registry (see yidida_metrics.py)
+            address_cache: Optional AddressCache (see yidida_cache.py) consulted by create_labels
+        """
+        super().__init__(base_url, username, password, quote_cache, token_manager, request_policy, metrics,
+                         address_cache)
+        self.max_concurrency = max_concurrency
+        self._headers = {}
+        self._session = None
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._login_lock = asyncio.Lock()
+        self.price_flight = AsyncSingleFlight()
+
+    @classmethod
+    def from_client(cls, client: YiDiDaClient, max_concurrency: int = 100) -> "AsyncYiDiDaClient":
+        """
+        Build an async client that reuses the credentials, token, caches, request policy and metrics of a sync client
+
+        Args:
+            client: Existing (optionally logged-in) YiDiDaClient
+            max_concurrency: Maximum number of requests in flight at once
+
+        Returns:
+            AsyncYiDiDaClient sharing the sync client's token
+        """
+        async_client = cls(client.base_url, client.username, client.password, max_concurrency,
+                           client.quote_cache, client.token_manager, client.request_policy, client.metrics,
+                           client.address_cache)
+        if client.token:
+            async_client.set_token(client.token, obtained_at=client.token_obtained_at)
+        return async_client
+
+    async def __aenter__(self) -> "AsyncYiDiDaClient":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def _apply_token(self, token: str):
+        """Send the token with every request from this client"""
+        self._headers["Authorization"] = token
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Create the pooled session on first use (it must be created inside the event loop)"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def close(self):
+        """Close the underlying HTTP session"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    async def login(self, force: bool = False, stale_token: Optional[str] = None) -> bool:
+        """
+        Login to YiDiDa API and obtain authentication token
+
+        With a token manager, a cached token is reused and no request is made.
+
+        Args:
+            force: Always call /login, even if a cached token is available
+            stale_token: Token known to be rejected; never reuse it
+
+        Returns:
+            bool: True if login successful, False otherwise
+        """
+        manager = self.token_manager
+        if manager is None or manager.store is None:
+            return await self._login_request()
+        if not force and manager.load_cached(self, stale_token):
+            return True
+
+        # The store lock is shared with sync clients and other processes: wait for it off the event loop
+        with ExitStack() as held:
+            acquiring = asyncio.ensure_future(asyncio.to_thread(held.enter_context, manager.store.locked()))
+            try:
+                await asyncio.shield(acquiring)
+            except asyncio.CancelledError:
+                # Let the thread finish taking the lock so leaving the block releases it
+                await acquiring
+                raise
+
+            # Another process may have logged in while we waited for the lock
+            if not force and manager.load_cached(self, stale_token):
+                return True
+            if not await self._login_request():
+                return False
+            manager.save(self)
+            return True
+
+    async def _login_request(self) -> bool:
+        """
+        Call /login and store the returned token
+
+        Returns:
+            bool: True if login successful, False otherwise
+        """
+        # YiDiDa API requires form data, not JSON
+        outcome = await self._send("POST", self.LOGIN_ENDPOINT, "Login", authenticated=False,
+                                   data=self._login_payload())
+        if outcome is None:
+            return False
+
+        status, body, text = outcome
+        if status != 200 or body is None:
+            logger.error(f"✗ Login failed with status code {status}")
+            logger.debug(f"Response: {text}")
+            return False
+        return self._accept_login(body)
+
+    async def ensure_login(self) -> bool:
+        """
+        Login once even when many coroutines ask for a token at the same time
+
+        Returns:
+            bool: True if a token is available
+        """
+        if self.token:
+            return True
+        async with self._login_lock:
+            if self.token:
+                return True
+            return await self.login()
+
+    async def _relogin(self, stale_token: Optional[str]) -> bool:
+        """Replace a rejected or expired token once, however many coroutines saw it fail"""
+        async with self._login_lock:
+            if self.token and self.token != stale_token:
+                return True
+            logger.warning("⚠ Token rejected or expired, logging in again...")
+            return await self.login(stale_token=stale_token)
+
+    @staticmethod
+    def _body_size(kwargs: Dict) -> int:
+        """Approximate request body size for metrics"""
+        if "json" in kwargs:
+            return len(json.dumps(kwargs["json"], ensure_ascii=False).encode('utf-8'))
+        if "data" in kwargs and isinstance(kwargs["data"], dict):
+            return sum(len(str(k)) + len(str(v)) + 2 for k, v in kwargs["data"].items())
+        return 0
+
+    @staticmethod
+    def _is_retryable_error(error: Exception, policy: EndpointPolicy) -> bool:
+        """Same rules as YiDiDaClient: non-idempotent calls only retry when the connection never opened"""
+        if policy.idempotent:
+            return True
+        return isinstance(error, aiohttp.ClientConnectorError)
+
+    async def _send(self, method: str, endpoint: str, action: str, authenticated: bool = True,
+                    **kwargs) -> Optional[tuple]:
+        """
+        Send a request under the endpoint's request policy (rate limit, retries, token replay)
+
+        Args:
+            method: HTTP method
+            endpoint: Endpoint path (one of the *_ENDPOINT constants)
+            action: Human readable action name used in log lines
+            authenticated: False for /login itself
+            **kwargs: Extra arguments for aiohttp (json, params, data, ...)
+
+        Returns:
+            (status, parsed JSON body or None, text for error statuses) or None on transport failure
+        """
+        policy = self.request_policy.for_endpoint(endpoint)
+        limiter = self.request_policy.rate_limiter
+        timeout = aiohttp.ClientTimeout(total=policy.timeout)
+
+        manager = self.token_manager if authenticated else None
+        if manager is not None and manager.is_expired(self):
+            await self._relogin(self.token)
+
+        policy.budget.deposit()
+        attempt = 0
+        auth_replayed = False
+        while True:
+            attempt += 1
+            if limiter is not None:
+                delay = limiter.reserve()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+            token = self.token
+            try:
+                async with self._semaphore:
+                    started = self.metrics.request_started(endpoint)
+                    async with self._get_session().request(
+                        method,
+                        self._url(endpoint),
+                        headers=dict(self._headers) if authenticated else None,
+                        timeout=timeout,
+                        **kwargs
+                    ) as response:
+                        status = response.status
+                        retry_after = response.headers.get("Retry-After")
+                        raw = await response.read()
+                    self.metrics.request_finished(endpoint, started, status, self._body_size(kwargs), len(raw))
+                text = raw.decode('utf-8', errors='replace')
+
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self.metrics.request_finished(endpoint, started, error=e.__class__.__name__)
+                if self._is_retryable_error(e, policy) and policy.can_retry(attempt):
+                    delay = policy.backoff(attempt)
+                    logger.warning(f"⚠ {endpoint} request failed ({e.__class__.__name__}), "
+                                   f"retrying in {delay:.1f}s (attempt {attempt + 1}/{policy.max_attempts})")
+                    await asyncio.sleep(delay)
+                    continue
+                logger.error(f"✗ {action} request failed: {e!r}")
+                return None
+
+            body = None
+            if status < 400:
+                try:
+                    body = json.loads(text)
+                except ValueError:
+                    logger.error(f"✗ {action} returned invalid JSON")
+                    return None
+
+            if manager is not None and not auth_replayed and self._is_auth_failure(status, body):
+                auth_replayed = True
+                if await self._relogin(token):
+                    attempt -= 1
+                    continue
+
+            if status in policy.retry_statuses and policy.can_retry(attempt):
+                delay = policy.backoff(attempt, parse_retry_after(retry_after))
+                logger.warning(f"⚠ {endpoint} returned HTTP {status}, "
+                               f"retrying in {delay:.1f}s (attempt {attempt + 1}/{policy.max_attempts})")
+                await asyncio.sleep(delay)
+                continue
+
+            return status, body, text
+
+    async def _request(self, method: str, endpoint: str, action: str, **kwargs) -> Optional[Dict]:
+        """
+        Send one authenticated request and return its JSON body
+
+        Args:
+            method: HTTP method
+            endpoint: Endpoint path (one of the *_ENDPOINT constants)
+            action: Human readable action name used in log lines
+            **kwargs: Extra arguments for aiohttp (json, params, ...)
+
+        Returns:
+            Parsed JSON body, or None if the request failed
+        """
+        outcome = await self._send(method, endpoint, action, **kwargs)
+        if outcome is None:
+            return None
+
+        status, body, text = outcome
+        if status >= 400:
+            logger.error(f"✗ {action} request failed: HTTP {status}")
+            logger.debug(f"Response body: {text}")
+            return None
+        return body
+
+    async def create_labels(self, label_requests: List[Dict]) -> Optional[Dict]:
+        """
+        Create shipping labels using YiDiDa API
+
+        Args:
+            label_requests: List of label request dictionaries
+
+        Returns:
+            API response dictionary if successful, None otherwise
+        """
+        if not self._require_login():
+            return None
+
+        label_requests = self._apply_address_cache(label_requests)
+        result = await self._request("POST", self.LABELS_ENDPOINT, "Label creation", json=label_requests)
+        if result is None:
+            return None
+        self._record_addresses(label_requests, result)
+        return self._check_result(result, self.LABELS_ENDPOINT, "Label creation", success_key="code")
+
+    async def query_price(self, price_params: Dict, fresh: bool = False) -> Optional[Dict]:
+        """
+        Query shipping rates/prices using YiDiDa API
+
+        Args:
+            price_params: Price query parameters dictionary (see YiDiDaClient.query_price)
+            fresh: Skip the quote cache and ask the API (the new response is still cached)
+
+        Returns:
+            API response dictionary if successful, None otherwise
+        """
+        if not self._require_login():
+            return None
+
+        cached = None if fresh else self._cached_quote(price_params)
+        if cached is not None:
+            return cached
+
+        return await self.price_flight.do(canonical_price_key(price_params), lambda: self._fetch_price(price_params))
+
+    async def _fetch_price(self, price_params: Dict) -> Optional[Dict]:
+        """POST /price, log the outcome and cache a successful response"""
+        logger.debug(f"Query parameters: {json.dumps(price_params, indent=2, ensure_ascii=False)}")
+        result = await self._request("POST", self.PRICE_ENDPOINT, "Price query", json=price_params)
+        if result is None:
+            return None
+        result = self._check_result(result, self.PRICE_ENDPOINT, "Price query")
+        self._store_quote(price_params, result)
+        return result
+
+    async def query_shipment(self, order_numbers: str) -> Optional[Dict]:
+        """
+        Query shipment details/tracking using YiDiDa API
+
+        Args:
+            order_numbers: Customer order numbers, comma-separated (max 10)
+
+        Returns:
+            API response dictionary if successful, None otherwise
+        """
+        if not self._require_login():
+            return None
+
+        prepared = self._prepare_order_numbers(order_numbers)
+        if prepared is None:
+            return None
+        order_list, order_numbers = prepared
+        logger.info(f"Querying {len(order_list)} order(s): {order_numbers}")
+
+        result = await self._request("GET", self.SHIPMENT_ENDPOINT, "Shipment query",
+                                     params={"danHaos": order_numbers})
+        if result is None:
+            return None
+        return self._check_result(result, self.SHIPMENT_ENDPOINT, "Shipment query")
+
+    async def query_shipments_bulk(self, order_numbers: Iterable[str], workers: int = 10) -> Dict:
+        """
+        Query any number of shipments by fanning out 10-order requests concurrently
+
+        Args:
+            order_numbers: Iterable of customer order numbers (or one comma-separated string)
+            workers: Number of concurrent /queryYunDanDetail requests
+
+        Returns:
+            Same structure as YiDiDaClient.query_shipments_bulk
+        """
+        merged = {"success": True, "data": {}, "failed_chunks": [], "not_found": []}
+        if not self._require_login():
+            merged["success"] = False
+            return merged
+
+        chunks = iter_chunks(self._iter_unique_order_numbers(order_numbers), self.MAX_ORDERS_PER_QUERY)
+        queue = asyncio.Queue(maxsize=workers * 2)
+
+        async def worker():
+            while True:
+                chunk = await queue.get()
+                if chunk is None:
+                    return
+                # A worker that died here would leave the producer blocked on a full queue
+                try:
+                    self._merge_shipment_chunk(merged, chunk, await self.query_shipment(','.join(chunk)))
+                except Exception as e:
+                    logger.error(f"✗ Shipment query failed for {len(chunk)} orders: {e}")
+                    merged["failed_chunks"].append({"orders": chunk, "message": str(e)})
+
+        tasks = [asyncio.create_task(worker()) for _ in range(workers)]
+        for chunk in chunks:
+            await queue.put(chunk)
+        for _ in tasks:
+            await queue.put(None)
+        await asyncio.gather(*tasks)
+
+        merged["success"] = not merged["failed_chunks"]
+        return merged
@@ -0,0 +1,206 @@
+"""
+Persistent, process-shared authentication token handling for the YiDiDa clients
+"""
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+
+class TokenStore:
+    """JSON file of tokens keyed by account, guarded by an OS-level file lock"""
+
+    def __init__(self, path: str = ".yidida_token.json"):
+        """
+        Args:
+            path: Token cache file; a sibling "<path>.lock" file is used for locking
+        """
+        self.path = path
+        self.lock_path = f"{path}.lock"
+
+    @staticmethod
+    def account_key(base_url: str, username: str) -> str:
+        """Tokens are scoped to one user on one API host"""
+        return f"{username}@{base_url}"
+
+    @contextmanager
+    def locked(self):
+        """Hold an exclusive lock shared by every process using this store"""
+        directory = os.path.dirname(self.lock_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with open(self.lock_path, 'a+') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+                else:
+                    lock_file.seek(0)
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _read_all(self) -> Dict:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def load(self, account: str) -> Optional[Tuple[str, float]]:
+        """
+        Args:
+            account: Key from account_key()
+
+        Returns:
+            (token, obtained_at) or None when nothing is cached
+        """
+        entry = self._read_all().get(account)
+        if not entry or not entry.get("token"):
+            return None
+        return entry["token"], entry.get("obtained_at", 0.0)
+
+    def save(self, account: str, token: str, obtained_at: float):
+        """Write a token atomically (call while holding locked())"""
+        entries = self._read_all()
+        entries[account] = {"token": token, "obtained_at": obtained_at}
+
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entries, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+class TokenManager:
+    """
+    Reuses a cached token at startup, logs in at most once across threads and processes,
+    and re-logs in when the API rejects the current token
+    """
+
+    def __init__(self, store: Optional[TokenStore] = None, max_age: Optional[float] = None):
+        """
+        Args:
+            store: Where tokens are persisted (None keeps them in memory only)
+            max_age: Seconds after which a token is refreshed proactively (None to only refresh on rejection)
+        """
+        self.store = store
+        self.max_age = max_age
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: Dict) -> "TokenManager":
+        """
+        Build a manager from the optional "auth" section of config.json
+
+        Example:
+            "auth": {"token_cache_path": ".yidida_token.json", "token_max_age_seconds": 43200}
+
+        Set "token_cache_path" to null to keep tokens in memory only.
+        """
+        auth_config = config.get("auth", {})
+        path = auth_config.get("token_cache_path", ".yidida_token.json")
+        return cls(TokenStore(path) if path else None, auth_config.get("token_max_age_seconds"))
+
+    def is_expired(self, client) -> bool:
+        """True when the client's token is older than max_age"""
+        age = client.token_age
+        return self.max_age is not None and age is not None and age > self.max_age
+
+    def _usable(self, cached: Optional[Tuple[str, float]], stale_token: Optional[str]) -> bool:
+        if cached is None or cached[0] == stale_token:
+            return False
+        return self.max_age is None or time.time() - cached[1] <= self.max_age
+
+    def load_cached(self, client, stale_token: Optional[str] = None) -> bool:
+        """
+        Apply a usable cached token to the client without any network call
+
+        Args:
+            client: YiDiDaClient or AsyncYiDiDaClient
+            stale_token: Token known to be rejected; never reuse it
+
+        Returns:
+            bool: True if a cached token was applied
+        """
+        if self.store is None:
+            return False
+
+        cached = self.store.load(TokenStore.account_key(client.base_url, client.username))
+        if not self._usable(cached, stale_token):
+            return False
+
+        client.set_token(cached[0], obtained_at=cached[1])
+        logger.info(f"✓ Reusing cached token (obtained {client.token_age:.0f}s ago)")
+        return True
+
+    def save(self, client):
+        """Persist the client's freshly obtained token"""
+        if self.store is not None and client.token:
+            account = TokenStore.account_key(client.base_url, client.username)
+            self.store.save(account, client.token, client.token_obtained_at)
+
+    def login(self, client, force: bool = False, stale_token: Optional[str] = None) -> bool:
+        """
+        Give a sync client a valid token, from the cache when possible
+
+        Args:
+            client: YiDiDaClient (its _login_request() does the network call)
+            force: Always call /login, ignoring cached tokens
+            stale_token: Token known to be rejected; never reuse it
+
+        Returns:
+            bool: True if the client has a token
+        """
+        with self._lock:
+            # Another thread already replaced the rejected token
+            if stale_token is not None and client.token and client.token != stale_token:
+                return True
+            if stale_token is not None:
+                logger.warning("⚠ Token rejected or expired, logging in again...")
+
+            if self.store is None:
+                return client._login_request()
+
+            if not force and self.load_cached(client, stale_token):
+                return True
+
+            with self.store.locked():
+                # Another process may have logged in while we waited for the lock
+                if not force and self.load_cached(client, stale_token):
+                    return True
+
+                if not client._login_request():
+                    return False
+                self.save(client)
+                return True
+
+    def relogin(self, client, stale_token: Optional[str]) -> bool:
+        """
+        Replace a rejected or expired token, once per stale token
+
+        Args:
+            client: YiDiDaClient whose request was rejected
+            stale_token: Token that was sent with the rejected request
+
+        Returns:
+            bool: True if the client now has a different, valid token
+        """
+        if client.token and client.token != stale_token:
+            return True
+        return self.login(client, stale_token=stale_token)
@@ -0,0 +1,464 @@
+"""
+Caches for YiDiDaClient with in-memory and SQLite backends:
+
+- QuoteCache: /price responses, keyed on the canonicalized query
+- AddressCache: recipient address verification outcomes (addressVerifyResult) from /yundans/
+"""
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+# Numeric parameters that template substitution may deliver as strings
+_NUMERIC_KEYS = ("weight", "length", "width", "height", "pieceCount")
+
+
+def _normalize(value: Any, key: str = "") -> Any:
+    """Recursively normalize a price parameter value so equivalent queries compare equal"""
+    if isinstance(value, dict):
+        # Template keys starting with "_" are comments, not query parameters
+        return {k: _normalize(v, k) for k, v in value.items() if not k.startswith("_")}
+    if isinstance(value, list):
+        items = [_normalize(v) for v in value]
+        # Channel lists are sets as far as the API is concerned
+        return sorted(items) if key == "wayTypeList" else items
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, (int, float)):
+        # 1, 1.0 and "1.00" style weights should share one entry
+        return float(value)
+    if isinstance(value, str) and key in _NUMERIC_KEYS:
+        try:
+            return float(value)
+        except ValueError:
+            return value.strip()
+    if isinstance(value, str):
+        return value.strip().upper() if key in ("countryCode", "stateCode", "postcode") else value.strip()
+    return value
+
+
+def canonical_price_key(price_params: Dict) -> str:
+    """
+    Build a stable cache key from price query parameters
+
+    Args:
+        price_params: Price query parameters (see YiDiDaClient.query_price)
+
+    Returns:
+        Hex digest identifying the query
+    """
+    canonical = json.dumps(_normalize(price_params), sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class MemoryCacheBackend:
+    """Process-local LRU backend (an OrderedDict guarded by a lock)"""
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        """Return (value, stored_at) and mark the entry as recently used"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, value: Any, stored_at: float):
+        """Insert or replace an entry"""
+        with self._lock:
+            self._entries[key] = (value, stored_at)
+            self._entries.move_to_end(key)
+
+    def delete(self, key: str):
+        """Remove an entry if present"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def evict(self, max_size: int) -> int:
+        """Drop least recently used entries until at most max_size remain"""
+        evicted = 0
+        with self._lock:
+            while len(self._entries) > max_size:
+                self._entries.popitem(last=False)
+                evicted += 1
+        return evicted
+
+    def clear(self):
+        """Remove every entry"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteCacheBackend:
+    """On-disk backend shared by every process that opens the same file (WAL mode)"""
+
+    def __init__(self, path: str, table: str = "quote_cache"):
+        """
+        Args:
+            path: SQLite database file
+            table: Table name, so several caches can share one file
+        """
+        self.path = path
+        self.table = table
+        self._local = threading.local()
+
+        conn = self._connection()
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_accessed_at ON {table} (accessed_at)")
+        conn.commit()
+
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread; sqlite3 connections must not be shared across threads"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        """Return (value, stored_at) and mark the entry as recently used"""
+        conn = self._connection()
+        row = conn.execute(f"SELECT value, stored_at FROM {self.table} WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        with conn:
+            conn.execute(f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (time.time(), key))
+        return json.loads(row[0]), row[1]
+
+    def set(self, key: str, value: Any, stored_at: float):
+        """Insert or replace an entry"""
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, stored_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), stored_at, time.time())
+            )
+
+    def delete(self, key: str):
+        """Remove an entry if present"""
+        conn = self._connection()
+        with conn:
+            conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def evict(self, max_size: int) -> int:
+        """Drop least recently used entries until at most max_size remain"""
+        conn = self._connection()
+        with conn:
+            cursor = conn.execute(
+                f"DELETE FROM {self.table} WHERE key IN ("
+                f"SELECT key FROM {self.table} ORDER BY accessed_at ASC "
+                f"LIMIT max(0, (SELECT COUNT(*) FROM {self.table}) - ?))",
+                (max_size,)
+            )
+        return cursor.rowcount
+
+    def clear(self):
+        """Remove every entry"""
+        conn = self._connection()
+        with conn:
+            conn.execute(f"DELETE FROM {self.table}")
+
+    def __len__(self) -> int:
+        return self._connection().execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+
+class QuoteCache:
+    """TTL + LRU cache of /price responses keyed on canonicalized query parameters"""
+
+    def __init__(self, backend=None, ttl: float = 3600, max_size: int = 10000):
+        """
+        Args:
+            backend: MemoryCacheBackend (default) or SQLiteCacheBackend
+            ttl: Seconds a quote stays valid
+            max_size: Maximum number of cached quotes before LRU eviction
+        """
+        self.backend = backend if backend is not None else MemoryCacheBackend()
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: Dict, namespace: Optional[str] = None) -> Optional["QuoteCache"]:
+        """
+        Build a cache from the optional "quote_cache" section of config.json
+
+        Example:
+            "quote_cache": {"backend": "sqlite", "path": "output/quote_cache.db", "ttl_seconds": 3600, "max_size": 10000}
+
+        Args:
+            config: Configuration dictionary
+            namespace: Keeps this cache's entries apart from other caches on the same file
+                       (e.g. one per account, since customer prices differ between accounts)
+
+        Returns:
+            QuoteCache, or None when the section is missing or disabled
+        """
+        cache_config = config.get("quote_cache")
+        if not cache_config or not cache_config.get("enabled", True):
+            return None
+
+        if cache_config.get("backend", "memory") == "sqlite":
+            table = "quote_cache" if namespace is None else f"quote_cache_{re.sub(r'[^0-9A-Za-z_]', '_', namespace)}"
+            backend = SQLiteCacheBackend(cache_config.get("path", "output/quote_cache.db"), table)
+        else:
+            backend = MemoryCacheBackend()
+
+        return cls(backend, cache_config.get("ttl_seconds", 3600), cache_config.get("max_size", 10000))
+
+    def _count(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, price_params: Dict) -> Optional[Dict]:
+        """
+        Look up a cached quote
+
+        Args:
+            price_params: Price query parameters
+
+        Returns:
+            Cached response (treat as read-only), or None on miss/expiry
+        """
+        key = canonical_price_key(price_params)
+        entry = self.backend.get(key)
+
+        if entry is not None:
+            value, stored_at = entry
+            if time.time() - stored_at <= self.ttl:
+                self._count(hit=True)
+                return value
+            self.backend.delete(key)
+
+        self._count(hit=False)
+        return None
+
+    def put(self, price_params: Dict, result: Dict):
+        """
+        Store a successful /price response
+
+        Args:
+            price_params: Price query parameters the response belongs to
+            result: Response body
+        """
+        self.backend.set(canonical_price_key(price_params), result, time.time())
+        evicted = self.backend.evict(self.max_size)
+        if evicted:
+            with self._lock:
+                self.evictions += evicted
+
+    def clear(self):
+        """Drop every cached quote (counters are kept)"""
+        self.backend.clear()
+
+    def stats(self) -> Dict:
+        """
+        Returns:
+            Dictionary with hits, misses, hit_rate, evictions and current size
+        """
+        with self._lock:
+            hits, misses, evictions = self.hits, self.misses, self.evictions
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / total if total else 0.0,
+            "evictions": evictions,
+            "size": len(self.backend)
+        }
+
+
+# Label fields identifying a recipient address
+ADDRESS_FIELDS = ("shouJianRenDiZhi1", "shouJianRenDiZhi2", "shouJianRenDiZhi3", "shouJianRenChengShi",
+                  "zhouMing", "shouJianRenYouBian", "guoJia")
+
+# addressVerifyResult values worth remembering (an empty value means no verification took place)
+VERIFIED_ADDRESS_TYPES = ("BUSINESS", "RESIDENTIAL")
+
+
+def address_key(label: Dict) -> str:
+    """
+    Build a stable cache key from the recipient address of a label request
+
+    Case, repeated whitespace and trailing punctuation do not matter, so "95B Inip Dr., Inwood"
+    and "95b inip dr, inwood " share one entry.
+
+    Args:
+        label: Label request dictionary
+
+    Returns:
+        Hex digest identifying the address
+    """
+    parts = []
+    for field in ADDRESS_FIELDS:
+        value = " ".join(str(label.get(field) or "").upper().replace(".", " ").replace(",", " ").split())
+        parts.append(value.replace(" ", "") if field == "shouJianRenYouBian" else value)
+    return hashlib.sha256("|".join(parts).encode('utf-8')).hexdigest()
+
+
+class AddressCache:
+    """
+    TTL + LRU cache of recipient address verification outcomes
+
+    Labels are sent with needValidateAddress: true, and the /yundans/ response says whether the
+    address is BUSINESS or RESIDENTIAL. For an address verified within `ttl`, apply() sends the
+    label with needValidateAddress: false and recipientResidential set from the cached result, so
+    the API does not verify the same warehouse or customer address again.
+    """
+
+    def __init__(self, backend=None, ttl: float = 30 * 86400, max_size: int = 100000):
+        """
+        Args:
+            backend: MemoryCacheBackend (default) or SQLiteCacheBackend
+            ttl: Seconds a verification outcome stays valid
+            max_size: Maximum number of cached addresses before LRU eviction
+        """
+        self.backend = backend if backend is not None else MemoryCacheBackend()
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: Dict) -> Optional["AddressCache"]:
+        """
+        Build a cache from the optional "address_cache" section of config.json
+
+        Example:
+            "address_cache": {"backend": "sqlite", "path": "output/address_cache.db", "ttl_days": 30, "max_size": 100000}
+
+        Returns:
+            AddressCache, or None when the section is missing or disabled
+        """
+        cache_config = config.get("address_cache")
+        if not cache_config or not cache_config.get("enabled", True):
+            return None
+
+        if cache_config.get("backend", "memory") == "sqlite":
+            backend = SQLiteCacheBackend(cache_config.get("path", "output/address_cache.db"), "address_cache")
+        else:
+            backend = MemoryCacheBackend()
+
+        return cls(backend, cache_config.get("ttl_days", 30) * 86400, cache_config.get("max_size", 100000))
+
+    def get(self, label: Dict) -> Optional[str]:
+        """
+        Look up the verification outcome of a label's recipient address
+
+        Returns:
+            "BUSINESS" or "RESIDENTIAL", or None on miss/expiry
+        """
+        key = address_key(label)
+        entry = self.backend.get(key)
+        if entry is not None:
+            value, stored_at = entry
+            if time.time() - stored_at <= self.ttl:
+                return value
+            self.backend.delete(key)
+        return None
+
+    def apply(self, labels: List[Dict]) -> List[Dict]:
+        """
+        Fill in verification outcomes for labels that ask for address validation
+
+        Args:
+            labels: Label request dictionaries (not modified; rendered labels may share structure)
+
+        Returns:
+            The labels, with copies for cache hits carrying needValidateAddress: false and
+            recipientResidential from the cache
+        """
+        hits = misses = 0
+        applied = []
+        for label in labels:
+            address_type = self.get(label) if label.get("needValidateAddress") else None
+            if address_type is None:
+                misses += bool(label.get("needValidateAddress"))
+                applied.append(label)
+            else:
+                hits += 1
+                applied.append({**label, "needValidateAddress": False,
+                                "recipientResidential": 1 if address_type == "RESIDENTIAL" else 0})
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+        return applied
+
+    def record(self, labels: List[Dict], result: Optional[Dict]) -> int:
+        """
+        Store the outcomes the API returned for labels sent with needValidateAddress: true
+
+        Args:
+            labels: Label requests as sent
+            result: /yundans/ response body
+
+        Returns:
+            Number of addresses stored
+        """
+        data = result.get("data") if isinstance(result, dict) else None
+        if not isinstance(data, list):
+            return 0
+
+        by_order = {item.get("keHuDanHao"): item for item in data if isinstance(item, dict)}
+        stored = 0
+        now = time.time()
+        for label in labels:
+            item = by_order.get(label.get("keHuDanHao"))
+            if not label.get("needValidateAddress") or item is None or item.get("code") not in (None, 200):
+                continue
+            address_type = str(item.get("addressVerifyResult") or "").upper()
+            if address_type in VERIFIED_ADDRESS_TYPES:
+                self.backend.set(address_key(label), address_type, now)
+                stored += 1
+
+        if stored:
+            self.backend.evict(self.max_size)
+            with self._lock:
+                self.stored += stored
+        return stored
+
+    def clear(self):
+        """Drop every cached address (counters are kept)"""
+        self.backend.clear()
+
+    def stats(self) -> Dict:
+        """
+        Returns:
+            Dictionary with hits, misses, hit_rate, stored and current size
+        """
+        with self._lock:
+            hits, misses, stored = self.hits, self.misses, self.stored
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / total if total else 0.0,
+            "stored": stored,
+            "size": len(self.backend)
+        }
@@ -2,129 +2,368 @@
 YiDiDa API Client for creating shipping labels (UPS/FedEx)
 """
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 import json
 import logging
-from typing import Dict, List, Optional
+import time
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from urllib3.exceptions import ConnectTimeoutError
+
+from yidida_auth import TokenManager
+from yidida_cache import AddressCache, QuoteCache, canonical_price_key
+from yidida_coalesce import SingleFlight
+from yidida_metrics import ClientMetrics
+from yidida_models import (LabelResult, PriceQuote, TrackingRecord, parse_label_results, parse_price_quotes,
+                           parse_tracking_records, response_items)
+from yidida_policy import EndpointPolicy, RequestPolicy, parse_retry_after
+from yidida_templates import CompiledTemplate
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='[%(levelname)s] %(asctime)s - %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
 logger = logging.getLogger(__name__)
 
 
-class YiDiDaClient:
-    """Client for interacting with YiDiDa shipping label API"""
+def iter_chunks(items: Iterable, size: int) -> Iterator[List]:
+    """
+    Split an iterable into lists of at most `size` items without materializing it
+    
+    Args:
+        items: Any iterable (list, generator, file reader, ...)
+        size: Maximum number of items per chunk
+        
+    Yields:
+        Lists of consecutive items
+    """
+    if size < 1:
+        raise ValueError("Chunk size must be at least 1")
     
-    def __init__(self, base_url: str, username: str, password: str):
+    iterator = iter(items)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def bounded_map(fn: Callable, items: Iterable, workers: int) -> Iterator[Tuple[Any, Any]]:
+    """
+    Run fn over items on a thread pool, keeping at most `workers * 2` calls pending
+    
+    Items are pulled lazily, so arbitrarily large inputs (files, generators) never sit in memory.
+    
+    Args:
+        fn: Function called with one item
+        items: Iterable of inputs
+        workers: Number of worker threads
+        
+    Yields:
+        (item, fn(item)) tuples in completion order
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {}
+        for item in items:
+            pending[executor.submit(fn, item)] = item
+            if len(pending) >= workers * 2:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            else:
+                # Hand back finished calls right away, even while the input is slow to arrive
+                done = [future for future in pending if future.done()]
+            for future in done:
+                yield pending.pop(future), future.result()
+        
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield pending.pop(future), future.result()
+
+
+class BaseYiDiDaClient:
+    """Transport-independent pieces shared by the sync and async YiDiDa clients"""
+    
+    LOGIN_ENDPOINT = "/login"
+    LABELS_ENDPOINT = "/yundans/"
+    PRICE_ENDPOINT = "/price"
+    SHIPMENT_ENDPOINT = "/queryYunDanDetail"
+    MAX_ORDERS_PER_QUERY = 10
+    
+    # Status codes (HTTP or in the JSON body) meaning the token was rejected
+    AUTH_FAILURE_CODES = (401, 403)
+    
+    # Fields of a tracking record that may carry the number the caller queried with
+    ORDER_NUMBER_FIELDS = ("keHuDanHao", "zhuanDanHao", "xiTongDanHao", "waybillId", "huanDanHao")
+    
+    def __init__(self, base_url: str, username: str, password: str, quote_cache: Optional[QuoteCache] = None,
+                 token_manager: Optional[TokenManager] = None, request_policy: Optional[RequestPolicy] = None,
+                 metrics: Optional[ClientMetrics] = None, address_cache: Optional[AddressCache] = None):
         """
-        Initialize the YiDiDa API client
+        Initialize the shared client state
         
         Args:
             base_url: Base URL for the API (e.g., http://twc.itdida.com/itdida-api)
             username: Your YiDiDa username
             password: Your YiDiDa password
+            quote_cache: Optional QuoteCache (see yidida_cache.py) consulted by query_price
+            token_manager: Optional TokenManager (see yidida_auth.py) that caches the token on disk
+                           and re-logs in when it is rejected
+            request_policy: Timeouts, retries and rate limit (see yidida_policy.py); share one
+                            instance between clients to share the rate limit
+            metrics: Per-endpoint metrics registry (see yidida_metrics.py); one is created if omitted
+            address_cache: Optional AddressCache (see yidida_cache.py) of recipient address verifications
         """
         self.base_url = base_url.rstrip('/')
         self.username = username
         self.password = password
         self.token = None
-        self.session = requests.Session()
-        
-    def login(self) -> bool:
+        self.token_obtained_at = None
+        self.quote_cache = quote_cache
+        self.token_manager = token_manager
+        self.request_policy = request_policy if request_policy is not None else RequestPolicy()
+        self.metrics = metrics if metrics is not None else ClientMetrics()
+        self.address_cache = address_cache
+        # Identical price queries in flight at the same time share one request
+        self.price_flight = SingleFlight()
+    
+    @classmethod
+    def from_config(cls, config: Dict, **kwargs):
         """
-        Login to YiDiDa API and obtain authentication token
+        Build a client from config.json, wiring the token cache, quote cache and request policy it configures
         
+        Args:
+            config: Configuration dictionary (see load_config)
+            **kwargs: Extra constructor arguments (e.g. pool_maxsize)
+            
         Returns:
-            bool: True if login successful, False otherwise
+            Client instance (not yet logged in)
         """
-        login_url = f"{self.base_url}/login"
-        
-        payload = {
+        kwargs.setdefault("quote_cache", QuoteCache.from_config(config))
+        kwargs.setdefault("token_manager", TokenManager.from_config(config))
+        kwargs.setdefault("request_policy", RequestPolicy.from_config(config))
+        kwargs.setdefault("address_cache", AddressCache.from_config(config))
+        return cls(
+            config["api_base_url"],
+            config["credentials"]["username"],
+            config["credentials"]["password"],
+            **kwargs
+        )
+    
+    @property
+    def token_age(self) -> Optional[float]:
+        """Seconds since the current token was obtained (None when not logged in)"""
+        if self.token_obtained_at is None:
+            return None
+        return time.time() - self.token_obtained_at
+    
+    def _url(self, endpoint: str) -> str:
+        """Build the full URL for an API endpoint"""
+        return f"{self.base_url}{endpoint}"
+    
+    def _login_payload(self) -> Dict:
+        """Form fields expected by the /login endpoint"""
+        return {
             "username": self.username,
             "password": self.password
         }
+    
+    def _apply_token(self, token: str):
+        """Attach the token to outgoing requests (transport specific)"""
+        raise NotImplementedError
+    
+    def set_token(self, token: str, obtained_at: Optional[float] = None):
+        """
+        Use an already obtained token, e.g. one shared by another client
         
-        try:
-            # YiDiDa API requires form data, not JSON
-            response = self.session.post(
-                login_url,
-                data=payload,
-                timeout=10
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                
-                # Check if login was successful
-                if result.get("success") and result.get("statusCode") == 200:
-                    # Token is in the "data" field as a string
-                    self.token = result.get("data")
-                    
-                    if self.token:
-                        # Set token in session headers (without "Bearer" prefix based on API behavior)
-                        self.session.headers.update({"Authorization": self.token})
-                        logger.info("✓ Login successful! Token obtained.")
-                        logger.debug(f"Token: {self.token[:20]}...")
-                        return True
-                    else:
-                        logger.error(f"✗ Login response missing token: {result}")
-                        return False
-                else:
-                    logger.error(f"✗ Login failed: {result.get('data', 'Unknown error')}")
-                    return False
-            else:
-                logger.error(f"✗ Login failed with status code {response.status_code}")
-                logger.debug(f"Response: {response.text}")
-                return False
-                
-        except requests.exceptions.RequestException as e:
-            logger.error(f"✗ Login request failed: {e}")
-            return False
+        Args:
+            token: Authorization token returned by /login
+            obtained_at: Unix time the token was issued (defaults to now)
+        """
+        self.token = token
+        self.token_obtained_at = obtained_at if obtained_at is not None else time.time()
+        self._apply_token(token)
     
-    def create_labels(self, label_requests: List[Dict]) -> Optional[Dict]:
+    def _accept_login(self, result: Dict) -> bool:
         """
-        Create shipping labels using YiDiDa API
+        Interpret a /login response body and store the token
         
         Args:
-            label_requests: List of label request dictionaries
+            result: Parsed JSON body of the login response
             
         Returns:
-            API response dictionary if successful, None otherwise
+            bool: True if a token was obtained
         """
+        # Check if login was successful
+        if result.get("success") and result.get("statusCode") == 200:
+            # Token is in the "data" field as a string
+            token = result.get("data")
+            
+            if token:
+                # Token is sent as-is in the Authorization header (no "Bearer" prefix)
+                self.set_token(token)
+                logger.info("✓ Login successful! Token obtained.")
+                logger.debug(f"Token: {token[:20]}...")
+                return True
+            else:
+                logger.error(f"✗ Login response missing token: {result}")
+                return False
+        else:
+            logger.error(f"✗ Login failed: {result.get('data', 'Unknown error')}")
+            return False
+    
+    def _require_login(self) -> bool:
+        """Log an error and return False when no token is available"""
         if not self.token:
             logger.error("✗ Not logged in. Please call login() first.")
+            return False
+        return True
+    
+    def _is_auth_failure(self, status: int, body: Optional[Dict]) -> bool:
+        """
+        Detect a rejected token from the HTTP status or the JSON body
+        
+        Args:
+            status: HTTP status code
+            body: Parsed JSON body if it was small enough to inspect, else None
+        """
+        if status in self.AUTH_FAILURE_CODES:
+            return True
+        if isinstance(body, dict):
+            return body.get("statusCode") in self.AUTH_FAILURE_CODES or body.get("code") in self.AUTH_FAILURE_CODES
+        return False
+    
+    def _cached_quote(self, price_params: Dict) -> Optional[Dict]:
+        """Return a cached /price response for these parameters, if any"""
+        if self.quote_cache is None:
             return None
         
-        create_url = f"{self.base_url}/yundans/"
-        logger.debug(f"Creating labels at: {create_url}")
+        result = self.quote_cache.get(price_params)
+        if result is not None:
+            logger.info("✓ Price query served from cache")
+        return result
+    
+    def _store_quote(self, price_params: Dict, result: Dict):
+        """Cache a successful /price response"""
+        if self.quote_cache is not None and (result.get("success") or result.get("statusCode") == 200):
+            self.quote_cache.put(price_params, result)
+    
+    def _apply_address_cache(self, label_requests: List[Dict]) -> List[Dict]:
+        """Skip server-side address validation for recipients verified recently"""
+        if self.address_cache is None:
+            return label_requests
         
-        try:
-            response = self.session.post(
-                create_url,
-                json=label_requests,
-                headers={"Content-Type": "application/json"}
-            )
-            response.raise_for_status()
+        applied = self.address_cache.apply(label_requests)
+        hits = sum(1 for sent, label in zip(applied, label_requests) if sent is not label)
+        if hits:
+            logger.info(f"✓ {hits} of {len(applied)} address(es) verified from cache")
+        return applied
+    
+    def _record_addresses(self, label_requests: List[Dict], result: Optional[Dict]):
+        """Remember the addressVerifyResult of every label the API verified"""
+        if self.address_cache is not None and result is not None:
+            self.address_cache.record(label_requests, result)
+    
+    def _check_result(self, result: Dict, endpoint: str, action: str, success_key: str = "statusCode") -> Dict:
+        """
+        Log the outcome of an API call based on its response body and count its business codes
+        
+        Args:
+            result: Parsed JSON response body
+            endpoint: Endpoint path the response came from
+            action: Human readable action name used in log lines (e.g. "Price query")
+            success_key: Field compared against 200 when "success" is not set
             
-            result = response.json()
+        Returns:
+            The response body unchanged
+        """
+        self.metrics.record_result(endpoint, result)
+        # Only serialize the body when DEBUG is on; large label responses are expensive to dump
+        if logger.isEnabledFor(logging.DEBUG):
             logger.debug(f"API Response: {json.dumps(result, indent=2, ensure_ascii=False)}")
+        
+        if result.get("success") or result.get(success_key) == 200:
+            logger.info(f"✓ {action} successful!")
+        else:
+            logger.error(f"✗ {action} failed: {result.get('message', 'Unknown error')}")
+        return result
+    
+    @classmethod
+    def _prepare_order_numbers(cls, order_numbers: str) -> Optional[Tuple[List[str], str]]:
+        """
+        Split and cap a comma-separated order number string for /queryYunDanDetail
+        
+        Args:
+            order_numbers: Customer order numbers, comma-separated
             
-            if result.get("success") or result.get("code") == 200:
-                logger.info(f"✓ Labels created successfully!")
-                return result
-            else:
-                logger.error(f"✗ Label creation failed: {result.get('message', 'Unknown error')}")
-                logger.debug(f"Response: {json.dumps(result, indent=2)}")
-                return result
-                
-        except requests.exceptions.RequestException as e:
-            logger.error(f"✗ Label creation request failed: {e}")
-            if hasattr(e.response, 'text'):
-                logger.debug(f"Response body: {e.response.text}")
+        Returns:
+            (order list, danHaos parameter) or None if no order numbers were given
+        """
+        order_list = [num.strip() for num in order_numbers.split(',') if num.strip()]
+        if not order_list:
+            logger.error("✗ No order numbers provided.")
             return None
+        
+        if len(order_list) > cls.MAX_ORDERS_PER_QUERY:
+            logger.warning(f"⚠ Maximum {cls.MAX_ORDERS_PER_QUERY} order numbers allowed. Only querying first {cls.MAX_ORDERS_PER_QUERY}.")
+            order_list = order_list[:cls.MAX_ORDERS_PER_QUERY]
+        
+        return order_list, ','.join(order_list)
+    
+    @classmethod
+    def validate_order_numbers(cls, order_numbers: str, max_orders: Optional[int] = MAX_ORDERS_PER_QUERY) -> Tuple[bool, str]:
+        """
+        Validate a comma-separated order number string
+        
+        Args:
+            order_numbers: Customer order numbers, comma-separated
+            max_orders: Maximum number of orders allowed (None for no limit, e.g. bulk queries)
+            
+        Returns:
+            (is_valid, message) tuple
+        """
+        parts = [num.strip() for num in order_numbers.split(',')]
+        if not any(parts):
+            return False, "No order numbers provided"
+        if not all(parts):
+            return False, "Empty order number found (check for doubled or trailing commas)"
+        if max_orders is not None and len(parts) > max_orders:
+            return False, f"Maximum {max_orders} order numbers allowed, got {len(parts)}"
+        return True, f"{len(parts)} order number(s)"
+    
+    @staticmethod
+    def _iter_unique_order_numbers(order_numbers: Iterable[str]) -> Iterator[str]:
+        """Yield stripped, de-duplicated order numbers (a single string is split on commas)"""
+        if isinstance(order_numbers, str):
+            order_numbers = order_numbers.split(',')
+        
+        seen = set()
+        for num in order_numbers:
+            num = num.strip()
+            if num and num not in seen:
+                seen.add(num)
+                yield num
+    
+    @classmethod
+    def _merge_shipment_chunk(cls, merged: Dict, chunk: List[str], result: Optional[Dict]):
+        """
+        Fold one /queryYunDanDetail response into a bulk result
+        
+        Args:
+            merged: Bulk result being built (see query_shipments_bulk)
+            chunk: Order numbers sent in this request
+            result: Response body, or None if the request failed
+        """
+        if result is None or not (result.get("success") or result.get("statusCode") == 200):
+            message = "Request failed" if result is None else result.get("message", "Unknown error")
+            merged["failed_chunks"].append({"orders": chunk, "message": message})
+            return
+        
+        requested = set(chunk)
+        for record in result.get("data") or []:
+            for field in cls.ORDER_NUMBER_FIELDS:
+                if record.get(field) in requested:
+                    merged["data"][record[field]] = record
+                    break
+        
+        merged["not_found"].extend(num for num in chunk if num not in merged["data"])
     
     @staticmethod
     def load_config(config_path: str = "config.json") -> Dict:
@@ -152,64 +391,308 @@ class YiDiDaClient:
         Returns:
             List of label request dictionaries
         """
-        with open(template_path, 'r', encoding='utf-8') as f:
-            template_str = f.read()
-        
         # If config is provided, substitute variables like {{defaults.key}}
-        if config:
-            template_str = YiDiDaClient._substitute_variables(template_str, config)
+        template = CompiledTemplate.from_file(template_path)
+        return template.render(config) if config else template.data
+    
+    @staticmethod
+    def save_label_template(label_requests: List[Dict], template_path: str = "label_template.json"):
+        """
+        Save label requests to JSON file
         
-        return json.loads(template_str)
+        Args:
+            label_requests: List of label request dictionaries
+            template_path: Path to save template file
+        """
+        with open(template_path, 'w', encoding='utf-8') as f:
+            json.dump(label_requests, f, indent=2, ensure_ascii=False)
+        logger.info(f"✓ Template saved to {template_path}")
     
     @staticmethod
-    def _substitute_variables(template_str: str, config: Dict) -> str:
+    def load_price_template(template_path: str = "price_template.json", config: Optional[Dict] = None) -> Dict:
+        """
+        Load price query template from JSON file and optionally substitute config values
+        
+        Args:
+            template_path: Path to template file
+            config: Optional config dictionary to substitute variables (use {{defaults.key}} in template)
+            
+        Returns:
+            Price query parameters dictionary
+        """
+        # If config is provided, substitute variables like {{defaults.key}}
+        template = CompiledTemplate.from_file(template_path)
+        return template.render(config) if config else template.data
+
+
+class YiDiDaClient(BaseYiDiDaClient):
+    """Client for interacting with YiDiDa shipping label API"""
+    
+    def __init__(self, base_url: str, username: str, password: str, pool_maxsize: int = 10,
+                 quote_cache: Optional[QuoteCache] = None, token_manager: Optional[TokenManager] = None,
+                 request_policy: Optional[RequestPolicy] = None, metrics: Optional[ClientMetrics] = None,
+                 address_cache: Optional[AddressCache] = None):
+        """
+        Initialize the YiDiDa API client
+        
+        Args:
+            base_url: Base URL for the API (e.g., http://twc.itdida.com/itdida-api)
+            username: Your YiDiDa username
+            password: Your YiDiDa password
+            pool_maxsize: Connections kept per host, raise it when sharing the client across threads
+            quote_cache: Optional QuoteCache (see yidida_cache.py) consulted by query_price
+            token_manager: Optional TokenManager (see yidida_auth.py) for cached tokens and re-login
+            request_policy: Timeouts, retries and rate limit (see yidida_policy.py)
+            metrics: Per-endpoint metrics registry (see yidida_metrics.py)
+            address_cache: Optional AddressCache (see yidida_cache.py) consulted by create_labels
+        """
+        super().__init__(base_url, username, password, quote_cache, token_manager, request_policy, metrics,
+                         address_cache)
+        self.session = requests.Session()
+        
+        self.resize_pool(pool_maxsize)
+    
+    def resize_pool(self, pool_maxsize: int):
+        """
+        Mount one pooled adapter so concurrent callers reuse keep-alive connections
+        
+        Args:
+            pool_maxsize: Connections kept per host
+        """
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+    
+    def _apply_token(self, token: str):
+        """Set token in session headers"""
+        self.session.headers.update({"Authorization": token})
+        
+    def login(self, force: bool = False) -> bool:
         """
-        Replace variables in template string with config values
-        Variables format: {{key.subkey}}
+        Login to YiDiDa API and obtain authentication token
+        
+        With a token manager, a cached token is reused and no request is made.
         
         Args:
-            template_str: Template string with variables
-            config: Configuration dictionary
+            force: Always call /login, even if a cached token is available
             
         Returns:
-            Template string with variables replaced
+            bool: True if login successful, False otherwise
+        """
+        if self.token_manager is not None:
+            return self.token_manager.login(self, force=force)
+        return self._login_request()
+    
+    def _login_request(self) -> bool:
+        """
+        Call /login and store the returned token
+        
+        Returns:
+            bool: True if login successful, False otherwise
+        """
+        try:
+            # YiDiDa API requires form data, not JSON
+            response = self._send(
+                "POST",
+                self.LOGIN_ENDPOINT,
+                authenticated=False,
+                data=self._login_payload()
+            )
+            
+            if response.status_code == 200:
+                return self._accept_login(response.json())
+            else:
+                logger.error(f"✗ Login failed with status code {response.status_code}")
+                logger.debug(f"Response: {response.text}")
+                return False
+                
+        except requests.exceptions.RequestException as e:
+            logger.error(f"✗ Login request failed: {e}")
+            return False
+    
+    def _send(self, method: str, endpoint: str, authenticated: bool = True, **kwargs) -> requests.Response:
         """
-        import re
+        Send a request under the endpoint's request policy
         
-        # Find all {{...}} patterns - matches "{{variable}}"
-        pattern = r'"{{([^}]+)}}"'
+        - Waits for the shared rate limiter before every attempt
+        - Retries transient failures with exponential backoff and jitter, honoring Retry-After
+          (non-idempotent endpoints only on 429 or when the connection was never established)
+        - Re-logs in and replays once if the token is rejected, which is safe for every
+          endpoint because a rejected request was not processed
         
-        def replace_var(match):
-            var_path = match.group(1).strip()
+        Args:
+            method: HTTP method
+            endpoint: Endpoint path (one of the *_ENDPOINT constants)
+            authenticated: False for /login itself
+            **kwargs: Extra arguments for requests (json, params, data, ...)
             
-            # Navigate through nested config
-            keys = var_path.split('.')
-            value = config
-            try:
-                for key in keys:
-                    value = value[key]
-                # Return JSON-formatted value
-                return json.dumps(value, ensure_ascii=False)
-            except (KeyError, TypeError):
-                # If key not found, return original
-                return match.group(0)
+        Returns:
+            requests.Response of the last attempt
+            
+        Raises:
+            requests.exceptions.RequestException: When the last attempt failed at the transport level
+        """
+        url = self._url(endpoint)
+        policy = self.request_policy.for_endpoint(endpoint)
+        kwargs.setdefault("timeout", policy.timeout)
         
-        return re.sub(pattern, replace_var, template_str)
+        manager = self.token_manager if authenticated else None
+        if manager is not None and manager.is_expired(self):
+            manager.relogin(self, self.token)
+        
+        policy.budget.deposit()
+        attempt = 0
+        auth_replayed = False
+        while True:
+            attempt += 1
+            if self.request_policy.rate_limiter is not None:
+                self.request_policy.rate_limiter.acquire()
+            
+            token = self.token
+            started = self.metrics.request_started(endpoint)
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.exceptions.RequestException as e:
+                self.metrics.request_finished(endpoint, started, error=e.__class__.__name__)
+                if self._is_retryable_error(e, policy) and policy.can_retry(attempt):
+                    delay = policy.backoff(attempt)
+                    logger.warning(f"⚠ {endpoint} request failed ({e.__class__.__name__}), "
+                                   f"retrying in {delay:.1f}s (attempt {attempt + 1}/{policy.max_attempts})")
+                    time.sleep(delay)
+                    continue
+                raise
+            
+            body = response.request.body
+            self.metrics.request_finished(endpoint, started, response.status_code,
+                                          len(body) if body else 0, len(response.content))
+            
+            if manager is not None and not auth_replayed and self._response_auth_failed(response):
+                auth_replayed = True
+                if manager.relogin(self, token):
+                    attempt -= 1
+                    continue
+            
+            if response.status_code in policy.retry_statuses and policy.can_retry(attempt):
+                delay = policy.backoff(attempt, parse_retry_after(response.headers.get("Retry-After")))
+                logger.warning(f"⚠ {endpoint} returned HTTP {response.status_code}, "
+                               f"retrying in {delay:.1f}s (attempt {attempt + 1}/{policy.max_attempts})")
+                time.sleep(delay)
+                continue
+            
+            return response
     
     @staticmethod
-    def save_label_template(label_requests: List[Dict], template_path: str = "label_template.json"):
+    def _is_retryable_error(error: requests.exceptions.RequestException, policy: EndpointPolicy) -> bool:
         """
-        Save label requests to JSON file
+        Decide whether a transport error may be retried
+        
+        Idempotent endpoints retry any connection error or timeout. Non-idempotent ones only
+        retry when the connection was never established, so the server cannot have seen the request.
+        """
+        if policy.idempotent:
+            return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+        
+        if isinstance(error, requests.exceptions.ConnectTimeout):
+            return True
+        reason = getattr(error.args[0], "reason", None) if error.args else None
+        return isinstance(error, requests.exceptions.ConnectionError) and isinstance(reason, ConnectTimeoutError)
+    
+    def _response_auth_failed(self, response: requests.Response) -> bool:
+        """Check a response for a rejected token (only small bodies are parsed)"""
+        body = None
+        if response.status_code == 200 and len(response.content) < 1024:
+            try:
+                body = response.json()
+            except ValueError:
+                pass
+        return self._is_auth_failure(response.status_code, body)
+    
+    def create_labels(self, label_requests: List[Dict]) -> Optional[Dict]:
+        """
+        Create shipping labels using YiDiDa API
         
         Args:
             label_requests: List of label request dictionaries
-            template_path: Path to save template file
+            
+        Returns:
+            API response dictionary if successful, None otherwise
         """
-        with open(template_path, 'w', encoding='utf-8') as f:
-            json.dump(label_requests, f, indent=2, ensure_ascii=False)
-        logger.info(f"✓ Template saved to {template_path}")
+        if not self._require_login():
+            return None
+        
+        fetched = self._fetch_labels(label_requests)
+        return fetched[1] if fetched is not None else None
+    
+    def create_label_results(self, label_requests: List[Dict], keep_raw: bool = False) -> Optional[List[LabelResult]]:
+        """
+        Create shipping labels and return compact per-order results instead of the response dict
+        
+        Args:
+            label_requests: List of label request dictionaries
+            keep_raw: Keep the response bytes so each result's `raw` entry can be read later
+            
+        Returns:
+            One LabelResult per data entry, or None if the request failed
+        """
+        if not self._require_login():
+            return None
+        
+        fetched = self._fetch_labels(label_requests)
+        if fetched is None:
+            return None
+        return parse_label_results(fetched[1], keep_raw, raw_body=fetched[0])
+    
+    def _fetch_labels(self, label_requests: List[Dict]) -> Optional[Tuple[bytes, Dict]]:
+        """POST /yundans/ and log the outcome; returns (body bytes, decoded body)"""
+        label_requests = self._apply_address_cache(label_requests)
+        logger.debug(f"Creating labels at: {self._url(self.LABELS_ENDPOINT)}")
+        fetched = self._fetch(
+            "POST",
+            self.LABELS_ENDPOINT,
+            "Label creation",
+            json=label_requests,
+            headers={"Content-Type": "application/json"}
+        )
+        if fetched is not None:
+            self._check_result(fetched[1], self.LABELS_ENDPOINT, "Label creation", success_key="code")
+            # The request can succeed while single orders are refused with their own code
+            rejected = [item for item in response_items(fetched[1]) if item.get("code") not in (None, 200)]
+            if rejected:
+                first = rejected[0]
+                logger.warning(
+                    f"⚠ {len(rejected)} of {len(label_requests)} order(s) rejected, e.g. "
+                    f"{first.get('keHuDanHao')}: {first.get('code')} {first.get('message')}"
+                )
+            self._record_addresses(label_requests, fetched[1])
+        return fetched
     
-    def query_price(self, price_params: Dict) -> Optional[Dict]:
+    def _fetch(self, method: str, endpoint: str, action: str, **kwargs) -> Optional[Tuple[bytes, Dict]]:
+        """
+        Send a request and decode its JSON body
+        
+        Args:
+            method: HTTP method
+            endpoint: Endpoint path
+            action: Human readable action name used in log lines
+            **kwargs: Passed to _send
+            
+        Returns:
+            (body bytes, decoded body), or None if the request failed
+        """
+        try:
+            response = self._send(method, endpoint, **kwargs)
+            response.raise_for_status()
+            
+            content = response.content
+            return content, json.loads(content)
+                
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.error(f"✗ {action} request failed: {e}")
+            if hasattr(e, 'response') and hasattr(e.response, 'text'):
+                logger.debug(f"Response body: {e.response.text}")
+            return None
+    
+    def query_price(self, price_params: Dict, fresh: bool = False) -> Optional[Dict]:
         """
         Query shipping rates/prices using YiDiDa API
         
@@ -221,43 +704,54 @@ class YiDiDaClient:
                 - weight (float, required): Weight in kg
                 - toCustomer (dict, optional): Recipient info with countryCode, postcode, city, stateCode
                 - Other optional parameters as per API documentation
+            fresh: Skip the quote cache and ask the API (the new response is still cached)
             
         Returns:
             API response dictionary if successful, None otherwise
         """
-        if not self.token:
-            logger.error("✗ Not logged in. Please call login() first.")
+        if not self._require_login():
             return None
         
-        price_url = f"{self.base_url}/price"
+        cached = None if fresh else self._cached_quote(price_params)
+        if cached is not None:
+            return cached
+        
+        return self.price_flight.do(canonical_price_key(price_params), lambda: self._fetch_price(price_params))
+    
+    def _fetch_price(self, price_params: Dict) -> Optional[Dict]:
+        """POST /price, log the outcome and cache a successful response"""
+        price_url = self._url(self.PRICE_ENDPOINT)
         logger.debug(f"Querying prices at: {price_url}")
-        logger.debug(f"Query parameters: {json.dumps(price_params, indent=2, ensure_ascii=False)}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Query parameters: {json.dumps(price_params, indent=2, ensure_ascii=False)}")
         
-        try:
-            response = self.session.post(
-                price_url,
-                json=price_params,
-                headers={"Content-Type": "application/json"},
-                timeout=30
-            )
-            response.raise_for_status()
-            
-            result = response.json()
-            logger.debug(f"API Response: {json.dumps(result, indent=2, ensure_ascii=False)}")
-            
-            if result.get("success") or result.get("statusCode") == 200:
-                logger.info(f"✓ Price query successful!")
-                return result
-            else:
-                logger.error(f"✗ Price query failed: {result.get('message', 'Unknown error')}")
-                logger.debug(f"Response: {json.dumps(result, indent=2)}")
-                return result
-                
-        except requests.exceptions.RequestException as e:
-            logger.error(f"✗ Price query request failed: {e}")
-            if hasattr(e, 'response') and hasattr(e.response, 'text'):
-                logger.debug(f"Response body: {e.response.text}")
+        fetched = self._fetch(
+            "POST",
+            self.PRICE_ENDPOINT,
+            "Price query",
+            json=price_params,
+            headers={"Content-Type": "application/json"}
+        )
+        if fetched is None:
             return None
+        
+        result = self._check_result(fetched[1], self.PRICE_ENDPOINT, "Price query")
+        self._store_quote(price_params, result)
+        return result
+    
+    def query_price_quotes(self, price_params: Dict, keep_raw: bool = False) -> Optional[List[PriceQuote]]:
+        """
+        Query shipping rates and return compact quotes (cached responses are used as in query_price)
+        
+        Args:
+            price_params: Price query parameters (see query_price)
+            keep_raw: Keep the response so each quote's `raw` entry can be read later
+            
+        Returns:
+            One PriceQuote per quote in the response, or None if the request failed
+        """
+        result = self.query_price(price_params)
+        return parse_price_quotes(result, keep_raw) if result is not None else None
     
     def query_shipment(self, order_numbers: str) -> Optional[Dict]:
         """
@@ -270,67 +764,81 @@ class YiDiDaClient:
         Returns:
             API response dictionary if successful, None otherwise
         """
-        if not self.token:
-            logger.error("✗ Not logged in. Please call login() first.")
+        if not self._require_login():
             return None
         
         # Validate order numbers
-        order_list = [num.strip() for num in order_numbers.split(',') if num.strip()]
-        if not order_list:
-            logger.error("✗ No order numbers provided.")
+        prepared = self._prepare_order_numbers(order_numbers)
+        if prepared is None:
             return None
+        order_list, order_numbers = prepared
         
-        if len(order_list) > 10:
-            logger.warning(f"⚠ Maximum 10 order numbers allowed. Only querying first 10.")
-            order_list = order_list[:10]
-            order_numbers = ','.join(order_list)
-        
-        query_url = f"{self.base_url}/queryYunDanDetail"
-        logger.debug(f"Querying shipment at: {query_url}")
-        logger.info(f"Querying {len(order_list)} order(s): {order_numbers}")
+        fetched = self._fetch_shipment(order_list, order_numbers)
+        return fetched[1] if fetched is not None else None
+    
+    def query_tracking_records(self, order_numbers: str, keep_raw: bool = False) -> Optional[List[TrackingRecord]]:
+        """
+        Query shipment details and return compact tracking records instead of the response dict
         
-        try:
-            response = self.session.get(
-                query_url,
-                params={"danHaos": order_numbers},
-                timeout=30
-            )
-            response.raise_for_status()
-            
-            result = response.json()
-            logger.debug(f"API Response: {json.dumps(result, indent=2, ensure_ascii=False)}")
+        Args:
+            order_numbers: Customer order numbers, comma-separated (max 10)
+            keep_raw: Keep the response bytes so each record's `raw` entry can be read later
             
-            if result.get("success") or result.get("statusCode") == 200:
-                logger.info(f"✓ Shipment query successful!")
-                return result
-            else:
-                logger.error(f"✗ Shipment query failed: {result.get('message', 'Unknown error')}")
-                logger.debug(f"Response: {json.dumps(result, indent=2)}")
-                return result
-                
-        except requests.exceptions.RequestException as e:
-            logger.error(f"✗ Shipment query request failed: {e}")
-            if hasattr(e, 'response') and hasattr(e.response, 'text'):
-                logger.debug(f"Response body: {e.response.text}")
+        Returns:
+            One TrackingRecord per record in the response, or None if the request failed
+        """
+        if not self._require_login():
+            return None
+        
+        prepared = self._prepare_order_numbers(order_numbers)
+        if prepared is None:
             return None
+        
+        fetched = self._fetch_shipment(*prepared)
+        if fetched is None:
+            return None
+        return parse_tracking_records(fetched[1], keep_raw, raw_body=fetched[0])
     
-    @staticmethod
-    def load_price_template(template_path: str = "price_template.json", config: Optional[Dict] = None) -> Dict:
+    def _fetch_shipment(self, order_list: List[str], order_numbers: str) -> Optional[Tuple[bytes, Dict]]:
+        """GET /queryYunDanDetail and log the outcome; returns (body bytes, decoded body)"""
+        logger.debug(f"Querying shipment at: {self._url(self.SHIPMENT_ENDPOINT)}")
+        logger.info(f"Querying {len(order_list)} order(s): {order_numbers}")
+        
+        fetched = self._fetch("GET", self.SHIPMENT_ENDPOINT, "Shipment query", params={"danHaos": order_numbers})
+        if fetched is not None:
+            self._check_result(fetched[1], self.SHIPMENT_ENDPOINT, "Shipment query")
+        return fetched
+    
+    def query_shipments_bulk(self, order_numbers: Iterable[str], workers: int = 4) -> Dict:
         """
-        Load price query template from JSON file and optionally substitute config values
+        Query any number of shipments by fanning out 10-order requests in parallel
+        
+        The input is consumed lazily and at most `workers * 2` requests are pending at once.
         
         Args:
-            template_path: Path to template file
-            config: Optional config dictionary to substitute variables (use {{defaults.key}} in template)
+            order_numbers: Iterable of customer order numbers (or one comma-separated string)
+            workers: Number of concurrent /queryYunDanDetail requests
             
         Returns:
-            Price query parameters dictionary
+            Dictionary with:
+                - success (bool): True if every chunk succeeded
+                - data (dict): Tracking record per order number
+                - failed_chunks (list): {"orders": [...], "message": ...} per failed request
+                - not_found (list): Order numbers the API returned no record for
         """
-        with open(template_path, 'r', encoding='utf-8') as f:
-            template_str = f.read()
+        merged = {"success": True, "data": {}, "failed_chunks": [], "not_found": []}
+        if not self._require_login():
+            merged["success"] = False
+            return merged
         
-        # If config is provided, substitute variables like {{defaults.key}}
-        if config:
-            template_str = YiDiDaClient._substitute_variables(template_str, config)
+        chunks = iter_chunks(self._iter_unique_order_numbers(order_numbers), self.MAX_ORDERS_PER_QUERY)
+        query = lambda chunk: self.query_shipment(','.join(chunk))
+        for chunk, result in bounded_map(query, chunks, workers):
+            self._merge_shipment_chunk(merged, chunk, result)
         
-        return json.loads(template_str)
+        merged["success"] = not merged["failed_chunks"]
+        logger.info(
+            f"Bulk shipment query: {len(merged['data'])} found, {len(merged['not_found'])} not found, "
+            f"{len(merged['failed_chunks'])} failed request(s)"
+        )
+        return merged
@@ -0,0 +1,264 @@
+"""
+Request coalescing for concurrent callers
+
+- SingleFlight / AsyncSingleFlight: callers asking for the same key while a call is in flight
+  wait for that call and share its result instead of sending their own request
+- TrackingBatcher: single-order tracking lookups arriving within a short window are packed
+  into one /queryYunDanDetail request (up to 10 orders), and each caller gets its own record
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """Thread-safe single-flight: one call per key at a time, shared by every concurrent caller"""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.shared = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """
+        Run fn, or wait for the call already running for this key
+
+        Args:
+            key: Identity of the request (e.g. canonical_price_key(params))
+            fn: Makes the request; its result (or exception) is handed to every waiter
+
+        Returns:
+            fn's result (the same object for every caller, so treat it as read-only)
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                self.calls += 1
+            else:
+                self.shared += 1
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def stats(self) -> Dict:
+        """calls (requests made), shared (callers served by another caller's request)"""
+        with self._lock:
+            return {"calls": self.calls, "shared": self.shared, "in_flight": len(self._calls)}
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines running on one event loop"""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self.calls = 0
+        self.shared = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """
+        Await fn(), or the call already running for this key
+
+        Args:
+            key: Identity of the request
+            fn: Returns the awaitable making the request
+        """
+        future = self._calls.get(key)
+        if future is not None:
+            self.shared += 1
+            # shield: a cancelled waiter must not cancel the shared call
+            return await asyncio.shield(future)
+
+        self.calls += 1
+        future = self._calls[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await fn()
+        except BaseException as e:
+            future.set_exception(e)
+            # Retrieved here so an unawaited failure is not reported as "never retrieved"
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._calls[key]
+
+    def stats(self) -> Dict:
+        return {"calls": self.calls, "shared": self.shared, "in_flight": len(self._calls)}
+
+
+class TrackingLookupError(RuntimeError):
+    """The /queryYunDanDetail request carrying an order failed"""
+
+
+class TrackingBatcher:
+    """
+    Micro-batcher for single-order tracking lookups
+
+    The first lookup of a window starts a `window`-second timer; the batch is sent when
+    the timer fires or as soon as `max_batch` distinct orders are waiting. Lookups for an
+    order that is already waiting or in flight join that lookup.
+    """
+
+    def __init__(self, client, window: float = 0.02, max_batch: Optional[int] = None, workers: int = 4):
+        """
+        Args:
+            client: YiDiDaClient or ClientPool (anything with query_shipment and _merge_shipment_chunk)
+            window: Seconds to wait for more orders after the first one arrives
+            max_batch: Orders per request (default and maximum: the client's MAX_ORDERS_PER_QUERY)
+            workers: Batch requests in flight at once
+        """
+        self.client = client
+        self.window = window
+        self.max_batch = min(max_batch or client.MAX_ORDERS_PER_QUERY, client.MAX_ORDERS_PER_QUERY)
+        self.workers = workers
+        self._pending: "OrderedDict[str, Future]" = OrderedDict()
+        self._in_flight: Dict[str, Future] = {}
+        self._window_started = 0.0
+        self._cond = threading.Condition()
+        self._executor = None
+        self._dispatcher = None
+        self._closed = False
+        self.lookups = 0
+        self.joined = 0
+        self.requests = 0
+
+    @classmethod
+    def from_config(cls, client, config: Dict) -> "TrackingBatcher":
+        """
+        Build a batcher from the optional "coalescing" section of config.json
+
+        Example:
+            "coalescing": {"tracking_window_ms": 20, "tracking_workers": 4}
+        """
+        coalescing_config = config.get("coalescing", {})
+        return cls(client, coalescing_config.get("tracking_window_ms", 20) / 1000,
+                   workers=coalescing_config.get("tracking_workers", 4))
+
+    def submit(self, order_no: str) -> Future:
+        """
+        Queue one order for the next batch
+
+        Returns:
+            Future resolving to the tracking record, None when the order was not found, or
+            raising TrackingLookupError when its request failed
+        """
+        order_no = str(order_no).strip()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("TrackingBatcher is closed")
+            self.lookups += 1
+            future = self._pending.get(order_no) or self._in_flight.get(order_no)
+            if future is not None:
+                self.joined += 1
+                return future
+
+            if self._dispatcher is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers)
+                self._dispatcher = threading.Thread(target=self._dispatch, name="tracking-batcher", daemon=True)
+                self._dispatcher.start()
+            if not self._pending:
+                self._window_started = time.monotonic()
+            future = self._pending[order_no] = Future()
+            if len(self._pending) == 1 or len(self._pending) >= self.max_batch:
+                self._cond.notify()
+            return future
+
+    def lookup(self, order_no: str, timeout: Optional[float] = None) -> Optional[Dict]:
+        """
+        Tracking record of one order, batched with concurrent lookups
+
+        Returns:
+            The record, or None when the order was not found or its request failed (logged)
+        """
+        try:
+            return self.submit(order_no).result(timeout)
+        except TrackingLookupError as e:
+            logger.error(f"✗ Tracking lookup for {order_no} failed: {e}")
+            return None
+
+    def _dispatch(self):
+        """Dispatcher thread: cut batches when full or when the window expires"""
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                while len(self._pending) < self.max_batch and not self._closed:
+                    remaining = self._window_started + self.window - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+                batch = {}
+                while self._pending and len(batch) < self.max_batch:
+                    order_no, future = self._pending.popitem(last=False)
+                    batch[order_no] = future
+                self._in_flight.update(batch)
+                # Orders left over have waited a full window already and go out next
+                self.requests += 1
+            self._executor.submit(self._query, batch)
+
+    def _query(self, batch: Dict[str, Future]):
+        order_list = list(batch)
+        merged = {"data": {}, "failed_chunks": [], "not_found": []}
+        try:
+            result = self.client.query_shipment(",".join(order_list))
+            self.client._merge_shipment_chunk(merged, order_list, result)
+        except Exception as e:
+            merged["failed_chunks"] = [{"orders": order_list, "message": str(e)}]
+
+        with self._cond:
+            for order_no in order_list:
+                self._in_flight.pop(order_no, None)
+        for order_no, future in batch.items():
+            if merged["failed_chunks"]:
+                future.set_exception(TrackingLookupError(merged["failed_chunks"][0]["message"]))
+            else:
+                future.set_result(merged["data"].get(order_no))
+
+    def close(self):
+        """Send what is still waiting and stop the dispatcher"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._dispatcher is not None:
+            self._dispatcher.join()
+            self._executor.shutdown(wait=True)
+
+    def stats(self) -> Dict:
+        """
+        Returns:
+            lookups, joined (served by a lookup already waiting or in flight), requests,
+            orders_per_request and calls_saved (lookups that needed no request of their own)
+        """
+        with self._cond:
+            sent = self.lookups - self.joined - len(self._pending)
+            return {
+                "lookups": self.lookups,
+                "joined": self.joined,
+                "requests": self.requests,
+                "orders_per_request": sent / self.requests if self.requests else 0.0,
+                "calls_saved": self.lookups - self.requests - len(self._pending),
+            }
@@ -0,0 +1,83 @@
+"""
+Application context: config loaded once and one logged-in client shared by every module in a process
+"""
+import json
+import logging
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class AppContext:
+    """
+    Per-process state shared by main.py and the modules
+
+    Nothing heavy happens on construction: config.json is read on first use, and the
+    client (and with it `requests`) is only imported and built when a module needs it.
+    """
+
+    def __init__(self, config_path: str = "config.json", config: Optional[Dict] = None):
+        """
+        Args:
+            config_path: Path to config.json
+            config: Already loaded configuration (skips reading config_path)
+        """
+        self.config_path = config_path
+        self._config = config
+        self._client = None
+        self._pool_maxsize = 0
+        self._store = None
+
+    @property
+    def config(self) -> Dict:
+        """Configuration, read from config_path the first time it is needed"""
+        if self._config is None:
+            with open(self.config_path, 'r', encoding='utf-8') as f:
+                self._config = json.load(f)
+        return self._config
+
+    def client(self, pool_maxsize: int = 10):
+        """
+        The shared client, built on first use
+
+        With an "accounts" section in config.json this is a ClientPool (yidida_pool.py) spreading
+        work over every account; it offers the same calls as YiDiDaClient.
+
+        Args:
+            pool_maxsize: Connections the caller will use concurrently; the pool grows if a later
+                          caller needs more than the first one asked for
+
+        Returns:
+            YiDiDaClient or ClientPool
+        """
+        if self._client is None:
+            if self.config.get("accounts"):
+                from yidida_pool import ClientPool
+                self._client = ClientPool.from_config(self.config, pool_maxsize=pool_maxsize)
+            else:
+                from yidida_client import YiDiDaClient
+                self._client = YiDiDaClient.from_config(self.config, pool_maxsize=pool_maxsize)
+            self._pool_maxsize = pool_maxsize
+        elif pool_maxsize > self._pool_maxsize:
+            self._client.resize_pool(pool_maxsize)
+            self._pool_maxsize = pool_maxsize
+        return self._client
+
+    def login(self, pool_maxsize: int = 10):
+        """
+        The shared client, logged in once per process (or reusing the cached token)
+
+        Returns:
+            Logged-in YiDiDaClient (or ClientPool), or None if login failed
+        """
+        client = self.client(pool_maxsize)
+        if client.token or client.login():
+            return client
+        return None
+
+    def store(self):
+        """The shared ResponseStore"""
+        if self._store is None:
+            from yidida_store import ResponseStore
+            self._store = ResponseStore.from_config(self.config)
+        return self._store
@@ -0,0 +1,234 @@
+"""
+Write-ahead journal for label jobs: every order is recorded as pending → submitted → confirmed
+so an interrupted bulk run can be restarted without creating duplicate waybills
+"""
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set
+
+from yidida_client import YiDiDaClient, iter_chunks
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"        # known, not sent yet: safe to submit
+SUBMITTED = "submitted"    # sent, outcome unknown: must be re-checked before any resubmission
+CONFIRMED = "confirmed"    # waybill created: never submit again
+REJECTED = "rejected"      # refused by the API: no waybill exists, may be submitted again
+
+# SQLite limits the number of parameters per statement
+_LOOKUP_CHUNK = 500
+
+# A submitted mark older than this cannot belong to a request still in flight
+# (the /yundans/ timeout is 120 s): sweeps with min_age=SUBMIT_GRACE never touch live orders
+SUBMIT_GRACE = 600
+
+
+class LabelJournal:
+    """
+    SQLite journal keyed by keHuDanHao (WAL mode, one connection per thread)
+
+    Orders are claimed (marked submitted) immediately before their /yundans/ request is sent;
+    the claim is atomic, so of several runs sharing the journal only one sends a given order.
+    After a crash, orders still marked submitted are "in doubt": recover() looks them up
+    with query_shipments_bulk instead of resending them, so each order is created at most once.
+    """
+
+    def __init__(self, path: str = "output/label_journal.db"):
+        """
+        Args:
+            path: SQLite database file
+        """
+        self.path = path
+        self._local = threading.local()
+
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS label_journal ("
+                "keHuDanHao TEXT PRIMARY KEY, job TEXT, state TEXT NOT NULL, waybillId TEXT, zhuanDanHao TEXT, "
+                "code TEXT, message TEXT, attempts INTEGER NOT NULL DEFAULT 0, updated_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS label_journal_state ON label_journal (state)")
+
+    @classmethod
+    def from_config(cls, config: Dict) -> "LabelJournal":
+        """
+        Build a journal from the optional "label_journal" section of config.json
+
+        Example:
+            "label_journal": {"path": "output/label_journal.db"}
+        """
+        return cls(config.get("label_journal", {}).get("path", "output/label_journal.db"))
+
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread; sqlite3 connections must not be shared across threads"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # FULL: a "submitted" mark must be on disk before the request leaves
+            conn.execute("PRAGMA synchronous=FULL")
+            self._local.conn = conn
+        return conn
+
+    def states(self, order_numbers: Iterable[str]) -> Dict[str, str]:
+        """Current state of each journaled order number (unknown ones are omitted)"""
+        conn = self._connection()
+        states = {}
+        for chunk in iter_chunks(order_numbers, _LOOKUP_CHUNK):
+            rows = conn.execute(
+                f"SELECT keHuDanHao, state FROM label_journal WHERE keHuDanHao IN ({', '.join('?' * len(chunk))})",
+                chunk
+            )
+            states.update(rows)
+        return states
+
+    def mark_pending(self, order_numbers: List[str], job: Optional[str] = None):
+        """Record orders about to be queued; orders already submitted or confirmed are left as they are"""
+        conn = self._connection()
+        now = time.time()
+        with conn:
+            conn.executemany(
+                "INSERT INTO label_journal (keHuDanHao, job, state, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (keHuDanHao) DO UPDATE SET state = excluded.state, job = excluded.job, "
+                "updated_at = excluded.updated_at WHERE label_journal.state = ?",
+                [(order_no, job, PENDING, now, REJECTED) for order_no in order_numbers]
+            )
+
+    def mark_submitted(self, order_numbers: List[str], job: Optional[str] = None) -> Set[str]:
+        """
+        Claim orders for sending (write-ahead mark); call right before sending the request
+
+        Only pending or rejected orders are claimed, in one write transaction: an order another
+        run has claimed (submitted) or created (confirmed) in the meantime is not.
+
+        Args:
+            order_numbers: Orders about to be sent
+            job: Claiming job, recorded so recover(job=...) finds the orders it sent
+
+        Returns:
+            The order numbers claimed; send only these
+        """
+        conn = self._connection()
+        now = time.time()
+        claimed = set()
+        with conn:
+            # Take the write lock before reading so concurrent claims are serialized
+            conn.execute("BEGIN IMMEDIATE")
+            for order_no in order_numbers:
+                cursor = conn.execute(
+                    "UPDATE label_journal SET state = ?, job = COALESCE(?, job), attempts = attempts + 1, "
+                    "updated_at = ? WHERE keHuDanHao = ? AND state IN (?, ?)",
+                    (SUBMITTED, job, now, order_no, PENDING, REJECTED)
+                )
+                if cursor.rowcount:
+                    claimed.add(order_no)
+        return claimed
+
+    def record_outcomes(self, rows: List[Dict]):
+        """
+        Store per-order outcomes of a /yundans/ response
+
+        Args:
+            rows: Dicts with keHuDanHao and the new state (CONFIRMED or REJECTED),
+                  plus code, message and zhuanDanHao/waybillId when known
+        """
+        conn = self._connection()
+        now = time.time()
+        with conn:
+            conn.executemany(
+                "UPDATE label_journal SET state = ?, waybillId = ?, zhuanDanHao = ?, code = ?, message = ?, "
+                "updated_at = ? WHERE keHuDanHao = ?",
+                [
+                    (row["state"], row.get("waybillId"), row.get("zhuanDanHao"),
+                     str(row["code"]) if row.get("code") is not None else None, row.get("message"), now,
+                     row["keHuDanHao"])
+                    for row in rows if row.get("keHuDanHao")
+                ]
+            )
+
+    def in_doubt(self, job: Optional[str] = None, min_age: float = 0,
+                 order_numbers: Optional[Iterable[str]] = None) -> List[str]:
+        """
+        Order numbers that were sent without a recorded outcome
+
+        Args:
+            job: Only orders last claimed by this job
+            min_age: Only orders marked submitted at least this many seconds ago
+            order_numbers: Only these orders
+        """
+        conn = self._connection()
+        query = "SELECT keHuDanHao FROM label_journal WHERE state = ? AND updated_at <= ?"
+        params = (SUBMITTED, time.time() - min_age)
+        if job is not None:
+            query += " AND job = ?"
+            params += (job,)
+        if order_numbers is None:
+            return [row[0] for row in conn.execute(query, params)]
+
+        in_doubt = []
+        for chunk in iter_chunks(order_numbers, _LOOKUP_CHUNK):
+            rows = conn.execute(f"{query} AND keHuDanHao IN ({', '.join('?' * len(chunk))})", params + tuple(chunk))
+            in_doubt.extend(row[0] for row in rows)
+        return in_doubt
+
+    def recover(self, client: YiDiDaClient, workers: int = 4, order_numbers: Optional[Iterable[str]] = None,
+                job: Optional[str] = None, min_age: float = 0) -> Dict[str, int]:
+        """
+        Resolve in-doubt orders by looking them up instead of resubmitting them
+
+        Orders the API knows are confirmed; orders it reports as not found go back to
+        pending; orders whose lookup failed stay in doubt and are not resubmitted.
+
+        A request still in flight looks exactly like a lost one, so scope the lookup to orders
+        no other run can be sending: those the caller's own (dead) job claimed, or marks older
+        than SUBMIT_GRACE. Resolving another run's live order sends it twice.
+
+        Args:
+            client: Logged-in YiDiDaClient
+            workers: Concurrent 10-order lookups
+            order_numbers: Only resolve these orders (e.g. the orders of one re-delivered queue job)
+            job: Only resolve orders last claimed by this job
+            min_age: Only resolve orders marked submitted at least this many seconds ago
+
+        Returns:
+            Counters: checked, confirmed, pending, unresolved
+        """
+        in_doubt = self.in_doubt(job, min_age, order_numbers)
+        summary = {"checked": len(in_doubt), "confirmed": 0, "pending": 0, "unresolved": 0}
+        if not in_doubt:
+            return summary
+
+        logger.info(f"Re-checking {len(in_doubt)} in-doubt order(s) from an interrupted run...")
+        bulk = client.query_shipments_bulk(in_doubt, workers=workers)
+
+        self.record_outcomes([
+            {"keHuDanHao": order_no, "state": CONFIRMED, "zhuanDanHao": record.get("zhuanDanHao"),
+             "waybillId": record.get("waybillId"), "message": "Confirmed by shipment lookup"}
+            for order_no, record in bulk["data"].items()
+        ])
+
+        conn = self._connection()
+        with conn:
+            conn.executemany(
+                "UPDATE label_journal SET state = ?, updated_at = ? WHERE keHuDanHao = ? AND state = ?",
+                [(PENDING, time.time(), order_no, SUBMITTED) for order_no in bulk["not_found"]]
+            )
+
+        summary["confirmed"] = len(bulk["data"])
+        summary["pending"] = len(bulk["not_found"])
+        summary["unresolved"] = sum(len(chunk["orders"]) for chunk in bulk["failed_chunks"])
+        if summary["unresolved"]:
+            logger.warning(f"⚠ {summary['unresolved']} order(s) are still in doubt and will not be resubmitted")
+        return summary
+
+    def counts(self, job: Optional[str] = None) -> Dict[str, int]:
+        """Number of orders per state (optionally for one job)"""
+        query = "SELECT state, COUNT(*) FROM label_journal"
+        params = ()
+        if job is not None:
+            query += " WHERE job = ?"
+            params = (job,)
+        return dict(self._connection().execute(query + " GROUP BY state", params))
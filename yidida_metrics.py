@@ -0,0 +1,221 @@
+"""
+Per-endpoint latency, throughput and status metrics for the YiDiDa clients
+"""
+import json
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from typing import Dict, Optional
+
+# Histogram bucket upper bounds in seconds (Prometheus-style, cumulative on export)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram; constant memory however many requests are recorded"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """
+        Estimate a percentile by linear interpolation inside its bucket
+
+        Args:
+            q: Percentile between 0 and 100
+
+        Returns:
+            Seconds, or None when nothing was recorded
+        """
+        if not self.count:
+            return None
+
+        rank = q / 100 * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            if bucket_count and seen + bucket_count >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.max
+                return min(self.max, lower + (upper - lower) * (rank - seen) / bucket_count)
+            seen += bucket_count
+        return self.max
+
+
+class EndpointStats:
+    """Counters for one endpoint"""
+
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.requests = 0
+        self.in_flight = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.statuses = Counter()
+        self.business_codes = Counter()
+        self.errors = Counter()
+
+
+class ClientMetrics:
+    """
+    Thread-safe metrics registry; pass one instance to several clients to aggregate them
+
+    Snapshot with snapshot(), or export with to_json() / to_prometheus().
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self._endpoints: Dict[str, EndpointStats] = {}
+        self._lock = threading.Lock()
+
+    def _stats(self, endpoint: str) -> EndpointStats:
+        stats = self._endpoints.get(endpoint)
+        if stats is None:
+            stats = self._endpoints.setdefault(endpoint, EndpointStats())
+        return stats
+
+    def request_started(self, endpoint: str) -> float:
+        """
+        Mark a request as in flight
+
+        Returns:
+            Start timestamp to pass to request_finished()
+        """
+        with self._lock:
+            self._stats(endpoint).in_flight += 1
+        return time.perf_counter()
+
+    def request_finished(self, endpoint: str, started: float, status: Optional[int] = None,
+                         bytes_sent: int = 0, bytes_received: int = 0, error: Optional[str] = None):
+        """
+        Record the outcome of one HTTP attempt
+
+        Args:
+            endpoint: Endpoint path
+            started: Value returned by request_started()
+            status: HTTP status code (None when the request failed at the transport level)
+            bytes_sent: Request body size
+            bytes_received: Response body size
+            error: Exception class name for transport failures
+        """
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            stats = self._stats(endpoint)
+            stats.in_flight -= 1
+            stats.requests += 1
+            stats.latency.observe(elapsed)
+            stats.bytes_sent += bytes_sent
+            stats.bytes_received += bytes_received
+            if status is not None:
+                stats.statuses[status] += 1
+            if error is not None:
+                stats.errors[error] += 1
+
+    def record_result(self, endpoint: str, result: Optional[Dict]):
+        """
+        Count business codes from a parsed response: the top-level code/statusCode
+        and the per-item code of each entry in "data" (e.g. 303 on a single label)
+        """
+        if not isinstance(result, dict):
+            return
+
+        codes = []
+        top_level = result.get("code", result.get("statusCode"))
+        if top_level is not None:
+            codes.append(top_level)
+        data = result.get("data")
+        if isinstance(data, list):
+            codes.extend(item["code"] for item in data if isinstance(item, dict) and "code" in item)
+
+        if codes:
+            with self._lock:
+                self._stats(endpoint).business_codes.update(str(code) for code in codes)
+
+    def snapshot(self) -> Dict:
+        """
+        Returns:
+            {"uptime_seconds": ..., "endpoints": {endpoint: {...}}} with latency percentiles in seconds,
+            requests per second since start, byte counts, status/business-code/error counters and in-flight gauge
+        """
+        with self._lock:
+            uptime = time.time() - self.started_at
+            endpoints = {}
+            for endpoint, stats in sorted(self._endpoints.items()):
+                histogram = stats.latency
+                endpoints[endpoint] = {
+                    "requests": stats.requests,
+                    "in_flight": stats.in_flight,
+                    "requests_per_second": stats.requests / uptime if uptime > 0 else 0.0,
+                    "latency": {
+                        "p50": histogram.percentile(50),
+                        "p95": histogram.percentile(95),
+                        "p99": histogram.percentile(99),
+                        "mean": histogram.total / histogram.count if histogram.count else None,
+                        "max": histogram.max if histogram.count else None,
+                    },
+                    "bytes_sent": stats.bytes_sent,
+                    "bytes_received": stats.bytes_received,
+                    "statuses": {str(k): v for k, v in stats.statuses.items()},
+                    "business_codes": dict(stats.business_codes),
+                    "errors": dict(stats.errors),
+                }
+        return {"uptime_seconds": uptime, "endpoints": endpoints}
+
+    def to_json(self, indent: Optional[int] = 2) -> str:
+        """Snapshot as JSON text"""
+        return json.dumps(self.snapshot(), indent=indent, ensure_ascii=False)
+
+    def to_prometheus(self) -> str:
+        """Metrics in the Prometheus text exposition format"""
+        lines = [
+            "# HELP yidida_request_duration_seconds YiDiDa API request latency",
+            "# TYPE yidida_request_duration_seconds histogram",
+        ]
+        with self._lock:
+            items = sorted(self._endpoints.items())
+            for endpoint, stats in items:
+                histogram = stats.latency
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'yidida_request_duration_seconds_bucket{{endpoint="{endpoint}",le="{bound}"}} {cumulative}')
+                lines.append(f'yidida_request_duration_seconds_bucket{{endpoint="{endpoint}",le="+Inf"}} {histogram.count}')
+                lines.append(f'yidida_request_duration_seconds_sum{{endpoint="{endpoint}"}} {histogram.total}')
+                lines.append(f'yidida_request_duration_seconds_count{{endpoint="{endpoint}"}} {histogram.count}')
+
+            lines += ["# HELP yidida_requests_total Requests by HTTP status", "# TYPE yidida_requests_total counter"]
+            for endpoint, stats in items:
+                for status, count in sorted(stats.statuses.items()):
+                    lines.append(f'yidida_requests_total{{endpoint="{endpoint}",status="{status}"}} {count}')
+
+            lines += ["# HELP yidida_request_errors_total Transport failures", "# TYPE yidida_request_errors_total counter"]
+            for endpoint, stats in items:
+                for error, count in sorted(stats.errors.items()):
+                    lines.append(f'yidida_request_errors_total{{endpoint="{endpoint}",error="{error}"}} {count}')
+
+            lines += ["# HELP yidida_business_codes_total Response codes reported in the body",
+                      "# TYPE yidida_business_codes_total counter"]
+            for endpoint, stats in items:
+                for code, count in sorted(stats.business_codes.items()):
+                    lines.append(f'yidida_business_codes_total{{endpoint="{endpoint}",code="{code}"}} {count}')
+
+            lines += ["# HELP yidida_bytes_total Request and response body bytes", "# TYPE yidida_bytes_total counter"]
+            for endpoint, stats in items:
+                lines.append(f'yidida_bytes_total{{endpoint="{endpoint}",direction="sent"}} {stats.bytes_sent}')
+                lines.append(f'yidida_bytes_total{{endpoint="{endpoint}",direction="received"}} {stats.bytes_received}')
+
+            lines += ["# HELP yidida_in_flight_requests Requests currently in flight", "# TYPE yidida_in_flight_requests gauge"]
+            for endpoint, stats in items:
+                lines.append(f'yidida_in_flight_requests{{endpoint="{endpoint}"}} {stats.in_flight}')
+
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,283 @@
+"""
+Compact result models for label, price and tracking responses
+
+Response bodies are decoded once and only the fields the tool uses are copied into
+__slots__ objects; the nested dicts are dropped right away. Repeated short values
+(status texts, channel names, formats) are interned so identical strings are stored once.
+The full entry stays reachable through `raw` when parsing with keep_raw=True: the
+response bytes are kept and only decoded again if `raw` is actually read.
+"""
+import base64
+import json
+import sys
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+# Response fields that may carry the total price of a quote, most specific first
+PRICE_FIELDS = ("totalPrice", "totalFee", "totalAmount", "totalMoney", "price", "fee")
+
+# Fields that may carry a shipment's current status / its event list, checked in order
+STATUS_FIELDS = ("statusText", "status", "yunDanZhuangTai", "trackStatus", "lastStatus")
+TRACK_LIST_FIELDS = ("trackList", "trackingList", "tracks", "guiJiList")
+
+Body = Union[bytes, bytearray, str, Dict]
+
+
+def _intern(value: Any) -> Optional[str]:
+    """Intern short, frequently repeated strings (statuses, channels, formats)"""
+    if value is None or value == "":
+        return None
+    value = str(value)
+    return sys.intern(value) if len(value) <= 64 else value
+
+
+def _text(value: Any) -> Optional[str]:
+    """Identifier fields: keep as str, empty strings become None"""
+    if value is None or value == "":
+        return None
+    return value if isinstance(value, str) else str(value)
+
+
+def _number(value: Any) -> Optional[float]:
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def decode_body(body: Body) -> Dict:
+    """Decode a response body (bytes, str or an already decoded dict)"""
+    if isinstance(body, dict):
+        return body
+    return json.loads(body)
+
+
+def response_items(response: Dict) -> List[Dict]:
+    """Entries of a response's `data` (a list, a single dict, or nothing)"""
+    data = response.get("data") if isinstance(response, dict) else None
+    if isinstance(data, list):
+        return [item for item in data if isinstance(item, dict)]
+    return [data] if isinstance(data, dict) else []
+
+
+class RawPayload:
+    """
+    One response body shared by every model parsed from it
+
+    The body is decoded again on the first `item()` call and the decoded entries are
+    cached, so the cost is only paid by callers that actually look at raw entries.
+    """
+
+    __slots__ = ("_body", "_items")
+
+    def __init__(self, body: Body):
+        self._body = body
+        self._items = None
+
+    def item(self, index: int) -> Dict:
+        if self._items is None:
+            self._items = response_items(decode_body(self._body))
+            self._body = None
+        return self._items[index]
+
+
+class _Compact:
+    """Dict conversion, equality and repr over the public slots"""
+
+    __slots__ = ()
+
+    def to_dict(self) -> Dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __eq__(self, other) -> bool:
+        return type(self) is type(other) and all(getattr(self, name) == getattr(other, name)
+                                                 for name in self.__slots__)
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__
+                           if getattr(self, name) is not None)
+        return f"{type(self).__name__}({fields})"
+
+
+class _Model(_Compact):
+    """A response entry model; `raw` gives the full entry when parsed with keep_raw"""
+
+    __slots__ = ("_payload", "_index")
+
+    @property
+    def raw(self) -> Optional[Dict]:
+        """The full response entry, or None when parsed without keep_raw"""
+        return self._payload.item(self._index) if self._payload is not None else None
+
+
+class LabelResult(_Model):
+    """
+    One /yundans/ data entry
+
+    Attributes:
+        order_no: keHuDanHao
+        tracking_no: zhuanDanHao
+        system_no: xiTongDanHao
+        waybill_id: waybillId
+        code: Per-order result code (200 = created)
+        message: Per-order message (rejection reason)
+        label_url: labelUrl of the document
+        label_size: Length of the inline base64 document (0 when the API returns none); the
+                    document itself is not kept, see label_document()
+        format: Document format (pdf, png, ...)
+        address_type: addressVerifyResult (BUSINESS / RESIDENTIAL)
+        child_nos: Tracking numbers of every package (childNos)
+    """
+
+    __slots__ = ("order_no", "tracking_no", "system_no", "waybill_id", "code", "message", "label_url", "label_size",
+                 "format", "address_type", "child_nos")
+
+    def __init__(self, item: Dict, payload: Optional[RawPayload] = None, index: int = 0):
+        self.order_no = _text(item.get("keHuDanHao"))
+        self.tracking_no = _text(item.get("zhuanDanHao"))
+        self.system_no = _text(item.get("xiTongDanHao"))
+        self.waybill_id = _text(item.get("waybillId"))
+        code = item.get("code")
+        self.code = int(code) if isinstance(code, (int, str)) and str(code).lstrip("-").isdigit() else None
+        self.message = _intern(item.get("message"))
+        self.label_url = _text(item.get("labelUrl"))
+        self.label_size = len(item.get("label") or "")
+        self.format = _intern(item.get("format"))
+        self.address_type = _intern(item.get("addressVerifyResult"))
+        # Single-package shipments repeat the tracking number here; share that string
+        self.child_nos = tuple(self.tracking_no if num == self.tracking_no else str(num)
+                               for num in item.get("childNos") or ())
+        self._payload = payload
+        self._index = index
+
+    @property
+    def accepted(self) -> bool:
+        """True when the order came back with a tracking number and a 200 code"""
+        return self.code == 200 and self.tracking_no is not None
+
+    def label_document(self) -> Optional[bytes]:
+        """Decode the inline document from the kept response (None without keep_raw or a document)"""
+        raw = self.raw
+        if not raw or not raw.get("label"):
+            return None
+        return base64.b64decode(raw["label"])
+
+
+class PriceQuote(_Model):
+    """
+    One /price quote
+
+    Attributes:
+        channel: Channel name
+        way_type: Logistics type (wayType)
+        zone: Pricing zone
+        charge_weight: Chargeable weight (kg)
+        price: Total price (first of PRICE_FIELDS present)
+        currency: Currency code
+    """
+
+    __slots__ = ("channel", "way_type", "zone", "charge_weight", "price", "currency")
+
+    def __init__(self, item: Dict, payload: Optional[RawPayload] = None, index: int = 0):
+        self.channel = _intern(item.get("channelName") or item.get("channelCode") or item.get("qudaoName"))
+        way_type = item.get("wayType")
+        self.way_type = way_type if isinstance(way_type, int) else _intern(way_type)
+        zone = item.get("zone")
+        self.zone = zone if isinstance(zone, int) else _intern(zone)
+        self.charge_weight = _number(item.get("chargeWeight"))
+        self.price = next((price for price in (_number(item.get(field)) for field in PRICE_FIELDS)
+                           if price is not None), None)
+        self.currency = _intern(item.get("currency"))
+        self._payload = payload
+        self._index = index
+
+
+class TrackingEvent(_Compact):
+    """One tracking scan: time, location and description"""
+
+    __slots__ = ("time", "location", "content")
+
+    def __init__(self, item: Dict):
+        self.time = _text(item.get("time") or item.get("scanTime"))
+        self.location = _intern(item.get("location"))
+        self.content = _intern(item.get("content") or item.get("description"))
+
+
+class TrackingRecord(_Model):
+    """
+    One /queryYunDanDetail record
+
+    Attributes:
+        order_no: keHuDanHao
+        tracking_no: zhuanDanHao
+        system_no: xiTongDanHao
+        waybill_id: waybillId
+        status: Current status text (first text field of STATUS_FIELDS, else the newest event)
+        updated: lastUpdateTime
+        events: TrackingEvent tuple, newest first (as returned by the API)
+    """
+
+    __slots__ = ("order_no", "tracking_no", "system_no", "waybill_id", "status", "updated", "events")
+
+    def __init__(self, item: Dict, payload: Optional[RawPayload] = None, index: int = 0):
+        self.order_no = _text(item.get("keHuDanHao"))
+        self.tracking_no = _text(item.get("zhuanDanHao"))
+        self.system_no = _text(item.get("xiTongDanHao"))
+        self.waybill_id = _text(item.get("waybillId"))
+        self.updated = _text(item.get("lastUpdateTime"))
+        events = next((item[field] for field in TRACK_LIST_FIELDS if isinstance(item.get(field), list)), ())
+        self.events: Tuple[TrackingEvent, ...] = tuple(TrackingEvent(event) for event in events
+                                                       if isinstance(event, dict))
+        # A status text field, else the newest event (same rule as the tracking poller)
+        self.status = next((_intern(item[field]) for field in STATUS_FIELDS
+                            if isinstance(item.get(field), str) and item[field]),
+                           self.events[0].content if self.events else None)
+        self._payload = payload
+        self._index = index
+
+    def to_dict(self) -> Dict:
+        result = super().to_dict()
+        result["events"] = [event.to_dict() for event in self.events]
+        return result
+
+
+def _parse(model, body: Body, keep_raw: bool, raw_body: Optional[Body] = None) -> List:
+    items = response_items(decode_body(body))
+    payload = RawPayload(raw_body if raw_body is not None else body) if keep_raw else None
+    return [model(item, payload, index) for index, item in enumerate(items)]
+
+
+def parse_label_results(body: Body, keep_raw: bool = False, raw_body: Optional[Body] = None) -> List[LabelResult]:
+    """
+    Build LabelResult models from a /yundans/ response
+
+    Args:
+        body: Response bytes/str, or an already decoded response dict
+        keep_raw: Keep the response so each result's `raw` entry can be read later
+        raw_body: Bytes to keep instead of `body` (lets a caller that already decoded
+                  the bytes keep them rather than the decoded dict)
+
+    Returns:
+        One LabelResult per data entry
+    """
+    return _parse(LabelResult, body, keep_raw, raw_body)
+
+
+def parse_price_quotes(body: Body, keep_raw: bool = False, raw_body: Optional[Body] = None) -> List[PriceQuote]:
+    """Build PriceQuote models from a /price response (arguments as in parse_label_results)"""
+    return _parse(PriceQuote, body, keep_raw, raw_body)
+
+
+def parse_tracking_records(body: Body, keep_raw: bool = False,
+                           raw_body: Optional[Body] = None) -> List[TrackingRecord]:
+    """Build TrackingRecord models from a /queryYunDanDetail response (arguments as in parse_label_results)"""
+    return _parse(TrackingRecord, body, keep_raw, raw_body)
+
+
+def cheapest(quotes: Iterable[PriceQuote]) -> Optional[PriceQuote]:
+    """Lowest priced quote, ignoring quotes without a price"""
+    priced = [quote for quote in quotes if quote.price is not None]
+    return min(priced, key=lambda quote: quote.price) if priced else None
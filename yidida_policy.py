@@ -0,0 +1,203 @@
+"""
+Request policy for the YiDiDa clients: per-endpoint timeouts and retries, and a shared rate limit
+"""
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Parse a Retry-After header (delta-seconds or HTTP date)
+
+    Returns:
+        Seconds to wait, or None if the header is missing or invalid
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+
+class TokenBucket:
+    """Thread-safe token bucket; one instance can be shared by every client and thread"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        """
+        Args:
+            rate: Tokens (requests) added per second
+            capacity: Maximum burst size (defaults to one second worth of tokens)
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.taken = 0.0
+        self.waited = 0.0
+
+    def reserve(self, tokens: float = 1.0) -> float:
+        """
+        Take tokens now and return how long the caller must wait before using them
+
+        Reservations may drive the balance negative, which queues callers fairly
+        without holding the lock while they sleep. Async callers await the returned delay.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= tokens
+            self.taken += tokens
+            delay = 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+            self.waited += delay
+            return delay
+
+    def backlog(self) -> float:
+        """Seconds a request arriving now would wait, without taking a token"""
+        with self._lock:
+            tokens = min(self.capacity, self._tokens + (time.monotonic() - self._updated) * self.rate)
+            return 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+
+    def acquire(self, tokens: float = 1.0):
+        """Block until the tokens are available"""
+        delay = self.reserve(tokens)
+        if delay > 0:
+            time.sleep(delay)
+
+
+class RetryBudget:
+    """Caps retries to a fraction of requests so an outage does not multiply upstream load"""
+
+    def __init__(self, ratio: float = 0.2, min_balance: float = 10.0):
+        """
+        Args:
+            ratio: Retries earned per request sent
+            min_balance: Retries always available (and the starting balance)
+        """
+        self.ratio = ratio
+        self.max_balance = max(min_balance, 100.0)
+        self._balance = min_balance
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        """Record a first attempt"""
+        with self._lock:
+            self._balance = min(self.max_balance, self._balance + self.ratio)
+
+    def withdraw(self) -> bool:
+        """Spend one retry; False when the budget is exhausted"""
+        with self._lock:
+            if self._balance < 1:
+                return False
+            self._balance -= 1
+            return True
+
+
+class EndpointPolicy:
+    """Timeout and retry rules for one endpoint"""
+
+    def __init__(self, timeout: Optional[float] = 30, max_attempts: int = 3, base_delay: float = 0.5,
+                 max_delay: float = 30.0, retry_statuses=(429, 500, 502, 503, 504), idempotent: bool = True,
+                 budget: Optional[RetryBudget] = None):
+        """
+        Args:
+            timeout: Request timeout in seconds
+            max_attempts: Total attempts including the first one
+            base_delay: Backoff before the first retry (doubles every attempt)
+            max_delay: Upper bound for a single backoff or Retry-After wait
+            retry_statuses: HTTP statuses worth retrying
+            idempotent: False for calls that create something (e.g. /yundans/); they are only
+                        retried when the server certainly did not process the request
+            budget: Retry budget shared by every call to this endpoint
+        """
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_statuses = tuple(retry_statuses) if idempotent else (429,)
+        self.idempotent = idempotent
+        self.budget = budget if budget is not None else RetryBudget()
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """
+        Delay before the next attempt: Retry-After when the server sent one,
+        otherwise exponential backoff with full jitter
+
+        Args:
+            attempt: Number of the attempt that just failed (1-based)
+            retry_after: Parsed Retry-After header
+        """
+        if retry_after is not None:
+            return min(self.max_delay, retry_after)
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+
+    def can_retry(self, attempt: int) -> bool:
+        """True while attempts and budget remain"""
+        return attempt < self.max_attempts and self.budget.withdraw()
+
+
+# Only throttling (429) and connections that were never established are safe to resend to /yundans/:
+# a timeout or dropped connection after sending may already have created the waybill.
+DEFAULT_ENDPOINT_POLICIES = {
+    "/login": dict(timeout=10, max_attempts=3),
+    "/yundans/": dict(timeout=120, max_attempts=3, idempotent=False),
+    "/price": dict(timeout=30, max_attempts=3),
+    "/queryYunDanDetail": dict(timeout=30, max_attempts=3),
+}
+
+
+class RequestPolicy:
+    """Per-endpoint policies plus an optional rate limiter shared by all endpoints"""
+
+    def __init__(self, endpoints: Optional[Dict[str, EndpointPolicy]] = None,
+                 rate_limiter: Optional[TokenBucket] = None):
+        """
+        Args:
+            endpoints: Policies keyed by endpoint path (defaults from DEFAULT_ENDPOINT_POLICIES)
+            rate_limiter: Token bucket applied to every request (None for no limit)
+        """
+        self.endpoints = {path: EndpointPolicy(**options) for path, options in DEFAULT_ENDPOINT_POLICIES.items()}
+        self.endpoints.update(endpoints or {})
+        self.default = EndpointPolicy()
+        self.rate_limiter = rate_limiter
+
+    @classmethod
+    def from_config(cls, config: Dict) -> "RequestPolicy":
+        """
+        Build a policy from the optional "request_policy" section of config.json
+
+        Example:
+            "request_policy": {
+              "rate_per_second": 10,
+              "burst": 20,
+              "endpoints": {"/price": {"max_attempts": 5, "timeout": 20}}
+            }
+        """
+        policy_config = config.get("request_policy", {})
+
+        endpoints = {}
+        for path, overrides in policy_config.get("endpoints", {}).items():
+            options = dict(DEFAULT_ENDPOINT_POLICIES.get(path, {}))
+            options.update(overrides)
+            endpoints[path] = EndpointPolicy(**options)
+
+        rate = policy_config.get("rate_per_second")
+        limiter = TokenBucket(rate, policy_config.get("burst")) if rate else None
+        return cls(endpoints, limiter)
+
+    def for_endpoint(self, endpoint: str) -> EndpointPolicy:
+        """Policy for an endpoint path"""
+        return self.endpoints.get(endpoint, self.default)
@@ -0,0 +1,459 @@
+"""
+Multi-account client pool: one session, token and rate limit per YiDiDa account
+
+ClientPool offers the same calls as YiDiDaClient (create_labels, query_price, query_shipment,
+query_shipments_bulk), so the modules, the batch executor and the label journal accept either.
+Work is routed by account affinity when the owner of an order is known, and to the
+least-loaded account otherwise.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from yidida_auth import TokenManager
+from yidida_cache import AddressCache, QuoteCache
+from yidida_client import YiDiDaClient, bounded_map
+from yidida_metrics import ClientMetrics
+from yidida_policy import RequestPolicy, TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Window (seconds) over which per-account throughput and saturation are measured
+STATS_WINDOW = 60.0
+
+
+class Account:
+    """One account of the pool: its client plus the counters used for routing and stats"""
+
+    def __init__(self, name: str, client: YiDiDaClient, order_prefixes: Sequence[str] = ()):
+        """
+        Args:
+            name: Account name used for affinity and in stats
+            client: Client logged in as this account (own session, token and rate limiter)
+            order_prefixes: Customer order numbers (keHuDanHao) starting with one of these belong to this account
+        """
+        self.name = name
+        self.client = client
+        self.order_prefixes = tuple(order_prefixes)
+        self.enabled = True
+        self.in_flight = 0
+        self.calls = 0
+        self.failures = 0
+        self.busy_seconds = 0.0
+        self.recent = deque()
+
+    @property
+    def rate_limiter(self) -> Optional[TokenBucket]:
+        return self.client.request_policy.rate_limiter
+
+    def load(self) -> float:
+        """Expected wait for new work: calls in flight per unit of rate, plus the rate limiter backlog"""
+        limiter = self.rate_limiter
+        if limiter is None:
+            return float(self.in_flight)
+        return self.in_flight / limiter.rate + limiter.backlog()
+
+
+class ClientPool:
+    """Routes label, price and tracking calls across several YiDiDa accounts"""
+
+    MAX_ORDERS_PER_QUERY = YiDiDaClient.MAX_ORDERS_PER_QUERY
+
+    def __init__(self, accounts: List[Account], metrics: Optional[ClientMetrics] = None,
+                 pricing_account: Optional[str] = None, max_owners: int = 100000):
+        """
+        Args:
+            accounts: Accounts in order of preference
+            metrics: Registry shared by every account's client (endpoint metrics for the whole pool)
+            pricing_account: Account whose customer prices query_price returns by default (default: the first)
+            max_owners: Order owners remembered for affinity (least recently used are forgotten)
+        """
+        if not accounts:
+            raise ValueError("A client pool needs at least one account")
+        self.accounts = {account.name: account for account in accounts}
+        if pricing_account is not None and pricing_account not in self.accounts:
+            raise ValueError(f"Unknown pricing account: {pricing_account}")
+        self.pricing_account = pricing_account or accounts[0].name
+        self.metrics = metrics if metrics is not None else accounts[0].client.metrics
+        self.started_at = time.time()
+        self.max_owners = max_owners
+        self._owners: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: Dict, pool_maxsize: int = 10) -> "ClientPool":
+        """
+        Build a pool from the "accounts" section of config.json, e.g.
+
+            "accounts": [
+              {"name": "east", "username": "...", "password": "...", "rate_per_second": 5, "burst": 10,
+               "order_prefixes": ["E"]},
+              {"name": "west", "username": "...", "password": "...", "rate_per_second": 5}
+            ]
+
+        Without the section the pool holds the single "credentials" account. Each account gets
+        its own session, token (cached under its own key), rate limiter and quote cache; an
+        account without "rate_per_second" uses request_policy.rate_per_second. "api_base_url"
+        may also be set per account.
+
+        The optional "account_pool" section sets the default account for customer pricing and
+        how many order owners are remembered:
+
+            "account_pool": {"pricing_account": "west", "max_owners": 100000}
+
+        Args:
+            config: Configuration dictionary
+            pool_maxsize: Connections kept per account session
+        """
+        specs = config.get("accounts") or [dict(config["credentials"], name="default")]
+        policy_config = config.get("request_policy", {})
+        token_manager = TokenManager.from_config(config)
+        metrics = ClientMetrics()
+        # Address verification does not depend on the account, so every account shares one cache
+        address_cache = AddressCache.from_config(config)
+
+        accounts = []
+        for index, spec in enumerate(specs):
+            name = spec.get("name") or spec["username"]
+            policy = RequestPolicy.from_config(config)
+            rate = spec.get("rate_per_second", policy_config.get("rate_per_second"))
+            policy.rate_limiter = TokenBucket(rate, spec.get("burst", policy_config.get("burst"))) if rate else None
+            client = YiDiDaClient(
+                spec.get("api_base_url", config["api_base_url"]),
+                spec["username"],
+                spec["password"],
+                pool_maxsize=pool_maxsize,
+                # Customer prices differ between accounts, so cached quotes are kept apart
+                quote_cache=QuoteCache.from_config(config, namespace=None if index == 0 else name),
+                token_manager=token_manager,
+                request_policy=policy,
+                metrics=metrics,
+                address_cache=address_cache
+            )
+            accounts.append(Account(name, client, spec.get("order_prefixes", ())))
+        pool_config = config.get("account_pool", {})
+        return cls(accounts, metrics, pool_config.get("pricing_account"), pool_config.get("max_owners", 100000))
+
+    def __len__(self) -> int:
+        return len(self.accounts)
+
+    @property
+    def token(self) -> Optional[str]:
+        """A token of the first logged-in account (truthy when the pool can be used)"""
+        return next((account.client.token for account in self._enabled() if account.client.token), None)
+
+    def login(self, force: bool = False) -> bool:
+        """
+        Log in every account; accounts that fail are left out of routing
+
+        Returns:
+            bool: True if at least one account is logged in
+        """
+        for account in self.accounts.values():
+            account.enabled = account.client.login(force=force)
+            if not account.enabled:
+                logger.error(f"✗ Account {account.name} could not log in and is skipped")
+        enabled = [account.name for account in self._enabled()]
+        if enabled:
+            logger.info(f"✓ Client pool ready: {len(enabled)}/{len(self.accounts)} account(s) ({', '.join(enabled)})")
+        return bool(enabled)
+
+    def resize_pool(self, pool_maxsize: int):
+        """Grow every account's connection pool"""
+        for account in self.accounts.values():
+            account.client.resize_pool(pool_maxsize)
+
+    def _enabled(self) -> List[Account]:
+        return [account for account in self.accounts.values() if account.enabled]
+
+    def owner_of(self, order_no: Optional[str]) -> Optional[str]:
+        """
+        Account owning an order: the one that created it in this process, else the first
+        account whose order_prefixes match
+
+        Returns:
+            Account name, or None when unknown
+        """
+        if not order_no:
+            return None
+        with self._lock:
+            owner = self._owners.get(order_no)
+            if owner is not None:
+                self._owners.move_to_end(order_no)
+                return owner
+        for account in self.accounts.values():
+            if account.order_prefixes and order_no.startswith(account.order_prefixes):
+                return account.name
+        return None
+
+    def pick(self, account: Optional[str] = None, exclude: Iterable[str] = ()) -> Account:
+        """
+        Choose the account for a call
+
+        Args:
+            account: Account name for affinity; ignored if it is unknown or not logged in
+            exclude: Account names not to use
+
+        Returns:
+            The named account, else the least-loaded enabled one
+        """
+        named = self.accounts.get(account) if account else None
+        if named is not None and named.enabled:
+            return named
+        excluded = set(exclude)
+        candidates = [candidate for candidate in self._enabled() if candidate.name not in excluded]
+        if not candidates:
+            candidates = self._enabled() or list(self.accounts.values())
+        with self._lock:
+            return min(candidates, key=Account.load)
+
+    @contextmanager
+    def lease(self, account: Account) -> Iterator[YiDiDaClient]:
+        """Track one call on an account (in-flight gauge, call counters, busy time)"""
+        with self._lock:
+            account.in_flight += 1
+        started = time.monotonic()
+        failed = True
+        try:
+            yield account.client
+            failed = False
+        finally:
+            now = time.monotonic()
+            with self._lock:
+                account.in_flight -= 1
+                account.calls += 1
+                account.failures += failed
+                account.busy_seconds += now - started
+                # (time, API requests so far) per call, for windowed throughput and saturation
+                limiter = account.rate_limiter
+                account.recent.append((now, limiter.taken if limiter is not None else 0.0))
+                while account.recent and account.recent[0][0] < now - STATS_WINDOW:
+                    account.recent.popleft()
+
+    def _call(self, account: Account, method: str, *args):
+        """Run one client call on an account; a None result counts as a failure"""
+        with self.lease(account) as client:
+            result = getattr(client, method)(*args)
+        if result is None:
+            with self._lock:
+                account.failures += 1
+        return result
+
+    def _remember(self, account: str, order_numbers: Iterable[str]):
+        with self._lock:
+            for order_no in order_numbers:
+                if order_no:
+                    self._owners[order_no] = account
+                    self._owners.move_to_end(order_no)
+            # Older orders fall back to prefix routing (and, for tracking, trying each account)
+            while len(self._owners) > self.max_owners:
+                self._owners.popitem(last=False)
+
+    def create_labels(self, label_requests: List[Dict], account: Optional[str] = None) -> Optional[Dict]:
+        """
+        Create labels, each order on the account that owns it
+
+        Orders with a known owner go to that account; the rest go to the least-loaded account.
+        A batch spanning several accounts is split, and the responses are merged into one body.
+        Orders created here are remembered, so later tracking calls use the same account.
+
+        Args:
+            label_requests: List of label request dictionaries
+            account: Send the whole batch with this account
+
+        Returns:
+            API response dictionary (merged when split), or None if every request failed
+        """
+        groups: Dict[Optional[str], List[Dict]] = {}
+        for label in label_requests:
+            groups.setdefault(account or self.owner_of(label.get("keHuDanHao")), []).append(label)
+
+        results = []
+        for owner, labels in groups.items():
+            target = self.pick(owner)
+            result = self._call(target, "create_labels", labels)
+            if result is not None:
+                self._remember(target.name, (item.get("keHuDanHao") for item in result.get("data") or []
+                                             if isinstance(item, dict) and item.get("code") == 200))
+            results.append(result)
+
+        if len(results) == 1:
+            return results[0]
+        answered = [result for result in results if result is not None]
+        if not answered:
+            return None
+        # Orders of a failed sub-request are simply missing from the merged data (outcome unknown)
+        ok = all(result.get("success") or result.get("code") == 200 for result in answered)
+        return {
+            "data": [item for result in answered for item in result.get("data") or []],
+            "success": ok and len(answered) == len(results),
+            "statusCode": 200 if ok else next(result.get("statusCode") for result in answered
+                                               if not (result.get("success") or result.get("code") == 200)),
+        }
+
+    def query_price(self, price_params: Dict, fresh: bool = False, account: Optional[str] = None) -> Optional[Dict]:
+        """
+        Query prices on one account
+
+        Public pricing (searchType 3) is the same for every account and goes to the least-loaded
+        one. Customer pricing returns the prices of `account`, or of pricing_account
+        ("account_pool" config, default the first account); pass `account` for another
+        account's prices. `fresh` skips the quote cache.
+        """
+        if account is None and price_params.get("searchType") != 3:
+            account = self.pricing_account
+        return self._call(self.pick(account), "query_price", price_params, fresh)
+
+    def _query_orders(self, order_list: List[str], owner: Optional[str]) -> Optional[Dict]:
+        """
+        Query up to 10 orders of one owner; orders of unknown owner the first account
+        does not know are looked up on the other accounts too
+
+        Returns:
+            Response body with every record found, or None if the first request failed
+        """
+        target = self.pick(owner)
+        result = self._call(target, "query_shipment", ",".join(order_list))
+        if result is None or owner is not None or len(self.accounts) == 1:
+            return result
+        if not (result.get("success") or result.get("statusCode") == 200):
+            return result
+
+        merged = {"success": True, "statusCode": 200, "data": list(result.get("data") or [])}
+        tried = [target.name]
+        missing = self._missing(order_list, merged["data"], target.name)
+        while missing:
+            candidates = [account for account in self._enabled() if account.name not in tried]
+            if not candidates:
+                break
+            other = self.pick(exclude=tried)
+            tried.append(other.name)
+            found = self._call(other, "query_shipment", ",".join(missing))
+            if found is not None and (found.get("success") or found.get("statusCode") == 200):
+                merged["data"].extend(found.get("data") or [])
+                missing = self._missing(missing, found.get("data") or [], other.name)
+        return merged
+
+    def _missing(self, order_list: List[str], records: List[Dict], account: str) -> List[str]:
+        """Orders without a record; the ones found are remembered as owned by `account`"""
+        found = {record.get(field) for record in records if isinstance(record, dict)
+                 for field in YiDiDaClient.ORDER_NUMBER_FIELDS if record.get(field)}
+        self._remember(account, (num for num in order_list if num in found))
+        return [num for num in order_list if num not in found]
+
+    def query_shipment(self, order_numbers: str) -> Optional[Dict]:
+        """
+        Query up to 10 orders (comma-separated), each on the account that owns it
+
+        Returns:
+            API response dictionary (merged across accounts), or None if the request failed
+        """
+        order_list = list(YiDiDaClient._iter_unique_order_numbers(order_numbers))
+        if not order_list:
+            logger.error("✗ No order numbers provided.")
+            return None
+
+        groups: Dict[Optional[str], List[str]] = {}
+        for num in order_list[:self.MAX_ORDERS_PER_QUERY]:
+            groups.setdefault(self.owner_of(num), []).append(num)
+        if len(groups) == 1:
+            owner, group = next(iter(groups.items()))
+            return self._query_orders(group, owner)
+
+        data = []
+        for owner, group in groups.items():
+            result = self._query_orders(group, owner)
+            if result is None or not (result.get("success") or result.get("statusCode") == 200):
+                return result
+            data.extend(result.get("data") or [])
+        return {"success": True, "statusCode": 200, "data": data}
+
+    def query_shipments_bulk(self, order_numbers: Iterable[str], workers: int = 4) -> Dict:
+        """
+        Query any number of shipments: 10-order requests per owning account, run in parallel
+
+        Same result shape as YiDiDaClient.query_shipments_bulk.
+        """
+        def chunks() -> Iterator[Tuple[Optional[str], List[str]]]:
+            # One buffer per owner so every request stays on a single account
+            buffers: Dict[Optional[str], List[str]] = {}
+            for num in YiDiDaClient._iter_unique_order_numbers(order_numbers):
+                owner = self.owner_of(num)
+                buffer = buffers.setdefault(owner, [])
+                buffer.append(num)
+                if len(buffer) == self.MAX_ORDERS_PER_QUERY:
+                    yield owner, buffers.pop(owner)
+            yield from buffers.items()
+
+        merged = {"success": True, "data": {}, "failed_chunks": [], "not_found": []}
+        for (_, chunk), result in bounded_map(lambda item: self._query_orders(item[1], item[0]), chunks(), workers):
+            YiDiDaClient._merge_shipment_chunk(merged, chunk, result)
+
+        merged["success"] = not merged["failed_chunks"]
+        logger.info(
+            f"Bulk shipment query: {len(merged['data'])} found, {len(merged['not_found'])} not found, "
+            f"{len(merged['failed_chunks'])} failed request(s) across {len(self._enabled())} account(s)"
+        )
+        return merged
+
+    @staticmethod
+    def _merge_shipment_chunk(merged: Dict, chunk: List[str], result: Optional[Dict]):
+        YiDiDaClient._merge_shipment_chunk(merged, chunk, result)
+
+    def stats(self) -> Dict:
+        """
+        Pool throughput and per-account saturation
+
+        Returns:
+            {"uptime_seconds", "calls", "calls_per_second", "accounts": {name: {...}}} where each
+            account reports enabled, in_flight, calls, failures, calls_per_second (last 60 s),
+            rate_limit (requests/s or None), saturation (recent API requests / rate limit),
+            rate_limit_wait_seconds (total time spent waiting for the limiter), busy_seconds
+            and orders_owned (among the max_owners most recently seen orders)
+        """
+        now = time.monotonic()
+        uptime = time.time() - self.started_at
+        window = min(STATS_WINDOW, uptime) or 1.0
+        owned: Dict[str, int] = {}
+        accounts = {}
+        with self._lock:
+            for owner in self._owners.values():
+                owned[owner] = owned.get(owner, 0) + 1
+            for name, account in self.accounts.items():
+                recent = [sample for sample in account.recent if sample[0] >= now - STATS_WINDOW]
+                limiter = account.rate_limiter
+                saturation = None
+                if limiter is not None and recent:
+                    # Requests taken from the limiter in the window, against what it allows
+                    requests = limiter.taken - recent[0][1] + 1
+                    saturation = min(1.0, requests / window / limiter.rate)
+                accounts[name] = {
+                    "enabled": account.enabled,
+                    "in_flight": account.in_flight,
+                    "calls": account.calls,
+                    "failures": account.failures,
+                    "calls_per_second": len(recent) / window,
+                    "rate_limit": limiter.rate if limiter is not None else None,
+                    "saturation": saturation,
+                    "rate_limit_wait_seconds": limiter.waited if limiter is not None else 0.0,
+                    "busy_seconds": account.busy_seconds,
+                    "orders_owned": owned.get(name, 0),
+                }
+            calls = sum(account.calls for account in self.accounts.values())
+        return {"uptime_seconds": uptime, "calls": calls, "calls_per_second": calls / uptime if uptime > 0 else 0.0,
+                "accounts": accounts}
+
+    def log_stats(self):
+        """Log pool throughput and one line per account"""
+        stats = self.stats()
+        logger.info(f"Client pool: {stats['calls']} call(s), {stats['calls_per_second']:.1f}/s "
+                    f"over {len(stats['accounts'])} account(s)")
+        for name, account in stats["accounts"].items():
+            saturation = f"{account['saturation']:.0%}" if account["saturation"] is not None else "no limit"
+            logger.info(f"  {name}: {account['calls']} call(s), {account['failures']} failed, "
+                        f"saturation {saturation}, waited {account['rate_limit_wait_seconds']:.1f}s for the "
+                        f"rate limit, {account['orders_owned']} order(s) owned"
+                        + ("" if account["enabled"] else " (not logged in)"))
@@ -0,0 +1,326 @@
+"""
+Durable job queue on SQLite: any number of worker processes (or hosts on a shared volume) lease
+jobs from the same file, with no broker to run
+
+Delivery is at-least-once. A leased job is invisible to other workers until its lease expires;
+a worker that dies (or hangs) without finishing the job lets the lease lapse, and the job is
+leased again. Handlers must therefore be safe to repeat: label jobs go through the label journal.
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+READY = "ready"      # waiting for a worker (possibly delayed until available_at)
+LEASED = "leased"    # held by a worker until lease_expires_at
+DONE = "done"        # finished; result stored
+DEAD = "dead"        # failed max_attempts times (or permanently); error stored
+
+STATES = (READY, LEASED, DONE, DEAD)
+
+
+class PermanentJobError(Exception):
+    """Raised by a job handler when running the job again cannot help (e.g. a malformed payload)"""
+
+
+class Job:
+    """One leased job; pass it back to JobQueue.complete / fail / extend"""
+
+    __slots__ = ("id", "queue", "payload", "attempts", "max_attempts", "lease_id", "created_at")
+
+    def __init__(self, job_id: int, queue: str, payload: Any, attempts: int, max_attempts: int, lease_id: str,
+                 created_at: float):
+        self.id = job_id
+        self.queue = queue
+        self.payload = payload
+        self.attempts = attempts
+        self.max_attempts = max_attempts
+        self.lease_id = lease_id
+        self.created_at = created_at
+
+    def __repr__(self) -> str:
+        return f"Job({self.id}, {self.queue!r}, attempt {self.attempts}/{self.max_attempts})"
+
+
+class JobQueue:
+    """
+    Named queues of JSON jobs in one SQLite file
+
+    Leasing happens in a write transaction (BEGIN IMMEDIATE), so two workers never lease the
+    same job at once. Every lease gets a new lease id; complete/fail/extend only apply while
+    the caller still holds the lease, so a worker whose lease lapsed cannot overwrite the
+    outcome of the worker that took the job over.
+    """
+
+    def __init__(self, path: str = "output/jobs.db", visibility_timeout: float = 300, max_attempts: int = 5,
+                 retry_delay: float = 30, journal_mode: str = "WAL"):
+        """
+        Args:
+            path: SQLite database file (on a shared volume for several hosts)
+            visibility_timeout: Seconds a lease lasts unless extended
+            max_attempts: Leases per job before it is marked dead
+            retry_delay: Seconds before a failed job is leased again, doubled on every attempt
+            journal_mode: SQLite journal mode; WAL needs every process on one host, use DELETE
+                          when workers on several hosts share the file over the network
+        """
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.journal_mode = journal_mode
+        self._local = threading.local()
+
+        with self._transaction() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, queue TEXT NOT NULL, payload TEXT NOT NULL, "
+                "state TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, max_attempts INTEGER NOT NULL, "
+                "available_at REAL NOT NULL, lease_id TEXT, leased_by TEXT, lease_expires_at REAL, "
+                "created_at REAL NOT NULL, started_at REAL, finished_at REAL, result TEXT, error TEXT)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (queue, state, available_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_leased ON jobs (state, lease_expires_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (state, finished_at)")
+
+    @classmethod
+    def from_config(cls, config: Dict) -> "JobQueue":
+        """
+        Build a queue from the optional "job_queue" section of config.json
+
+        Example:
+            "job_queue": {"path": "output/jobs.db", "visibility_timeout": 300, "max_attempts": 5,
+                          "retry_delay": 30, "journal_mode": "WAL"}
+        """
+        queue_config = config.get("job_queue", {})
+        return cls(
+            path=queue_config.get("path", "output/jobs.db"),
+            visibility_timeout=queue_config.get("visibility_timeout", 300),
+            max_attempts=queue_config.get("max_attempts", 5),
+            retry_delay=queue_config.get("retry_delay", 30),
+            journal_mode=queue_config.get("journal_mode", "WAL")
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread; sqlite3 connections must not be shared across threads"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit mode: transactions are opened explicitly by _transaction()
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute(f"PRAGMA journal_mode={self.journal_mode}")
+            conn.execute("PRAGMA synchronous=FULL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """Write transaction taking the database lock up front, so read-then-update is atomic"""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def put(self, queue: str, payload: Any, delay: float = 0, max_attempts: Optional[int] = None) -> int:
+        """
+        Add one job
+
+        Args:
+            queue: Queue name (e.g. "labels")
+            payload: JSON-serializable job description
+            delay: Seconds before the job becomes visible
+            max_attempts: Override the queue default
+
+        Returns:
+            Job id
+        """
+        return self.put_many(queue, [payload], delay, max_attempts)[0]
+
+    def put_many(self, queue: str, payloads: Iterable[Any], delay: float = 0,
+                 max_attempts: Optional[int] = None) -> List[int]:
+        """Add several jobs in one transaction; returns their ids"""
+        now = time.time()
+        ids = []
+        with self._transaction() as conn:
+            for payload in payloads:
+                cursor = conn.execute(
+                    "INSERT INTO jobs (queue, payload, state, max_attempts, available_at, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (queue, json.dumps(payload, ensure_ascii=False), READY, max_attempts or self.max_attempts,
+                     now + delay, now)
+                )
+                ids.append(cursor.lastrowid)
+        return ids
+
+    def lease(self, queues: Sequence[str], worker: str, limit: int = 1,
+              visibility_timeout: Optional[float] = None) -> List[Job]:
+        """
+        Lease up to `limit` visible jobs, oldest first
+
+        Jobs whose lease expired are visible again; one that expired on its last attempt is
+        marked dead instead.
+
+        Args:
+            queues: Queue names to take jobs from
+            worker: Worker id recorded with the lease (e.g. host:pid:thread)
+            limit: Jobs to lease at most
+            visibility_timeout: Lease length overriding the queue default
+
+        Returns:
+            Leased jobs (possibly none)
+        """
+        now = time.time()
+        expires = now + (visibility_timeout or self.visibility_timeout)
+        placeholders = ", ".join("?" * len(queues))
+        jobs = []
+        with self._transaction() as conn:
+            rows = conn.execute(
+                f"SELECT id, queue, payload, attempts, max_attempts, created_at, state FROM jobs "
+                f"WHERE queue IN ({placeholders}) AND ((state = ? AND available_at <= ?) OR "
+                f"(state = ? AND lease_expires_at <= ?)) ORDER BY available_at, id LIMIT ?",
+                (*queues, READY, now, LEASED, now, limit)
+            ).fetchall()
+            for job_id, queue, payload, attempts, max_attempts, created_at, state in rows:
+                if state == LEASED and attempts >= max_attempts:
+                    conn.execute(
+                        "UPDATE jobs SET state = ?, lease_id = NULL, finished_at = ?, error = ? WHERE id = ?",
+                        (DEAD, now, "Lease expired on the last attempt", job_id)
+                    )
+                    logger.warning(f"⚠ Job {job_id} ({queue}) lease expired on its last attempt, marked dead")
+                    continue
+                lease_id = uuid.uuid4().hex
+                conn.execute(
+                    "UPDATE jobs SET state = ?, attempts = attempts + 1, lease_id = ?, leased_by = ?, "
+                    "lease_expires_at = ?, started_at = ? WHERE id = ?",
+                    (LEASED, lease_id, worker, expires, now, job_id)
+                )
+                jobs.append(Job(job_id, queue, json.loads(payload), attempts + 1, max_attempts, lease_id, created_at))
+        return jobs
+
+    def extend(self, job: Job, visibility_timeout: Optional[float] = None) -> bool:
+        """
+        Push the lease of a running job forward (heartbeat)
+
+        Returns:
+            False when the lease was lost (the job may be running elsewhere now)
+        """
+        expires = time.time() + (visibility_timeout or self.visibility_timeout)
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_expires_at = ? WHERE id = ? AND lease_id = ? AND state = ?",
+                (expires, job.id, job.lease_id, LEASED)
+            )
+        return cursor.rowcount == 1
+
+    def complete(self, job: Job, result: Any = None) -> bool:
+        """
+        Mark a job done and store its JSON-serializable result
+
+        Returns:
+            False when the lease was lost (another worker owns the job now)
+        """
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET state = ?, lease_id = NULL, finished_at = ?, result = ?, error = NULL "
+                "WHERE id = ? AND lease_id = ? AND state = ?",
+                (DONE, time.time(), json.dumps(result, ensure_ascii=False), job.id, job.lease_id, LEASED)
+            )
+        return cursor.rowcount == 1
+
+    def fail(self, job: Job, error: str, retry: bool = True) -> Optional[str]:
+        """
+        Record a failed attempt; the job is retried after a backoff unless it is out of attempts
+
+        Args:
+            job: Leased job
+            error: Error message stored with the job
+            retry: False marks the job dead right away
+
+        Returns:
+            The job's new state (READY or DEAD), or None when the lease was lost
+        """
+        now = time.time()
+        state = READY if retry and job.attempts < job.max_attempts else DEAD
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET state = ?, lease_id = NULL, available_at = ?, finished_at = ?, error = ? "
+                "WHERE id = ? AND lease_id = ? AND state = ?",
+                (state, now + self.retry_delay * 2 ** (job.attempts - 1), now if state == DEAD else None, error,
+                 job.id, job.lease_id, LEASED)
+            )
+        return state if cursor.rowcount == 1 else None
+
+    def get(self, job_id: int) -> Optional[Dict]:
+        """Full row of one job (payload and result decoded)"""
+        conn = self._connection()
+        cursor = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        record = dict(zip((column[0] for column in cursor.description), row))
+        record["payload"] = json.loads(record["payload"])
+        record["result"] = json.loads(record["result"]) if record["result"] is not None else None
+        return record
+
+    def requeue_dead(self, queue: Optional[str] = None) -> int:
+        """Give dead jobs (of one queue, or all) a fresh set of attempts; returns how many"""
+        query = "UPDATE jobs SET state = ?, attempts = 0, available_at = ?, finished_at = NULL WHERE state = ?"
+        params = [READY, time.time(), DEAD]
+        if queue is not None:
+            query += " AND queue = ?"
+            params.append(queue)
+        with self._transaction() as conn:
+            return conn.execute(query, params).rowcount
+
+    def purge(self, older_than: float = 7 * 86400) -> int:
+        """Delete jobs finished (done or dead) more than `older_than` seconds ago; returns how many"""
+        with self._transaction() as conn:
+            return conn.execute(
+                "DELETE FROM jobs WHERE state IN (?, ?) AND finished_at < ?", (DONE, DEAD, time.time() - older_than)
+            ).rowcount
+
+    def stats(self, window: float = 300) -> Dict[str, Dict]:
+        """
+        Per-queue counters and throughput
+
+        Args:
+            window: Seconds of finished jobs the throughput figures cover
+
+        Returns:
+            {queue: {ready, leased, done, dead, delayed, oldest_ready_s, done_in_window,
+                     jobs_per_minute, avg_run_s, avg_wait_s, retried_in_window}}
+        """
+        now = time.time()
+        conn = self._connection()
+        queues: Dict[str, Dict] = {}
+
+        def entry(queue: str) -> Dict:
+            if queue not in queues:
+                queues[queue] = dict({state: 0 for state in STATES}, delayed=0, oldest_ready_s=0.0,
+                                     done_in_window=0, jobs_per_minute=0.0, avg_run_s=0.0, avg_wait_s=0.0,
+                                     retried_in_window=0)
+            return queues[queue]
+
+        for queue, state, count in conn.execute("SELECT queue, state, COUNT(*) FROM jobs GROUP BY queue, state"):
+            entry(queue)[state] = count
+        for queue, delayed, oldest in conn.execute(
+                "SELECT queue, SUM(available_at > ?), MIN(available_at) FROM jobs WHERE state = ? GROUP BY queue",
+                (now, READY)):
+            entry(queue)["delayed"] = delayed
+            entry(queue)["oldest_ready_s"] = max(0.0, now - oldest)
+        for queue, done, run_s, wait_s, retried in conn.execute(
+                "SELECT queue, COUNT(*), AVG(finished_at - started_at), AVG(started_at - created_at), "
+                "SUM(attempts > 1) FROM jobs WHERE state = ? AND finished_at >= ? GROUP BY queue",
+                (DONE, now - window)):
+            stats = entry(queue)
+            stats.update(done_in_window=done, jobs_per_minute=done * 60 / window, avg_run_s=run_s or 0.0,
+                         avg_wait_s=wait_s or 0.0, retried_in_window=retried)
+        return queues
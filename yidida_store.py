@@ -0,0 +1,231 @@
+"""
+Indexed response store: every API response in one SQLite file instead of one JSON file per call
+"""
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+# Order-number fields indexed for every entry of a response's "data"
+INDEXED_FIELDS = ("keHuDanHao", "waybillId", "xiTongDanHao", "zhuanDanHao")
+
+
+def iter_response_items(response: Any) -> Iterator[Dict]:
+    """
+    Entries of a response's "data": a list for single calls, a {order: record} dict for bulk tracking
+    """
+    data = response.get("data") if isinstance(response, dict) else None
+    if isinstance(data, dict):
+        data = data.values()
+    elif not isinstance(data, list):
+        return
+    for item in data:
+        if isinstance(item, dict):
+            yield item
+
+
+class ResponseStore:
+    """
+    Append-only SQLite store of API responses (WAL mode, safe for several threads and processes)
+
+    Whole responses go into `responses`. Each entry of their "data" becomes one row of
+    `records`, indexed on INDEXED_FIELDS and on time, so an order number is found with
+    an index lookup however many responses are stored.
+    """
+
+    def __init__(self, path: str = "output/responses.db"):
+        """
+        Args:
+            path: SQLite database file
+        """
+        self.path = path
+        self._local = threading.local()
+
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "id INTEGER PRIMARY KEY, kind TEXT NOT NULL, created_at REAL NOT NULL, "
+                "request TEXT, response TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_kind_created ON responses (kind, created_at)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS records ("
+                "id INTEGER PRIMARY KEY, response_id INTEGER NOT NULL REFERENCES responses (id), "
+                "kind TEXT NOT NULL, created_at REAL NOT NULL, "
+                + "".join(f"{field} TEXT, " for field in INDEXED_FIELDS)
+                + "item TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS records_created ON records (created_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS records_response ON records (response_id)")
+            for field in INDEXED_FIELDS:
+                conn.execute(f"CREATE INDEX IF NOT EXISTS records_{field} ON records ({field}, created_at)")
+
+    @classmethod
+    def from_config(cls, config: Dict) -> "ResponseStore":
+        """
+        Build a store from the optional "response_store" section of config.json
+
+        Example:
+            "response_store": {"path": "output/responses.db"}
+        """
+        return cls(config.get("response_store", {}).get("path", "output/responses.db"))
+
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread; sqlite3 connections must not be shared across threads"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def save(self, kind: str, response: Dict, request: Any = None) -> int:
+        """
+        Append a response
+
+        Args:
+            kind: Response kind, e.g. "label", "price" or "shipment"
+            response: Parsed API response
+            request: Request payload, kept for reconciliation (optional)
+
+        Returns:
+            Id of the stored response
+        """
+        created_at = time.time()
+        conn = self._connection()
+        with conn:
+            cursor = conn.execute(
+                "INSERT INTO responses (kind, created_at, request, response) VALUES (?, ?, ?, ?)",
+                (kind, created_at, json.dumps(request, ensure_ascii=False) if request is not None else None,
+                 json.dumps(response, ensure_ascii=False))
+            )
+            response_id = cursor.lastrowid
+            conn.executemany(
+                f"INSERT INTO records (response_id, kind, created_at, {', '.join(INDEXED_FIELDS)}, item) "
+                f"VALUES (?, ?, ?, {', '.join('?' * len(INDEXED_FIELDS))}, ?)",
+                [
+                    (response_id, kind, created_at,
+                     *(str(item[field]) if item.get(field) not in (None, "") else None for field in INDEXED_FIELDS),
+                     json.dumps(item, ensure_ascii=False))
+                    for item in iter_response_items(response)
+                ]
+            )
+        return response_id
+
+    @staticmethod
+    def _record(row) -> Dict:
+        return {"response_id": row[0], "kind": row[1], "created_at": row[2], "item": json.loads(row[3])}
+
+    def find(self, field: str, value: str, kind: Optional[str] = None) -> List[Dict]:
+        """
+        Every stored entry whose order-number field equals value, oldest first
+
+        Args:
+            field: One of INDEXED_FIELDS
+            value: Order number to look up
+            kind: Only entries of this response kind
+
+        Returns:
+            [{"response_id", "kind", "created_at", "item"}]
+        """
+        if field not in INDEXED_FIELDS:
+            raise ValueError(f"{field} is not indexed; use one of {', '.join(INDEXED_FIELDS)}")
+
+        query = f"SELECT response_id, kind, created_at, item FROM records WHERE {field} = ?"
+        params = [str(value)]
+        if kind is not None:
+            query += " AND kind = ?"
+            params.append(kind)
+        query += " ORDER BY created_at, id"
+        return [self._record(row) for row in self._connection().execute(query, params)]
+
+    def latest(self, field: str, value: str, kind: Optional[str] = None) -> Optional[Dict]:
+        """Most recent entry for an order number, or None"""
+        records = self.find(field, value, kind)
+        return records[-1] if records else None
+
+    def lookup(self, order_number: str, kind: Optional[str] = None) -> List[Dict]:
+        """Entries where any indexed field equals order_number, oldest first"""
+        # SQLite answers an OR of indexed columns with one index lookup per column
+        query = ("SELECT response_id, kind, created_at, item FROM records WHERE ("
+                 + " OR ".join(f"{field} = ?" for field in INDEXED_FIELDS) + ")")
+        params = [str(order_number)] * len(INDEXED_FIELDS)
+        if kind is not None:
+            query += " AND kind = ?"
+            params.append(kind)
+        query += " ORDER BY created_at, id"
+        return [self._record(row) for row in self._connection().execute(query, params)]
+
+    def get(self, response_id: int) -> Optional[Dict]:
+        """A whole stored response: {"id", "kind", "created_at", "request", "response"}"""
+        row = self._connection().execute(
+            "SELECT id, kind, created_at, request, response FROM responses WHERE id = ?", (response_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {"id": row[0], "kind": row[1], "created_at": row[2],
+                "request": json.loads(row[3]) if row[3] is not None else None, "response": json.loads(row[4])}
+
+    def _scan(self, table: str, columns: str, kind: Optional[str], since: Optional[float],
+              until: Optional[float]) -> Iterator:
+        query = f"SELECT {columns} FROM {table} WHERE 1 = 1"
+        params = []
+        if kind is not None:
+            query += " AND kind = ?"
+            params.append(kind)
+        if since is not None:
+            query += " AND created_at >= ?"
+            params.append(since)
+        if until is not None:
+            query += " AND created_at < ?"
+            params.append(until)
+        # A separate connection keeps a long scan from holding this thread's connection mid-iteration
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            yield from conn.execute(query + " ORDER BY created_at, id", params)
+        finally:
+            conn.close()
+
+    def iter_records(self, kind: Optional[str] = None, since: Optional[float] = None,
+                     until: Optional[float] = None) -> Iterator[Dict]:
+        """
+        Stream stored entries in time order without loading them all (e.g. for reconciliation)
+
+        Args:
+            kind: Only entries of this response kind
+            since: Unix time lower bound (inclusive)
+            until: Unix time upper bound (exclusive)
+        """
+        for row in self._scan("records", "response_id, kind, created_at, item", kind, since, until):
+            yield self._record(row)
+
+    def iter_response_records(self, response_ids: Iterable[int]) -> Iterator[Dict]:
+        """Stream the entries of the given stored responses (e.g. the responses of one run), in id order"""
+        ids = sorted(set(response_ids))
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            # SQLite limits the number of parameters per statement
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                yield from (self._record(row) for row in conn.execute(
+                    f"SELECT response_id, kind, created_at, item FROM records "
+                    f"WHERE response_id IN ({', '.join('?' * len(chunk))}) ORDER BY response_id, id", chunk
+                ))
+        finally:
+            conn.close()
+
+    def iter_responses(self, kind: Optional[str] = None, since: Optional[float] = None,
+                       until: Optional[float] = None) -> Iterator[Dict]:
+        """Stream whole stored responses in time order (same filters as iter_records)"""
+        for row in self._scan("responses", "id, kind, created_at, request, response", kind, since, until):
+            yield {"id": row[0], "kind": row[1], "created_at": row[2],
+                   "request": json.loads(row[3]) if row[3] is not None else None, "response": json.loads(row[4])}
+
+    def count(self, kind: Optional[str] = None) -> int:
+        """Number of stored responses"""
+        if kind is None:
+            return self._connection().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return self._connection().execute("SELECT COUNT(*) FROM responses WHERE kind = ?", (kind,)).fetchone()[0]
@@ -0,0 +1,125 @@
+"""
+Compiled JSON templates: parse once, render many payloads with structural sharing
+"""
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+# A JSON string value that is exactly one {{path}} placeholder
+PLACEHOLDER_PATTERN = re.compile(r'^\{\{([^}]+)\}\}$')
+
+_MISSING = object()
+
+
+def resolve_path(contexts: Tuple[Dict, ...], var_path: Tuple[str, ...]) -> Any:
+    """
+    Look up a dotted variable path in the first context that defines it
+
+    Args:
+        contexts: Dictionaries searched in order
+        var_path: Path split on dots, e.g. ("defaults", "weight")
+
+    Returns:
+        The value, or _MISSING when no context defines it
+    """
+    for context in contexts:
+        value = context
+        try:
+            for key in var_path:
+                value = value[key]
+            return value
+        except (KeyError, TypeError, IndexError):
+            continue
+    return _MISSING
+
+
+class CompiledTemplate:
+    """
+    A parsed JSON template with the location of every {{path}} placeholder recorded
+
+    render() only copies the containers on the way to a placeholder; every other
+    subtree is shared between renders (and with the template), so rendered payloads
+    must be treated as read-only. Use copy-on-write helpers such as
+    modules.bulk_labels.merge_order to derive per-order payloads.
+    """
+
+    def __init__(self, data: Any):
+        """
+        Args:
+            data: Parsed template (e.g. from json.load)
+        """
+        self.data = data
+        self.placeholders = []
+        self._plan = self._compile(data, ())
+
+    @classmethod
+    def from_string(cls, template_str: str) -> "CompiledTemplate":
+        """Compile a template from JSON text"""
+        return cls(json.loads(template_str))
+
+    @classmethod
+    def from_file(cls, template_path: str) -> "CompiledTemplate":
+        """Compile a template from a JSON file"""
+        with open(template_path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def _compile(self, node: Any, path: Tuple) -> Optional[Any]:
+        """
+        Build the render plan for a subtree
+
+        Returns:
+            None if the subtree has no placeholders, a tuple of variable keys for a
+            placeholder leaf, or a list of (key, child plan) pairs for a container
+        """
+        if isinstance(node, str):
+            match = PLACEHOLDER_PATTERN.match(node)
+            if match is None:
+                return None
+            var_path = tuple(match.group(1).strip().split('.'))
+            self.placeholders.append((path, '.'.join(var_path)))
+            return var_path
+
+        if isinstance(node, dict):
+            items = node.items()
+        elif isinstance(node, list):
+            items = enumerate(node)
+        else:
+            return None
+
+        children = []
+        for key, child in items:
+            plan = self._compile(child, path + (key,))
+            if plan is not None:
+                children.append((key, plan))
+        return children or None
+
+    def _render(self, node: Any, plan: Any, contexts: Tuple[Dict, ...]) -> Any:
+        if isinstance(plan, tuple):
+            value = resolve_path(contexts, plan)
+            # Unknown variables keep the original placeholder, like the regex substitution did
+            return node if value is _MISSING else value
+
+        copy = dict(node) if isinstance(node, dict) else list(node)
+        for key, child_plan in plan:
+            copy[key] = self._render(node[key], child_plan, contexts)
+        return copy
+
+    def render(self, *contexts: Dict) -> Any:
+        """
+        Produce a payload with placeholders replaced from the given contexts
+
+        Args:
+            *contexts: Dictionaries searched in order for each {{path}}
+                       (e.g. render({"row": row}, config))
+
+        Returns:
+            Rendered payload sharing unchanged subtrees with the template
+        """
+        if self._plan is None or not contexts:
+            return self.data
+        return self._render(self.data, self._plan, contexts)
+
+    @property
+    def variables(self) -> List[str]:
+        """Dotted variable names used by the template, in document order"""
+        return [var for _, var in self.placeholders]